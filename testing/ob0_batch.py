@@ -0,0 +1,66 @@
+#!/usr/bin/python
+
+import subprocess # Popen for running the per-file compiler
+import sys # Command line arguments and the protocol streams
+
+#######################################################################
+# Reference adapter for the supertest.py batch compilation protocol
+#
+#   python supertest.py --batch N python $PWD/ob0_batch.py COMMAND ...
+#
+# supertest.py runs the adapter once for up to N files of a directory,
+# from within that directory, with the files after COMMAND, so both
+# need paths that work from there:
+#
+#   python ob0_batch.py COMMAND ... a.ob b.ob c.ob
+#
+# The adapter runs COMMAND on each file in turn and writes the output
+# of each to its own stdout and stderr, each part started by a line
+#
+#   ==> a.ob <==
+#
+# on stdout, and on stderr too if COMMAND wrote anything there, so the
+# results are those of a per-process run.  Like head, it writes no
+# markers when given a single file, as supertest.py runs it for tests
+# that are alone in their directory too.  The files are the arguments
+# at the end that name .ob files; all before them are COMMAND.
+#######################################################################
+
+def compileFile(command, filename):
+  ## Returns (stdout, stderr) for one file
+  outputs = subprocess.Popen(command + ' ' + filename, shell=True,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+  return outputs.communicate()
+
+
+def writePart(stream, filename, text, marked):
+  ## Write text, the output of filename, ending it with a newline so
+  ## that the next marker starts a line of its own
+  if marked:
+    stream.write('==> %s <==\n' % filename)
+    if text and not text.endswith('\n'):
+      text += '\n'
+  stream.write(text)
+  stream.flush()
+
+
+def main():
+  args = sys.argv[1:]
+  first = len(args)
+  while first > 0 and args[first - 1].endswith('.ob'):
+    first -= 1
+  command = " ".join(args[:first])
+
+  filenames = args[first:]
+  marked = len(filenames) > 1
+
+  for filename in filenames:
+    stdout_output, stderr_output = compileFile(command, filename)
+
+    writePart(sys.stdout, filename, stdout_output, marked)
+    if stderr_output:
+      writePart(sys.stderr, filename, stderr_output, marked)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,62 @@
+#!/usr/bin/python
+
+import subprocess # Popen for running the per-file compiler
+import sys # Command line arguments and the protocol streams
+
+#######################################################################
+# Reference stand-in for the supertest.py compiler server protocol
+#
+#   python supertest.py --server python ob0_server.py [COMMAND ...]
+#
+# supertest.py starts the server once and writes one request per line
+# to its stdin:
+#
+#   <directory> TAB <filename> NEWLINE
+#
+# The server compiles <filename> as if it had been run from within
+# <directory>, then writes one response to its stdout:
+#
+#   <exit status> SPACE <stdout bytes> SPACE <stderr bytes> NEWLINE
+#
+# followed by exactly that many bytes of the compiler's stdout, then
+# exactly that many bytes of its stderr.  The server exits when its
+# stdin is closed.
+#
+# Given a COMMAND, each file is compiled by running COMMAND on it, so
+# the results are exactly those of a per-process run.  Without one,
+# every file is accepted with no output, which is enough to try out
+# the protocol without any real compiler.
+#######################################################################
+
+def compileFile(command, directory, filename):
+  ## Returns (exit status, stdout, stderr) for one request
+  if not command:
+    return 0, '', ''
+
+  outputs = subprocess.Popen(command + ' ' + filename, shell=True, cwd=directory,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+  stdout_output, stderr_output = outputs.communicate()
+
+  return outputs.returncode, stdout_output, stderr_output
+
+
+def main():
+  command = " ".join(sys.argv[1:])
+
+  while True:
+    request = sys.stdin.readline()
+    if not request:
+      ## supertest.py is done with us
+      break
+
+    directory, filename = request.rstrip('\n').split('\t', 1)
+    status, stdout_output, stderr_output = compileFile(command, directory, filename)
+
+    sys.stdout.write('%d %d %d\n' % (status, len(stdout_output), len(stderr_output)))
+    sys.stdout.write(stdout_output)
+    sys.stdout.write(stderr_output)
+    sys.stdout.flush()
+
+
+if __name__ == "__main__":
+  main()
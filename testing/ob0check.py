@@ -0,0 +1,908 @@
+#!/usr/bin/python
+
+import optparse # Command line options
+import os # Path methods
+import re # Tokens and the N_ prefix of test names
+import sys # Exit status
+import time # Files checked per second
+
+#######################################################################
+# Parses and checks Oberon0 programs in process, without a compiler
+#
+#   python ob0check.py [-l L3] FILE.ob ...
+#
+# prints, for each file, whether it parses and the line of the first
+# name or type error in it, if any.  Given test files, as laid out in
+# tests/<impl>/, it instead checks each one against what its place in
+# the tree says it should do:
+#  * positive/L*/*.ob must parse and check without errors
+#  * negative/parse_errors/L*/*.ob must not parse
+#  * negative/name_errors/L*/N_*.ob and negative/type_errors/L*/N_*.ob
+#    must parse, with the first error on line N
+# and prints those that don't, with the error that was found.
+#
+# The language is that of the tests, level by level as in ob0gen.py.
+# Below L5 a nested procedure may not use the variables and parameters
+# of the procedures enclosing it, nor call them.  Besides the usual
+# rules, taken from the tests of every implementation:
+#  * declarations come in the order CONST, TYPE, VAR, PROCEDURE, and
+#    names may only be used after they are declared; from L5 on, the
+#    procedures of a scope may call each other in any order
+#  * constants are INTEGER, and DIV or MOD by 0 is not a constant
+#  * = # < <= > >= compare INTEGERs only, and don't associate
+#  * array lengths are constants, not negative, and constant indexes must be
+#    within the bounds of the array
+#  * the step of FOR and the labels of CASE are constants
+#  * arrays and records are equal only when declared by the same type,
+#    can't be assigned, and are passed as VAR parameters of a named type
+#
+# check(source, level) returns None, or (kind, line, message) of the
+# first error, kind being 'parse', 'name' or 'type'.  Only the line of
+# name and type errors is checked against tests, as implementations
+# disagree on which is which, e.g. for an assignment to a constant.
+#######################################################################
+
+LEVELS = ['L1', 'L2', 'L3', 'L4', 'L5']
+
+INTEGER_MAX = 2147483647
+
+KEYWORDS = set(['ARRAY', 'BEGIN', 'BY', 'CASE', 'CONST', 'DIV', 'DO', 'ELSE', 'ELSIF', 'END', 'FOR', 'IF', 'MOD',
+                'MODULE', 'OF', 'OR', 'PROCEDURE', 'RECORD', 'THEN', 'TO', 'TYPE', 'VAR', 'WHILE'])
+
+TOKEN = re.compile(r'(\s+)|([A-Za-z][A-Za-z0-9_]*)|([0-9]+)|(\(\*)|(:=|<=|>=|\.\.|[-+*=#<>&~|.,;:()\[\]])')
+
+COMMENT = re.compile(r'\(\*|\*\)|\n')
+
+RELATIONS = set(['=', '#', '<', '<=', '>', '>='])
+
+
+class CheckError(Exception):
+
+  def __init__(self, kind, line, message):
+    Exception.__init__(self, message)
+    self.kind = kind
+    self.line = line
+    self.message = message
+
+
+def tokenize(source):
+  ## [(kind, value, line)]: kind is 'ident', 'number', a keyword or an
+  ## operator, and the list ends with ('eof', None, line)
+  tokens = []
+  line = 1
+  pos = 0
+  end = len(source)
+  match = TOKEN.match
+
+  while pos < end:
+    m = match(source, pos)
+    if not m:
+      raise CheckError('parse', line, 'unexpected character ' + repr(source[pos]))
+    pos = m.end()
+    group = m.lastindex
+
+    if group == 1:
+      line += m.group(1).count('\n')
+    elif group == 2:
+      ident = m.group(2)
+      if ident in KEYWORDS:
+        tokens.append((ident, ident, line))
+      else:
+        tokens.append(('ident', ident, line))
+    elif group == 3:
+      number = m.group(3)
+      if int(number) > INTEGER_MAX:
+        raise CheckError('parse', line, 'integer too large: ' + number)
+      tokens.append(('number', int(number), line))
+    elif group == 4:
+      pos, line = skipComment(source, pos, line)
+    else:
+      op = m.group(5)
+      tokens.append((op, op, line))
+
+  tokens.append(('eof', None, line))
+  return tokens
+
+
+def skipComment(source, pos, line):
+  ## Skip a comment, which may be nested, starting just after its (*.
+  ## Returns the position and line just after it.
+  start = line
+  depth = 1
+  for m in COMMENT.finditer(source, pos):
+    text = m.group(0)
+    if text == '\n':
+      line += 1
+    elif text == '(*':
+      depth += 1
+    else:
+      depth -= 1
+      if depth == 0:
+        return m.end(), line
+  raise CheckError('parse', start, 'comment not closed')
+
+
+#######################################################################
+# Parser
+#
+# Builds a syntax tree of tuples, each with the line it starts on last:
+#  types: ('named', name, line), ('array', length, type, line),
+#         ('record', [(names, type)], line)
+#  expressions: ('num', value, line), ('desig', name, selectors, line),
+#         ('not', e, line), ('neg', e, line), ('pos', e, line),
+#         (op, left, right, line) for the binary operators
+#  selectors: ('field', name, line), ('index', e, line)
+#  statements: ('assign', desig, e, line), ('call', desig, args, line),
+#         ('if', [(e, stmts)], else_stmts, line),
+#         ('while', e, stmts, line),
+#         ('for', name, start, stop, step, stmts, line),
+#         ('case', e, [(labels, stmts)], else_stmts, line)
+# names in declarations are (name, line).
+#######################################################################
+
+class Parser:
+
+  def __init__(self, source):
+    self.tokens = tokenize(source)
+    self.pos = 0
+
+  def peek(self):
+    return self.tokens[self.pos][0]
+
+  def line(self):
+    return self.tokens[self.pos][2]
+
+  def fail(self, expected):
+    kind, value, line = self.tokens[self.pos]
+    found = kind
+    if kind in ['ident', 'number']:
+      found = str(value)
+    elif kind == 'eof':
+      found = 'end of file'
+    raise CheckError('parse', line, 'expected ' + expected + ', found ' + found)
+
+  def accept(self, kind):
+    if self.tokens[self.pos][0] == kind:
+      self.pos += 1
+      return True
+    return False
+
+  def expect(self, kind):
+    token = self.tokens[self.pos]
+    if token[0] != kind:
+      self.fail(kind)
+    self.pos += 1
+    return token
+
+  def ident(self):
+    token = self.expect('ident')
+    return token[1], token[2]
+
+  def identList(self):
+    names = [self.ident()]
+    while self.accept(','):
+      names.append(self.ident())
+    return names
+
+  def module(self):
+    self.expect('MODULE')
+    name = self.ident()
+    self.expect(';')
+    decls = self.declarations()
+    body = []
+    if self.accept('BEGIN'):
+      body = self.statements()
+    self.expect('END')
+    end_name = self.ident()
+    self.expect('.')
+    return ('module', name, decls, body, end_name)
+
+  def declarations(self):
+    decls = {'consts': [], 'types': [], 'vars': [], 'procs': []}
+    if self.accept('CONST'):
+      while self.peek() == 'ident':
+        name = self.ident()
+        self.expect('=')
+        decls['consts'].append((name, self.expression()))
+        self.expect(';')
+    if self.accept('TYPE'):
+      while self.peek() == 'ident':
+        name = self.ident()
+        self.expect('=')
+        decls['types'].append((name, self.type()))
+        self.expect(';')
+    if self.accept('VAR'):
+      while self.peek() == 'ident':
+        names = self.identList()
+        self.expect(':')
+        decls['vars'].append((names, self.type()))
+        self.expect(';')
+    while self.peek() == 'PROCEDURE':
+      decls['procs'].append(self.procedure())
+      self.expect(';')
+    return decls
+
+  def procedure(self):
+    self.expect('PROCEDURE')
+    name = self.ident()
+    params = []
+    if self.accept('('):
+      if self.peek() != ')':
+        params.append(self.section())
+        while self.accept(';'):
+          params.append(self.section())
+      self.expect(')')
+    self.expect(';')
+    decls = self.declarations()
+    body = []
+    if self.accept('BEGIN'):
+      body = self.statements()
+    self.expect('END')
+    end_name = self.ident()
+    return ('procedure', name, params, decls, body, end_name)
+
+  def section(self):
+    ## (is_var, names, type) of formal parameters
+    is_var = self.accept('VAR')
+    names = self.identList()
+    self.expect(':')
+    return (is_var, names, self.type())
+
+  def type(self):
+    line = self.line()
+    if self.peek() == 'ident':
+      return ('named', self.ident()[0], line)
+    elif self.accept('ARRAY'):
+      length = self.expression()
+      self.expect('OF')
+      return ('array', length, self.type(), line)
+    elif self.accept('RECORD'):
+      fields = []
+      while True:
+        if self.peek() == 'ident':
+          names = self.identList()
+          self.expect(':')
+          fields.append((names, self.type()))
+        if not self.accept(';'):
+          break
+      self.expect('END')
+      return ('record', fields, line)
+    self.fail('a type')
+
+  def statements(self):
+    stmts = []
+    while True:
+      stmt = self.statement()
+      if stmt:
+        stmts.append(stmt)
+      if not self.accept(';'):
+        return stmts
+
+  def statement(self):
+    kind = self.peek()
+    line = self.line()
+
+    if kind == 'ident':
+      desig = self.designator()
+      if self.accept(':='):
+        return ('assign', desig, self.expression(), line)
+      args = None
+      if self.accept('('):
+        args = []
+        if self.peek() != ')':
+          args.append(self.expression())
+          while self.accept(','):
+            args.append(self.expression())
+        self.expect(')')
+      return ('call', desig, args, line)
+
+    elif self.accept('IF'):
+      branches = [(self.expression(), self.thenPart())]
+      else_stmts = None
+      while self.accept('ELSIF'):
+        branches.append((self.expression(), self.thenPart()))
+      if self.accept('ELSE'):
+        else_stmts = self.statements()
+      self.expect('END')
+      return ('if', branches, else_stmts, line)
+
+    elif self.accept('WHILE'):
+      cond = self.expression()
+      self.expect('DO')
+      stmts = self.statements()
+      self.expect('END')
+      return ('while', cond, stmts, line)
+
+    elif self.accept('FOR'):
+      name = self.ident()
+      self.expect(':=')
+      start = self.expression()
+      self.expect('TO')
+      stop = self.expression()
+      step = None
+      if self.accept('BY'):
+        step = self.expression()
+      self.expect('DO')
+      stmts = self.statements()
+      self.expect('END')
+      return ('for', name, start, stop, step, stmts, line)
+
+    elif self.accept('CASE'):
+      expr = self.expression()
+      self.expect('OF')
+      cases = [self.case()]
+      while self.accept('|'):
+        cases.append(self.case())
+      else_stmts = None
+      if self.accept('ELSE'):
+        else_stmts = self.statements()
+      self.expect('END')
+      return ('case', expr, cases, else_stmts, line)
+
+    elif kind in [';', 'END', 'ELSE', 'ELSIF', '|']:
+      ## The empty statement
+      return None
+
+    self.fail('a statement')
+
+  def thenPart(self):
+    self.expect('THEN')
+    return self.statements()
+
+  def case(self):
+    labels = [self.label()]
+    while self.accept(','):
+      labels.append(self.label())
+    self.expect(':')
+    return (labels, self.statements())
+
+  def label(self):
+    low = self.expression()
+    high = None
+    if self.accept('..'):
+      high = self.expression()
+    return (low, high)
+
+  def designator(self):
+    name, line = self.ident()
+    selectors = []
+    while True:
+      if self.accept('.'):
+        field, field_line = self.ident()
+        selectors.append(('field', field, field_line))
+      elif self.peek() == '[':
+        index_line = self.line()
+        self.pos += 1
+        selectors.append(('index', self.expression(), index_line))
+        self.expect(']')
+      else:
+        return ('desig', name, selectors, line)
+
+  def expression(self):
+    left = self.simpleExpression()
+    kind = self.peek()
+    if kind in RELATIONS:
+      line = self.line()
+      self.pos += 1
+      return (kind, left, self.simpleExpression(), line)
+    return left
+
+  def simpleExpression(self):
+    line = self.line()
+    if self.accept('-'):
+      left = ('neg', self.term(), line)
+    elif self.accept('+'):
+      left = ('pos', self.term(), line)
+    else:
+      left = self.term()
+    while self.peek() in ['+', '-', 'OR']:
+      kind = self.peek()
+      line = self.line()
+      self.pos += 1
+      left = (kind, left, self.term(), line)
+    return left
+
+  def term(self):
+    left = self.factor()
+    while self.peek() in ['*', 'DIV', 'MOD', '&']:
+      kind = self.peek()
+      line = self.line()
+      self.pos += 1
+      left = (kind, left, self.factor(), line)
+    return left
+
+  def factor(self):
+    kind, value, line = self.tokens[self.pos]
+    if kind == 'ident':
+      return self.designator()
+    elif kind == 'number':
+      self.pos += 1
+      return ('num', value, line)
+    elif kind == '(':
+      self.pos += 1
+      expr = self.expression()
+      self.expect(')')
+      return expr
+    elif kind == '~':
+      self.pos += 1
+      return ('not', self.factor(), line)
+    self.fail('an expression')
+
+
+#######################################################################
+# Checker
+#
+# Declarations are entered into their scope in order, and the body of a
+# procedure is checked where it is declared, so that names are only
+# known after their declaration, and the first error found is the first
+# in the file.
+#######################################################################
+
+class Type:
+
+  def __init__(self, kind, length=None, element=None, fields=None):
+    self.kind = kind # 'INTEGER', 'BOOLEAN', 'array' or 'record'
+    self.length = length
+    self.element = element
+    self.fields = fields # {name: Type}
+
+  def __repr__(self):
+    if self.kind == 'array':
+      return 'ARRAY %d OF %r' % (self.length, self.element)
+    elif self.kind == 'record':
+      return 'RECORD'
+    return self.kind
+
+INTEGER = Type('INTEGER')
+BOOLEAN = Type('BOOLEAN')
+
+
+class Symbol:
+
+  def __init__(self, kind, name, type=None, value=None, is_var=False, params=None):
+    self.kind = kind # 'const', 'type', 'var', 'param', 'proc' or 'builtin'
+    self.name = name
+    self.type = type
+    self.value = value
+    self.is_var = is_var
+    self.params = params # [(is_var, Type)] of a procedure
+
+
+class Scope:
+
+  def __init__(self, parent, proc):
+    self.parent = parent
+    self.proc = proc # The procedure's Symbol, None for the module
+    self.names = {}
+
+
+def universe():
+  scope = Scope(None, None)
+  scope.names['INTEGER'] = Symbol('type', 'INTEGER', INTEGER)
+  scope.names['BOOLEAN'] = Symbol('type', 'BOOLEAN', BOOLEAN)
+  scope.names['TRUE'] = Symbol('const', 'TRUE', BOOLEAN, 1)
+  scope.names['FALSE'] = Symbol('const', 'FALSE', BOOLEAN, 0)
+  for name in ['Read', 'Write', 'WriteLn']:
+    scope.names[name] = Symbol('builtin', name)
+  return scope
+
+UNIVERSE = universe()
+
+
+class Checker:
+
+  def __init__(self, level):
+    self.nested_access = LEVELS.index(level) >= LEVELS.index('L5')
+    self.scope = None
+
+  def nameError(self, line, message):
+    raise CheckError('name', line, message)
+
+  def typeError(self, line, message):
+    raise CheckError('type', line, message)
+
+  def declare(self, name, line, symbol):
+    if name in self.scope.names:
+      self.nameError(line, name + ' is already declared')
+    self.scope.names[name] = symbol
+
+  def lookup(self, name, line):
+    current = self.scope.proc
+    enclosing = []
+    scope = self.scope
+    while scope:
+      symbol = scope.names.get(name)
+      if symbol and self.visible(symbol, scope, current, enclosing):
+        return symbol
+      if scope.proc:
+        enclosing.append(scope.proc)
+      scope = scope.parent
+    self.nameError(line, name + ' is not declared')
+
+  def visible(self, symbol, scope, current, enclosing):
+    ## Below L5, the variables of enclosing procedures and the enclosing
+    ## procedures themselves are out of reach
+    if self.nested_access:
+      return True
+    if symbol.kind in ['var', 'param'] and scope.proc and scope is not self.scope:
+      return False
+    if symbol.kind == 'proc' and symbol is not current and symbol in enclosing:
+      return False
+    return True
+
+  def module(self, tree):
+    tag, (name, line), decls, body, (end_name, end_line) = tree
+    self.scope = Scope(UNIVERSE, None)
+    self.declarations(decls)
+    self.statements(body)
+    if end_name != name:
+      self.nameError(end_line, 'module ' + name + ' ends with ' + end_name)
+
+  def declarations(self, decls):
+    for (name, line), expr in decls['consts']:
+      t, value = self.expression(expr)
+      if value is None:
+        self.typeError(line, 'constant ' + name + ' is not constant')
+      if t is not INTEGER:
+        self.typeError(line, 'constant ' + name + ' is not an INTEGER')
+      self.declare(name, line, Symbol('const', name, t, value))
+
+    for (name, line), type_tree in decls['types']:
+      self.declare(name, line, Symbol('type', name, self.type(type_tree)))
+
+    for names, type_tree in decls['vars']:
+      t = self.type(type_tree)
+      for name, line in names:
+        self.declare(name, line, Symbol('var', name, t))
+
+    ## From L5 on, procedures may call those declared after them, as when
+    ## mutually recursive
+    if self.nested_access:
+      procs = [(self.heading(proc), proc) for proc in decls['procs']]
+      for (symbol, names), proc in procs:
+        self.procedure(symbol, names, proc)
+    else:
+      for proc in decls['procs']:
+        symbol, names = self.heading(proc)
+        self.procedure(symbol, names, proc)
+
+  def type(self, tree):
+    if tree[0] == 'named':
+      symbol = self.lookup(tree[1], tree[2])
+      if symbol.kind != 'type':
+        self.nameError(tree[2], tree[1] + ' is not a type')
+      return symbol.type
+
+    elif tree[0] == 'array':
+      t, length = self.expression(tree[1])
+      if t is not INTEGER or length is None:
+        self.typeError(tree[3], 'array length is not a constant INTEGER')
+      if length < 0:
+        self.typeError(tree[3], 'array length %d is negative' % length)
+      return Type('array', length=length, element=self.type(tree[2]))
+
+    else: # tree[0] == 'record'
+      fields = {}
+      for names, type_tree in tree[1]:
+        t = self.type(type_tree)
+        for name, line in names:
+          if name in fields:
+            self.nameError(line, 'field ' + name + ' is already declared')
+          fields[name] = t
+      return Type('record', fields=fields)
+
+  def heading(self, tree):
+    ## Declares the procedure, returning its Symbol and its parameters
+    tag, (name, line), sections, decls, body, end_name = tree
+
+    params = []
+    names = []
+    for is_var, section_names, type_tree in sections:
+      if type_tree[0] != 'named':
+        self.typeError(type_tree[-1], 'parameter type is not a type name')
+      t = self.type(type_tree)
+      if t.kind in ['array', 'record'] and not is_var:
+        self.typeError(type_tree[-1], 'structured parameter is not VAR')
+      for param_name, param_line in section_names:
+        params.append((is_var, t))
+        names.append((param_name, param_line, t, is_var))
+
+    symbol = Symbol('proc', name, params=params)
+    self.declare(name, line, symbol)
+    return symbol, names
+
+  def procedure(self, symbol, names, tree):
+    tag, (name, line), sections, decls, body, (end_name, end_line) = tree
+    self.scope = Scope(self.scope, symbol)
+    for param_name, param_line, t, is_var in names:
+      self.declare(param_name, param_line, Symbol('param', param_name, t, is_var=is_var))
+    self.declarations(decls)
+    self.statements(body)
+    self.scope = self.scope.parent
+
+    if end_name != name:
+      self.nameError(end_line, 'procedure ' + name + ' ends with ' + end_name)
+
+  def statements(self, stmts):
+    for stmt in stmts:
+      getattr(self, stmt[0] + 'Statement')(stmt)
+
+  def assignStatement(self, stmt):
+    tag, desig, expr, line = stmt
+    symbol = self.lookup(desig[1], desig[3])
+    if symbol.kind not in ['var', 'param']:
+      self.typeError(desig[3], desig[1] + ' is not a variable')
+    t = self.selectors(symbol.type, desig)
+    if t.kind in ['array', 'record']:
+      self.typeError(line, 'cannot assign to a structured variable')
+    expr_type, value = self.expression(expr)
+    if expr_type is not t:
+      self.typeError(line, 'cannot assign %r to %r' % (expr_type, t))
+
+  def callStatement(self, stmt):
+    tag, desig, args, line = stmt
+    symbol = self.lookup(desig[1], desig[3])
+    if symbol.kind not in ['proc', 'builtin'] or desig[2]:
+      self.typeError(line, desig[1] + ' is not a procedure')
+    args = args or []
+
+    if symbol.kind == 'builtin':
+      if symbol.name == 'WriteLn':
+        if args:
+          self.typeError(line, 'WriteLn takes no arguments')
+      elif len(args) != 1:
+        self.typeError(line, symbol.name + ' takes one argument')
+      elif symbol.name == 'Write':
+        if self.expression(args[0])[0] is not INTEGER:
+          self.typeError(line, 'Write takes an INTEGER')
+      elif self.variable(args[0], line) is not INTEGER:
+        self.typeError(line, 'Read takes an INTEGER variable')
+      return
+
+    if len(args) != len(symbol.params):
+      self.typeError(line, '%s takes %d arguments, not %d' % (symbol.name, len(symbol.params), len(args)))
+    for (is_var, t), arg in zip(symbol.params, args):
+      if is_var:
+        arg_type = self.variable(arg, line)
+      else:
+        arg_type = self.expression(arg)[0]
+      if arg_type is not t:
+        self.typeError(line, 'argument of %s is %r, not %r' % (symbol.name, arg_type, t))
+
+  def variable(self, expr, line):
+    ## The type of an argument for a VAR parameter, which must be a
+    ## variable
+    if expr[0] != 'desig':
+      self.typeError(line, 'VAR argument is not a variable')
+    symbol = self.lookup(expr[1], expr[3])
+    if symbol.kind not in ['var', 'param']:
+      self.typeError(line, 'VAR argument ' + expr[1] + ' is not a variable')
+    return self.selectors(symbol.type, expr)
+
+  def ifStatement(self, stmt):
+    tag, branches, else_stmts, line = stmt
+    for cond, stmts in branches:
+      self.condition(cond)
+      self.statements(stmts)
+    self.statements(else_stmts or [])
+
+  def whileStatement(self, stmt):
+    tag, cond, stmts, line = stmt
+    self.condition(cond)
+    self.statements(stmts)
+
+  def forStatement(self, stmt):
+    tag, (name, name_line), start, stop, step, stmts, line = stmt
+    symbol = self.lookup(name, name_line)
+    if symbol.kind not in ['var', 'param'] or symbol.type is not INTEGER:
+      self.typeError(name_line, name + ' is not an INTEGER variable')
+    for expr in [start, stop]:
+      if self.expression(expr)[0] is not INTEGER:
+        self.typeError(expr[-1], 'FOR limit is not an INTEGER')
+    if step:
+      t, value = self.expression(step)
+      if t is not INTEGER or value is None:
+        self.typeError(step[-1], 'FOR step is not a constant INTEGER')
+    self.statements(stmts)
+
+  def caseStatement(self, stmt):
+    tag, expr, cases, else_stmts, line = stmt
+    if self.expression(expr)[0] is not INTEGER:
+      self.typeError(expr[-1], 'CASE expression is not an INTEGER')
+    for labels, stmts in cases:
+      for label in labels:
+        for bound in label:
+          if bound:
+            t, value = self.expression(bound)
+            if t is not INTEGER or value is None:
+              self.typeError(bound[-1], 'CASE label is not a constant INTEGER')
+      self.statements(stmts)
+    self.statements(else_stmts or [])
+
+  def condition(self, expr):
+    if self.expression(expr)[0] is not BOOLEAN:
+      self.typeError(expr[-1], 'condition is not a BOOLEAN')
+
+  def selectors(self, t, desig):
+    ## The type of desig, whose name has type t
+    for selector in desig[2]:
+      if selector[0] == 'field':
+        if t.kind != 'record':
+          self.typeError(selector[2], 'field ' + selector[1] + ' of something not a record')
+        if selector[1] not in t.fields:
+          self.nameError(selector[2], 'no field ' + selector[1])
+        t = t.fields[selector[1]]
+      else: # selector[0] == 'index'
+        if t.kind != 'array':
+          self.typeError(selector[2], 'index of something not an array')
+        index_type, index = self.expression(selector[1])
+        if index_type is not INTEGER:
+          self.typeError(selector[2], 'index is not an INTEGER')
+        if index is not None and not 0 <= index < t.length:
+          self.typeError(selector[2], 'index %d out of bounds 0..%d' % (index, t.length - 1))
+        t = t.element
+    return t
+
+  def expression(self, expr):
+    ## (type, value) of expr, value being None unless it is constant
+    kind = expr[0]
+
+    if kind == 'num':
+      return INTEGER, expr[1]
+
+    elif kind == 'desig':
+      symbol = self.lookup(expr[1], expr[3])
+      if symbol.kind == 'const':
+        if expr[2]:
+          self.typeError(expr[3], 'constant ' + expr[1] + ' has no fields or elements')
+        return symbol.type, symbol.value
+      elif symbol.kind in ['var', 'param']:
+        return self.selectors(symbol.type, expr), None
+      self.typeError(expr[3], expr[1] + ' is not a value')
+
+    elif kind == 'not':
+      t, value = self.expression(expr[1])
+      if t is not BOOLEAN:
+        self.typeError(expr[2], '~ of something not a BOOLEAN')
+      if value is None:
+        return BOOLEAN, None
+      return BOOLEAN, 1 - value
+
+    elif kind in ['neg', 'pos']:
+      t, value = self.expression(expr[1])
+      if t is not INTEGER:
+        self.typeError(expr[2], 'sign of something not an INTEGER')
+      if value is None or kind == 'pos':
+        return INTEGER, value
+      return INTEGER, -value
+
+    left_type, left = self.expression(expr[1])
+    right_type, right = self.expression(expr[2])
+    line = expr[3]
+
+    if kind in ['&', 'OR']:
+      if left_type is not BOOLEAN or right_type is not BOOLEAN:
+        self.typeError(line, kind + ' of something not a BOOLEAN')
+      result = BOOLEAN
+    else:
+      if left_type is not INTEGER or right_type is not INTEGER:
+        self.typeError(line, kind + ' of something not an INTEGER')
+      result = INTEGER
+      if kind in RELATIONS:
+        result = BOOLEAN
+
+    ## DIV or MOD by 0 is left to run time, but is no constant
+    if left is None or right is None or (kind in ['DIV', 'MOD'] and right == 0):
+      return result, None
+    return result, evaluate(kind, left, right)
+
+
+def evaluate(kind, left, right):
+  ## The value of a constant binary expression
+  if kind == '+':
+    return left + right
+  elif kind == '-':
+    return left - right
+  elif kind == '*':
+    return left * right
+  elif kind == 'DIV':
+    return left // right
+  elif kind == 'MOD':
+    return left % right
+  elif kind == '&':
+    return left and right
+  elif kind == 'OR':
+    return left or right
+  return int({'=': left == right, '#': left != right, '<': left < right,
+              '<=': left <= right, '>': left > right, '>=': left >= right}[kind])
+
+
+def check(source, level='L5'):
+  ## None if source is a correct program at level, else (kind, line,
+  ## message) of its first error
+  try:
+    tree = Parser(source).module()
+    Checker(level).module(tree)
+  except CheckError, e:
+    return e.kind, e.line, e.message
+  return None
+
+
+def checkFile(path, level=None):
+  ## check the file at path, at the level of its directory by default
+  if not level:
+    level = levelOf(path) or 'L5'
+  f = open(path)
+  try:
+    return check(f.read(), level)
+  finally:
+    f.close()
+
+
+def levelOf(path):
+  ## L1 ... L5 from a test's directory, or None
+  m = re.search(r'(?:^|/)(L[1-5])/[^/]*$', path.replace(os.sep, '/'))
+  return m and m.group(1)
+
+
+def expectation(path):
+  ## What a test in tests/<impl>/ should give: None for a positive test,
+  ## ('parse', None) or (category, N) from an N_ prefix, or False for a
+  ## file that is not a test
+  parts = path.replace(os.sep, '/').split('/')
+  if 'positive' in parts:
+    return None
+  for category in ['parse', 'name', 'type']:
+    if category + '_errors' in parts:
+      m = re.match(r'(\d+)_', os.path.basename(path))
+      if category == 'parse':
+        return ('parse', None)
+      return (category, m and int(m.group(1)))
+  return False
+
+
+def agrees(expected, found):
+  ## Whether what check found is what the test expects
+  if expected is None:
+    return found is None
+  elif expected[0] == 'parse':
+    return found is not None and found[0] == 'parse'
+  return found is not None and found[0] != 'parse' and found[1] == expected[1]
+
+
+def main():
+  parser = optparse.OptionParser(usage='%prog [options] FILE.ob ...')
+  parser.add_option('-l', '--level', choices=LEVELS, help='language level, from the directory by default')
+  parser.add_option('-q', '--quiet', action='store_true', help='only show files that disagree with their tests')
+  options, args = parser.parse_args()
+
+  if not args:
+    parser.error('no files given')
+
+  start = time.time()
+  disagreements = 0
+  for path in args:
+    found = checkFile(path, options.level)
+    expected = expectation(path)
+
+    if expected is not False and not agrees(expected, found):
+      disagreements += 1
+      status = 'DISAGREES'
+    elif options.quiet:
+      continue
+    else:
+      status = 'ok'
+
+    if found:
+      print '%s\t%s:%d: %s error: %s' % (status, path, found[1], found[0], found[2])
+    else:
+      print '%s\t%s: no errors' % (status, path)
+
+  elapsed = time.time() - start
+  print '%d files in %.3fs, %d disagree with their tests' % (len(args), elapsed, disagreements)
+  if disagreements:
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()
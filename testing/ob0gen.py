@@ -0,0 +1,833 @@
+#!/usr/bin/python
+
+import optparse # Command line options
+import os # Path methods
+import random # Choices of the generator
+import re # Tokens of mutated programs
+
+#######################################################################
+# Generates valid Oberon0 programs of a given language level and size
+#
+#   python ob0gen.py -l L4 -s 200 -o ../tests/gen/positive/L4/Big.ob
+#
+# writes Big.ob, and for L3 and up, where programs can Read and Write,
+# Big.stdin and Big.expected too.  The size of a program is set by:
+#  * decls: variables and constants declared in each scope
+#  * depth: how deeply procedures are nested (L3 and up)
+#  * procs: how many procedures are declared at the top level
+#  * statements: statements in the body of the module and of each
+#    procedure, not counting those nested in compound statements
+#  * type_depth: how deeply array and record types are nested (L4 and up)
+#
+# Programs are built as a syntax tree, printed, and run by a small
+# interpreter to find their output.  Every variable is initialised
+# before it is used, every loop is bounded, each procedure is called
+# once by the procedure (or module) that declares it, and integers stay
+# between 0 and MODULUS * MODULUS * 3, so the output is the same
+# whatever correct compiler and C compiler are used.
+#
+# Levels add, as in the LDTA tool challenge:
+#  L1: constants, types, variables, expressions, IF and WHILE
+#  L2: FOR and CASE
+#  L3: procedures, Read, Write and WriteLn
+#  L4: arrays and records
+#  L5: nested procedures using the variables of enclosing procedures
+#
+# mutate(source, seed) changes a few tokens or lines of a program, most
+# often making it one that should not compile, for negative tests.
+#######################################################################
+
+LEVELS = ['L1', 'L2', 'L3', 'L4', 'L5']
+
+## Integer variables are kept below MODULUS
+MODULUS = 9973
+
+## Iterations of a loop, and nesting of compound statements
+MAX_LOOP = 4
+MAX_NEST = 2
+
+
+class Scope:
+  ## What the generator knows of a module or procedure being generated
+
+  def __init__(self, name, parent, level):
+    self.name = name
+    self.parent = parent
+    self.level = level
+    self.consts = [] # [(name, value)]
+    self.types = [] # [(name, type)]
+    self.vars = [] # [(name, type)]
+    self.params = [] # [(name, type, is_var)]
+    self.procs = [] # [Procedure]
+    self.counters = 0 # Loop counters declared so far
+    self.active = [] # Loop counters of the loops being generated
+    self.usable = {} # See Generator.variables
+
+  def counter(self, nest):
+    ## The loop counter for loops nested nest deep in this scope
+    name = self.name + '_i' + str(nest)
+    while self.counters <= nest:
+      self.vars.append((self.name + '_i' + str(self.counters), INTEGER))
+      self.counters += 1
+    return name
+
+  def constants(self):
+    ## Names of the constants that may be used here
+    if 'constants' not in self.usable:
+      self.usable['constants'] = [name for s in self.visible() for (name, value) in s.consts]
+    return self.usable['constants']
+
+  def visible(self):
+    ## Scopes whose variables may be used here: this one, the enclosing
+    ## procedures in L5, and the module
+    scopes = [self]
+    scope = self.parent
+    while scope:
+      if scope.parent is None or self.level >= 5:
+        scopes.append(scope)
+      scope = scope.parent
+    return scopes
+
+
+class Procedure:
+
+  def __init__(self, scope):
+    self.scope = scope
+    self.body = []
+
+
+INTEGER = ('INTEGER',)
+BOOLEAN = ('BOOLEAN',)
+
+
+#######################################################################
+# Printing
+#######################################################################
+
+def typeText(t):
+  if t[0] == 'named':
+    return t[1]
+  elif t[0] == 'array':
+    return 'ARRAY ' + t[1] + ' OF ' + typeText(t[3])
+  elif t[0] == 'record':
+    return 'RECORD ' + '; '.join([f + ': ' + typeText(ft) for (f, ft) in t[1]]) + ' END'
+  else:
+    return t[0]
+
+
+def exprText(e):
+  if e[0] == 'num':
+    return str(e[1])
+  elif e[0] in ['true', 'false']:
+    return e[0].upper()
+  elif e[0] == 'name':
+    return e[1]
+  elif e[0] == 'desig':
+    return desigText(e)
+  elif e[0] == 'not':
+    return '(~' + exprText(e[1]) + ')'
+  else: # binary
+    return '(' + exprText(e[2]) + ' ' + e[1] + ' ' + exprText(e[3]) + ')'
+
+
+def desigText(d):
+  text = d[1]
+  for selector in d[2]:
+    if selector[0] == 'field':
+      text += '.' + selector[1]
+    else:
+      text += '[' + exprText(selector[1]) + ']'
+  return text
+
+
+def stmtsText(stmts, indent):
+  return ';\n'.join([stmtText(s, indent) for s in stmts])
+
+
+def stmtText(s, indent):
+  pad = '  ' * indent
+  if s[0] == 'assign':
+    return pad + desigText(s[1]) + ' := ' + exprText(s[2])
+  elif s[0] == 'write':
+    return pad + 'Write(' + exprText(s[1]) + ')'
+  elif s[0] == 'writeln':
+    return pad + 'WriteLn'
+  elif s[0] == 'read':
+    return pad + 'Read(' + desigText(s[1]) + ')'
+  elif s[0] == 'call':
+    return pad + s[1].scope.name + '(' + ', '.join([exprText(a) for a in s[2]]) + ')'
+  elif s[0] == 'if':
+    text = ''
+    for i in range(len(s[1])):
+      cond, body = s[1][i]
+      text += pad + (i and 'ELSIF ' or 'IF ') + exprText(cond) + ' THEN\n' + stmtsText(body, indent + 1) + '\n'
+    if s[2]:
+      text += pad + 'ELSE\n' + stmtsText(s[2], indent + 1) + '\n'
+    return text + pad + 'END'
+  elif s[0] == 'while':
+    return pad + 'WHILE ' + exprText(s[1]) + ' DO\n' + stmtsText(s[2], indent + 1) + '\n' + pad + 'END'
+  elif s[0] == 'for':
+    by = ''
+    if s[4] != 1:
+      by = ' BY ' + str(s[4])
+    return (pad + 'FOR ' + s[1] + ' := ' + exprText(s[2]) + ' TO ' + exprText(s[3]) + by + ' DO\n'
+            + stmtsText(s[5], indent + 1) + '\n' + pad + 'END')
+  else: # case
+    cases = []
+    for labels, body in s[2]:
+      label_text = ', '.join([lo == hi and str(lo) or str(lo) + '..' + str(hi) for (lo, hi) in labels])
+      cases.append(label_text + ':\n' + stmtsText(body, indent + 2))
+    text = pad + 'CASE ' + exprText(s[1]) + ' OF\n' + pad + '  ' + ('\n' + pad + '| ').join(cases) + '\n'
+    return text + pad + 'END'
+
+
+def declarationsText(scope, indent):
+  pad = '  ' * indent
+  text = ''
+  if scope.consts:
+    text += pad + 'CONST\n' + ''.join([pad + '  ' + name + ' = ' + str(value) + ';\n' for (name, value) in scope.consts])
+  if scope.types:
+    text += pad + 'TYPE\n' + ''.join([pad + '  ' + name + ' = ' + typeText(t) + ';\n' for (name, t) in scope.types])
+  if scope.vars:
+    text += pad + 'VAR\n' + ''.join([pad + '  ' + name + ': ' + typeText(t) + ';\n' for (name, t) in scope.vars])
+  for proc in scope.procs:
+    text += procedureText(proc, indent) + ';\n'
+  return text
+
+
+def procedureText(proc, indent):
+  pad = '  ' * indent
+  scope = proc.scope
+  params = ['%s%s: %s' % (is_var and 'VAR ' or '', name, typeText(t)) for (name, t, is_var) in scope.params]
+
+  text = '\n' + pad + 'PROCEDURE ' + scope.name + '(' + '; '.join(params) + ');\n'
+  text += declarationsText(scope, indent + 1)
+  text += pad + 'BEGIN\n' + stmtsText(proc.body, indent + 1) + '\n'
+  return text + pad + 'END ' + scope.name
+
+
+#######################################################################
+# Generation
+#######################################################################
+
+class Generator:
+
+  def __init__(self, level, decls, depth, procs, statements, type_depth, seed):
+    self.level = LEVELS.index(level) + 1
+    self.decls = decls
+    self.depth = depth
+    self.procs = procs
+    self.statements = statements
+    self.type_depth = type_depth
+    self.random = random.Random(seed)
+    self.stdin = []
+
+  ## Types
+
+  def structure(self, t):
+    ## The array or record type behind a named type
+    while t[0] == 'named':
+      t = t[2]
+    return t
+
+  def isInteger(self, t):
+    return self.structure(t) == INTEGER
+
+  def declareTypes(self, scope):
+    if self.level < 4:
+      ## TYPE declarations are there from L1, as other names for INTEGER
+      name = scope.name + '_T0'
+      scope.types.append((name, INTEGER))
+      return
+
+    ## A chain of nested array and record types, each a step deeper
+    inner = INTEGER
+    for d in range(max(1, self.type_depth)):
+      name = scope.name + '_T' + str(d)
+      length = self.random.randint(2, 4)
+      if d % 2 == 0:
+        length_name = scope.name + '_n' + str(d)
+        scope.consts.append((length_name, length))
+        t = ('array', length_name, length, inner)
+      else:
+        fields = [(name.lower() + '_f0', INTEGER), (name.lower() + '_f1', inner)]
+        t = ('record', fields)
+      scope.types.append((name, t))
+      inner = ('named', name, t)
+
+  ## Designators
+
+  def variables(self, scope, writable, kind='all'):
+    ## (name, type) of the variables and parameters usable in scope, of
+    ## a kind: 'all', 'int' (not BOOLEAN), 'bool' or 'scalar' (INTEGER).
+    ## The declarations of a scope and those around it are complete
+    ## before its statements are generated, so each list is only worked
+    ## out once for each set of loop counters in use
+    key = (writable or tuple(scope.active), kind)
+    if key not in scope.usable:
+      found = []
+      for s in scope.visible():
+        for name, t in s.vars:
+          if name.find('_i') < 0 or (not writable and name in scope.active):
+            found.append((name, t))
+        for name, t, is_var in s.params:
+          found.append((name, t))
+      if kind == 'int':
+        found = [(name, t) for (name, t) in found if t != BOOLEAN]
+      elif kind == 'bool':
+        found = [(name, t) for (name, t) in found if t == BOOLEAN]
+      elif kind == 'scalar':
+        found = [(name, t) for (name, t) in found if t == INTEGER]
+      scope.usable[key] = found
+    return scope.usable[key]
+
+  def intDesignator(self, scope, writable):
+    ## A designator of an INTEGER variable, or of an INTEGER in an array
+    ## or record
+    candidates = self.variables(scope, writable, 'int')
+    if not candidates:
+      return None
+    name, t = self.random.choice(candidates)
+    selectors = []
+    t = self.structure(t)
+    while t != INTEGER:
+      if t[0] == 'array':
+        selectors.append(('index', self.indexExpr(scope, t[2])))
+        t = self.structure(t[3])
+      else:
+        field, t = self.random.choice(t[1])
+        selectors.append(('field', field))
+        t = self.structure(t)
+    return ('desig', name, selectors)
+
+  def boolDesignator(self, scope):
+    candidates = self.variables(scope, True, 'bool')
+    if not candidates:
+      return None
+    return ('desig', self.random.choice(candidates)[0], [])
+
+  ## Expressions
+
+  def indexExpr(self, scope, length):
+    ## An index that is always in 0 .. length - 1
+    scalars = self.variables(scope, False, 'scalar')
+    if scalars and self.random.random() < 0.5:
+      return ('op', 'MOD', ('name', self.random.choice(scalars)[0]), ('num', length))
+    return ('num', self.random.randint(0, length - 1))
+
+  def atom(self, scope):
+    ## An INTEGER below MODULUS
+    r = self.random.random()
+    consts = scope.constants()
+    if r < 0.2 or not self.variables(scope, False):
+      return ('num', self.random.randint(0, 99))
+    elif r < 0.3 and consts:
+      return ('name', self.random.choice(consts))
+    elif r < 0.4:
+      return ('op', self.random.choice(['DIV', 'MOD']), self.atom(scope), ('num', self.random.randint(1, 9)))
+    else:
+      return self.intDesignator(scope, False) or ('num', 1)
+
+  def intExpr(self, scope):
+    ## Up to three terms of up to two atoms: below 3 * MODULUS * MODULUS
+    terms = []
+    for i in range(self.random.randint(1, 3)):
+      term = self.atom(scope)
+      if self.random.random() < 0.4:
+        term = ('op', '*', term, self.atom(scope))
+      terms.append(term)
+    e = terms[0]
+    for term in terms[1:]:
+      e = ('op', '+', e, term)
+    return e
+
+  def boolExpr(self, scope, nest=0):
+    r = self.random.random()
+    if nest < 2 and r < 0.3:
+      return ('op', self.random.choice(['&', 'OR']), self.boolExpr(scope, nest + 1), self.boolExpr(scope, nest + 1))
+    elif nest < 2 and r < 0.4:
+      return ('not', self.boolExpr(scope, nest + 1))
+    elif r < 0.5:
+      return self.boolDesignator(scope) or ('true',)
+    else:
+      return ('op', self.random.choice(['=', '#', '<', '<=', '>', '>=']), self.intExpr(scope), self.intExpr(scope))
+
+  ## Statements
+
+  def assign(self, scope):
+    target = self.intDesignator(scope, True)
+    if target and self.random.random() < 0.8:
+      return ('assign', target, ('op', 'MOD', self.intExpr(scope), ('num', MODULUS)))
+    target = self.boolDesignator(scope)
+    if target:
+      return ('assign', target, self.boolExpr(scope))
+    return ('assign', self.intDesignator(scope, True), ('op', 'MOD', self.intExpr(scope), ('num', MODULUS)))
+
+  def body(self, scope, nest, count):
+    return [self.statement(scope, nest) for i in range(count)]
+
+  def statement(self, scope, nest):
+    choices = ['assign'] * 4
+    if self.level >= 3:
+      choices.extend(['write'] * 2)
+    if nest < MAX_NEST:
+      choices.extend(['if', 'if', 'while'])
+      if self.level >= 2:
+        choices.extend(['for', 'case'])
+    choice = self.random.choice(choices)
+
+    if choice == 'assign':
+      return self.assign(scope)
+
+    elif choice == 'write':
+      return ('write', self.intExpr(scope))
+
+    elif choice == 'if':
+      branches = [(self.boolExpr(scope), self.body(scope, nest + 1, self.random.randint(1, 3)))
+                  for i in range(self.random.randint(1, 3))]
+      otherwise = []
+      if self.random.random() < 0.5:
+        otherwise = self.body(scope, nest + 1, self.random.randint(1, 3))
+      return ('if', branches, otherwise)
+
+    elif choice == 'while':
+      counter = scope.counter(nest)
+      scope.active.append(counter)
+      body = self.body(scope, nest + 1, self.random.randint(1, 3))
+      scope.active.remove(counter)
+      body.append(('assign', ('desig', counter, []), ('op', '+', ('name', counter), ('num', 1))))
+      return ('block', [('assign', ('desig', counter, []), ('num', 0)),
+                        ('while', ('op', '<', ('name', counter), ('num', self.random.randint(1, MAX_LOOP))), body)])
+
+    elif choice == 'for':
+      counter = scope.counter(nest)
+      scope.active.append(counter)
+      body = self.body(scope, nest + 1, self.random.randint(1, 3))
+      scope.active.remove(counter)
+      by = self.random.choice([1, 1, 2])
+      return ('for', counter, ('num', 0), ('num', self.random.randint(0, MAX_LOOP)), by, body)
+
+    else: # case, with labels covering 0 .. 4 so that one always matches
+      labels = [[(0, 0)], [(1, 2)], [(3, 3), (4, 4)]]
+      if self.random.random() < 0.5:
+        labels = [[(0, 1), (2, 2)], [(3, 4)]]
+      cases = [(l, self.body(scope, nest + 1, self.random.randint(1, 2))) for l in labels]
+      return ('case', ('op', 'MOD', self.intExpr(scope), ('num', 5)), cases)
+
+  def initialise(self, scope, desig, t, nest):
+    ## Statements giving every INTEGER and BOOLEAN in desig a value
+    t = self.structure(t)
+    if t == INTEGER:
+      return [('assign', desig, ('num', self.random.randint(0, 99)))]
+    elif t == BOOLEAN:
+      return [('assign', desig, ('true',))]
+    elif t[0] == 'record':
+      stmts = []
+      for field, field_type in t[1]:
+        stmts.extend(self.initialise(scope, ('desig', desig[1], desig[2] + [('field', field)]), field_type, nest))
+      return stmts
+    else: # array
+      counter = scope.counter(nest)
+      element = ('desig', desig[1], desig[2] + [('index', ('name', counter))])
+      body = self.initialise(scope, element, t[3], nest + 1)
+      body.append(('assign', ('desig', counter, []), ('op', '+', ('name', counter), ('num', 1))))
+      return [('assign', ('desig', counter, []), ('num', 0)),
+              ('while', ('op', '<', ('name', counter), ('num', t[2])), body)]
+
+  ## Scopes
+
+  def declare(self, scope):
+    ## Constants, types and variables of a scope
+    for i in range(max(1, self.decls // 4)):
+      scope.consts.append((scope.name + '_k' + str(i), self.random.randint(0, 99)))
+    self.declareTypes(scope)
+
+    for i in range(max(1, self.decls)):
+      name = scope.name + '_v' + str(i)
+      r = self.random.random()
+      if r < 0.2 and i > 0:
+        ## The first is never BOOLEAN, so procedures can be called with
+        ## an INTEGER variable for their VAR parameter
+        scope.vars.append((name, BOOLEAN))
+      elif r < 0.4 and self.level >= 4:
+        name_t = self.random.choice(scope.types)
+        scope.vars.append((name, ('named', name_t[0], name_t[1])))
+      elif r < 0.5:
+        name_t = scope.types[0]
+        if self.level < 4:
+          scope.vars.append((name, ('named', name_t[0], INTEGER)))
+        else:
+          scope.vars.append((name, INTEGER))
+      else:
+        scope.vars.append((name, INTEGER))
+
+    if scope.parent is None and self.level >= 4:
+      ## One variable of each structured type, to pass as VAR parameters
+      for i in range(len(scope.types)):
+        name_t = scope.types[i]
+        scope.vars.append((scope.name + '_s' + str(i), ('named', name_t[0], name_t[1])))
+
+  def procedure(self, name, parent, depth):
+    scope = Scope(name, parent, self.level)
+    proc = Procedure(scope)
+
+    scope.params.append((name + '_a0', INTEGER, False))
+    scope.params.append((name + '_a1', INTEGER, True))
+    if self.level >= 4 and parent.types and self.random.random() < 0.5:
+      ## A structured VAR parameter of a type from the module
+      module = parent
+      while module.parent:
+        module = module.parent
+      name_t = self.random.choice(module.types)
+      if name_t[1] != INTEGER:
+        scope.params.append((name + '_a2', ('named', name_t[0], name_t[1]), True))
+
+    self.declare(scope)
+    if depth > 1:
+      scope.procs.append(self.procedure(name + '_' + str(depth), scope, depth - 1))
+    proc.body = self.scopeBody(scope, [])
+    return proc
+
+  def scopeBody(self, scope, prologue):
+    body = []
+    for name, t in scope.vars:
+      if name.find('_i') < 0:
+        body.extend(self.initialise(scope, ('desig', name, []), t, 0))
+    body.extend(prologue)
+
+    stmts = self.body(scope, 0, self.statements)
+
+    ## Each procedure declared here is called once, from somewhere in
+    ## the top level of the body
+    for proc in scope.procs:
+      args = [('op', 'MOD', self.intExpr(scope), ('num', MODULUS)), self.intDesignator(scope, True)]
+      for name, t, is_var in proc.scope.params[2:]:
+        args.append(('desig', self.structuredArgument(scope, t), []))
+      stmts.insert(self.random.randint(0, len(stmts)), ('call', proc, args))
+
+    body.extend(stmts)
+
+    ## Show the results of the body
+    if self.level >= 3:
+      for name, t in scope.vars:
+        if t == INTEGER and name.find('_i') < 0:
+          body.append(('write', ('name', name)))
+      body.append(('writeln',))
+
+    return self.flatten(body)
+
+  def structuredArgument(self, scope, t):
+    ## A variable of type t; the module always has one
+    for name, var_t in self.variables(scope, True):
+      if var_t[0] == 'named' and var_t[1] == t[1]:
+        return name
+    return None
+
+  def flatten(self, stmts):
+    ## Blocks are only a convenience of the generator
+    flat = []
+    for s in stmts:
+      if s[0] == 'block':
+        flat.extend(self.flatten(s[1]))
+      elif s[0] == 'if':
+        flat.append(('if', [(c, self.flatten(b)) for (c, b) in s[1]], self.flatten(s[2])))
+      elif s[0] == 'while':
+        flat.append(('while', s[1], self.flatten(s[2])))
+      elif s[0] == 'for':
+        flat.append(s[:5] + (self.flatten(s[5]),))
+      elif s[0] == 'case':
+        flat.append(('case', s[1], [(l, self.flatten(b)) for (l, b) in s[2]]))
+      else:
+        flat.append(s)
+    return flat
+
+  def module(self, name):
+    scope = Scope(name.lower(), None, self.level)
+    self.declare(scope)
+
+    if self.level >= 3:
+      for i in range(self.procs):
+        scope.procs.append(self.procedure(scope.name + '_p' + str(i), scope, self.depth))
+
+    ## Some of the module's INTEGER variables come from stdin
+    reads = []
+    if self.level >= 3:
+      for var_name, t in scope.vars:
+        if t == INTEGER and self.random.random() < 0.5:
+          reads.append(('read', ('desig', var_name, [])))
+          self.stdin.append(self.random.randint(0, MODULUS - 1))
+
+    body = self.scopeBody(scope, reads)
+
+    return scope, body
+
+
+#######################################################################
+# Interpreter, to find the output of a generated program
+#######################################################################
+
+class Interpreter:
+
+  def __init__(self, stdin):
+    self.stdin = list(stdin)
+    self.output = []
+    self.frames = []
+
+  def new(self, t):
+    ## Storage for a variable of type t
+    while t[0] == 'named':
+      t = t[2]
+    if t[0] == 'array':
+      return [self.new(t[3]) for i in range(t[2])]
+    elif t[0] == 'record':
+      return dict([(field, self.new(field_type)) for (field, field_type) in t[1]])
+    else:
+      return [0]
+
+  def lookup(self, name):
+    ## Names are unique, so the innermost frame that has one is its scope
+    for frame in reversed(self.frames):
+      if name in frame:
+        return frame[name]
+    raise KeyError(name)
+
+  def storage(self, d):
+    value = self.lookup(d[1])
+    for selector in d[2]:
+      if selector[0] == 'field':
+        value = value[selector[1]]
+      else:
+        value = value[self.eval(selector[1])]
+    return value
+
+  def eval(self, e):
+    if e[0] == 'num':
+      return e[1]
+    elif e[0] == 'true':
+      return True
+    elif e[0] == 'false':
+      return False
+    elif e[0] == 'name':
+      return self.lookup(e[1])[0]
+    elif e[0] == 'desig':
+      return self.storage(e)[0]
+    elif e[0] == 'not':
+      return not self.eval(e[1])
+
+    op = e[1]
+    if op == '&':
+      return self.eval(e[2]) and self.eval(e[3])
+    elif op == 'OR':
+      return self.eval(e[2]) or self.eval(e[3])
+
+    a = self.eval(e[2])
+    b = self.eval(e[3])
+    if op == '+': return a + b
+    elif op == '*': return a * b
+    elif op == 'DIV': return a // b
+    elif op == 'MOD': return a % b
+    elif op == '=': return a == b
+    elif op == '#': return a != b
+    elif op == '<': return a < b
+    elif op == '<=': return a <= b
+    elif op == '>': return a > b
+    else: return a >= b
+
+  def run(self, stmts):
+    for s in stmts:
+      self.execute(s)
+
+  def execute(self, s):
+    if s[0] == 'assign':
+      self.storage(s[1])[0] = self.eval(s[2])
+    elif s[0] == 'read':
+      self.storage(s[1])[0] = self.stdin.pop(0)
+    elif s[0] == 'write':
+      self.output.append(' %d' % self.eval(s[1]))
+    elif s[0] == 'writeln':
+      self.output.append('\n')
+    elif s[0] == 'if':
+      for cond, body in s[1]:
+        if self.eval(cond):
+          self.run(body)
+          return
+      self.run(s[2])
+    elif s[0] == 'while':
+      while self.eval(s[1]):
+        self.run(s[2])
+    elif s[0] == 'for':
+      counter = self.lookup(s[1])
+      counter[0] = self.eval(s[2])
+      hi = self.eval(s[3])
+      while counter[0] <= hi:
+        self.run(s[5])
+        counter[0] += s[4]
+    elif s[0] == 'case':
+      value = self.eval(s[1])
+      for labels, body in s[2]:
+        for lo, hi in labels:
+          if lo <= value <= hi:
+            self.run(body)
+            return
+    else: # call
+      self.call(s[1], s[2])
+
+  def call(self, proc, args):
+    scope = proc.scope
+    frame = {}
+    for (name, t, is_var), arg in zip(scope.params, args):
+      if is_var:
+        frame[name] = self.storage(arg)
+      else:
+        frame[name] = [self.eval(arg)]
+    self.declare(scope, frame)
+
+    self.frames.append(frame)
+    self.run(proc.body)
+    self.frames.pop()
+
+  def declare(self, scope, frame):
+    for name, value in scope.consts:
+      frame[name] = [value]
+    for name, t in scope.vars:
+      frame[name] = self.new(t)
+
+
+#######################################################################
+# Mutation
+#
+# A mutant is the program with one or two edits: a token deleted,
+# repeated, or replaced by another of the same sort or by a name that is
+# not declared, or a line deleted or repeated, which takes away or
+# repeats declarations.  Which error, if any, it then has is left to
+# ob0check.py.
+#######################################################################
+
+MUTATION_TOKEN = re.compile(r'[A-Za-z][A-Za-z0-9_]*|[0-9]+|:=|<=|>=|\.\.|[-+*=#<>&~|.,;:()\[\]]')
+
+KEYWORDS = ['ARRAY', 'BEGIN', 'BY', 'CASE', 'CONST', 'DIV', 'DO', 'ELSE', 'ELSIF', 'END', 'FOR', 'IF', 'MOD',
+            'MODULE', 'OF', 'OR', 'PROCEDURE', 'RECORD', 'THEN', 'TO', 'TYPE', 'VAR', 'WHILE']
+
+OPERATORS = ['+', '-', '*', 'DIV', 'MOD', '&', 'OR', '~', '=', '#', '<', '<=', '>', '>=', ':=', ':', ';', ',',
+             '.', '..', '(', ')', '[', ']']
+
+
+def mutateToken(text, names, random):
+  ## What replaces the token text
+  r = random.random()
+  if r < 0.1:
+    return ''
+  elif r < 0.15:
+    return text + ' ' + text
+  elif text in KEYWORDS:
+    return random.choice(KEYWORDS)
+  elif text[0].isalpha():
+    return random.choice(['undeclared', 'TRUE', 'FALSE', 'INTEGER', '0', random.choice(names)])
+  elif text[0].isdigit():
+    return random.choice(['TRUE', '0', '-1', '99999999999', random.choice(names)])
+  else:
+    return random.choice(OPERATORS)
+
+
+def mutateLine(lines, random):
+  ## lines with one deleted or repeated
+  i = random.randint(1, len(lines) - 2)
+  if random.random() < 0.5:
+    return lines[:i] + lines[i + 1:]
+  return lines[:i + 1] + lines[i:]
+
+
+#######################################################################
+# Entry points
+#######################################################################
+
+def generate(level, decls=4, depth=1, procs=2, statements=8, type_depth=1, seed=0, name='Gen'):
+  ## Returns (source, stdin, expected) of a new program.  stdin and
+  ## expected are None below L3, where programs can't Read or Write.
+  generator = Generator(level, decls, depth, procs, statements, type_depth, seed)
+  scope, body = generator.module(name)
+
+  source = 'MODULE ' + name + ';\n\n' + declarationsText(scope, 1)
+  source += '\nBEGIN\n' + stmtsText(body, 1) + '\nEND ' + name + '.\n'
+
+  if generator.level < 3:
+    return source, None, None
+
+  interpreter = Interpreter(generator.stdin)
+  frame = {}
+  interpreter.declare(scope, frame)
+  interpreter.frames.append(frame)
+  interpreter.run(body)
+
+  stdin = ''.join(['%d\n' % value for value in generator.stdin])
+  return source, stdin, ''.join(interpreter.output)
+
+
+def mutate(source, seed=0):
+  ## Returns source with one or two random edits, see Mutation
+  random_ = random.Random(seed)
+  for edit in range(random_.choice([1, 1, 2])):
+    lines = source.split('\n')
+    if random_.random() < 0.2 and len(lines) > 2:
+      source = '\n'.join(mutateLine(lines, random_))
+      continue
+
+    ## Not the MODULE at the start
+    tokens = [(m.start(), m.end()) for m in MUTATION_TOKEN.finditer(source)][2:]
+    names = [source[start:end] for (start, end) in tokens if source[start].isalpha()] or ['undeclared']
+    start, end = random_.choice(tokens)
+    source = source[:start] + mutateToken(source[start:end], names, random_) + source[end:]
+
+  return source
+
+
+def writeProgram(path, level, **knobs):
+  ## Write a program to path, and its .stdin and .expected next to it.
+  ## Returns the paths written.
+  name = os.path.splitext(os.path.basename(path))[0]
+  source, stdin, expected = generate(level, name=moduleName(name), **knobs)
+
+  written = []
+  base = os.path.splitext(path)[0]
+  for text, file_path in [(source, path), (stdin, base + '.stdin'), (expected, base + '.expected')]:
+    if text is not None and (text or file_path == path):
+      f = open(file_path, 'w')
+      try:
+        f.write(text)
+      finally:
+        f.close()
+      written.append(file_path)
+  return written
+
+
+def moduleName(name):
+  ## An Oberon0 identifier made from a file name
+  ident = ''.join([c for c in name if c.isalnum()])
+  if not ident or not ident[0].isalpha():
+    ident = 'M' + ident
+  return ident
+
+
+def main():
+  parser = optparse.OptionParser(usage='%prog [options] -o FILE.ob')
+  parser.add_option('-l', '--level', default='L4', choices=LEVELS, help='language level, L1 to L5')
+  parser.add_option('-d', '--decls', type='int', default=4, help='declarations in each scope')
+  parser.add_option('-n', '--depth', type='int', default=1, help='nesting depth of procedures')
+  parser.add_option('-p', '--procs', type='int', default=2, help='procedures at the top level')
+  parser.add_option('-s', '--statements', type='int', default=8, help='statements in each body')
+  parser.add_option('-t', '--type-depth', type='int', default=1, help='nesting depth of array and record types')
+  parser.add_option('-r', '--seed', type='int', default=0, help='seed of the generator')
+  parser.add_option('-o', '--output', help='the .ob file to write')
+  options, args = parser.parse_args()
+
+  if not options.output:
+    parser.error('no output file given')
+
+  for path in writeProgram(options.output, options.level, decls=options.decls, depth=options.depth,
+                           procs=options.procs, statements=options.statements,
+                           type_depth=options.type_depth, seed=options.seed):
+    print path
+
+
+if __name__ == "__main__":
+  main()
@@ -1,18 +1,103 @@
 #!/usr/bin/python
 
+import atexit # Shut down the compiler server
+import cPickle # Store cached results
+import cStringIO # Split server responses into lines
+import ctypes # inotify for --watch
+import ctypes.util # Find libc for inotify
+import errno # Retry os.wait4 when interrupted
+import fcntl # Keep copied executables from children
+import distutils.spawn # Find the compiler executable on the PATH
 import filecmp # Compare *_lifted.ob with *_lifted_lifted.ob
 import glob # Find *.ob files within assorted file structures
+import hashlib # Key cached results on the content of their inputs
+import itertools # Lazily run tests when not running in parallel
+import json # Test manifest
+import math # Standard errors of --perf-baseline
+import multiprocessing # Pool for running tests in parallel
+import ob0check # Check tests without a compiler, see --oracle
+import ob0gen # Generated programs for --scale
 import os # Path methods
+import Queue # Connect the stages of the pipeline
+import random # Inputs of --runtime-bench
 import re # Regex
+import select # Wait for inotify events and child output
+import shutil # Clear the trees of --diff
+import signal # Kill children that time out
+import sqlite3 # Run history
+import struct # Unpack inotify events
 import subprocess # Popen for running tests
 import sys # Command line arguments and exit
+import tempfile # Sandboxes of tests
+import threading # Workers of the pipeline
+import time # Wall clock time of child processes
+import traceback # Report crashes in pipeline workers
+import xml.sax.saxutils # Escape text in JUnit reports
 
 COMMAND = ""
+## COMMAND as it is run, which --no-cds aside may start java from an
+## archive of its classes.  Results are kept by COMMAND, as given.
+RUN_COMMAND = ""
 TESTS = None
 LEVEL = None
+ARTIFACT = None
 CODEGEN = False
 REFERENCE_COMPILER = False
 NO_LIFTED = False
+JOBS = 1
+SERVER = False
+CACHE = True
+CACHE_SIZE = 64 * 1024 * 1024
+CACHE_KEY_FILES = []
+BATCH = 1
+PIPELINE = None
+BENCH = 0
+KEEP_STDOUT = False
+GCC_FLAGS = ""
+GCC_CACHE = True
+GCC_CACHE_SIZE = 256 * 1024 * 1024
+GCC_JOBS = 1
+SANDBOX = True
+SANDBOX_DIR = None
+KEEP_FAILED = False
+CDS = True
+SPLIT_OUTPUT = False
+
+## Bytes of a program's output read past its first difference with
+## .expected, to show the line that differs
+OUTPUT_SLACK = 4096
+
+## Bytes kept of either output of a child, see captureOutput
+CAPTURE_LIMIT = 1024 * 1024
+
+## Seconds the child of each stage may run for, None for no limit (--timeout)
+TIMEOUTS = {'compile': 60, 'lifted': 60, 'gcc': 60, 'run': 10}
+
+## Where supertest.py keeps things between runs
+STATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.supertest')
+CACHE_DIR = os.path.join(STATE_DIR, 'cache')
+MANIFEST = os.path.join(STATE_DIR, 'manifest.json')
+LAST_FAILED = os.path.join(STATE_DIR, 'last_failed')
+
+## Hash of everything besides the test itself that results depend on,
+## see commandDigest
+_command_digest = None
+## The compiler servers of this process, one for each thread, see
+## runServerCompiler
+_servers = threading.local()
+_all_servers = []
+## The children of this process still running, by pid, see captureOutput
+_children = {}
+
+## Compiler output of files already compiled by a batch, see compileBatch
+_precompiled = {}
+## Outcomes of .c files already built by buildExecutables, and the gcc
+## version, see gccIdentity
+_prebuilt = {}
+_gcc_identity = None
+## The text of the .expected files of --diff, by their path from the
+## test directory, read once for every compiler, see runDiff
+_expected = {}
 
 #######################################################################
 # Runs all tests for Silver's implementation of Oberon0
@@ -20,7 +105,45 @@ NO_LIFTED = False
 # Written by: Kevin Williams
 #######################################################################
 
-def printTest(test_type, passed, error, path):
+def newResults():
+  ## results[test_type] = [num_pass, num_fail]
+  ## results['fail'][fail_type] = [fail_path0, fail_path1, ...]
+  ## results['log'] = [line0, line1, ...] shown by reportResults
+  ## results['cached'] = [num_replayed, num_run]
+  ## results['timing'] = [timing0, timing1, ...] of each child, see reapChild
+  ## results['reported'] = [line0, ...] the error line of each compile, see reportedLine
+  ## results['said'] = [text0, ...] what each compile wrote first, see saidText
+  return {'positive':[0,0], 'name_type':[0,0], 'parse':[0,0], 'lifted_cmp':[0,0], 'compile_c':[0,0], 'run_c':[0,0], 'expected_cmp':[0,0], 'cached':[0,0],
+          'fail':{"ERROR":[], "NO ERROR":[], "WRONG LINE":[], "STDERR":[], "WRONG ERR":[], "LIFTED CMP":[], "GCC ERR":[], "NO C FILE":[], "NO EXP FILE":[], "NO STDOUT FILE":[], "EXP CMP":[], "NO LINE":[], "LIFTED ERR":[], "TIMEOUT":[]},
+          'log':[], 'timing':[], 'reported':[], 'said':[] }
+
+
+def mergeResults(total, part):
+  ## Add the pass/fail counts, failures and log of part to total
+  for test_type in part:
+    if test_type == 'fail':
+      for fail_group in part['fail']:
+        total['fail'].setdefault(fail_group, []).extend(part['fail'][fail_group])
+    elif test_type in ['log', 'timing', 'reported', 'said']:
+      total[test_type].extend(part[test_type])
+    else:
+      total[test_type][0] = total[test_type][0] + part[test_type][0]
+      total[test_type][1] = total[test_type][1] + part[test_type][1]
+
+
+def countFailures(results):
+  ## Number of stages failed in results
+  return sum([len(fail_paths) for fail_paths in results['fail'].values()])
+
+
+def reportResults(total, part):
+  ## Show the log of a finished test, then count it
+  for line in part['log']:
+    print line
+  mergeResults(total, part)
+
+
+def printTest(results, test_type, passed, error, path):
   ## Unified method to show results to user
   text = test_type + "\t" + "- "
   
@@ -33,145 +156,617 @@ def printTest(test_type, passed, error, path):
 
   text += path
 
-  print text.expandtabs(20)
+  results['log'].append(text.expandtabs(20))
 
 
-def runPositiveTest(testpath, results):
-  success = False
+def reapChild(child, start, deadline=None):
+  ## Wait for child, started at time start, with os.wait4, killing it if
+  ## it is still running at time deadline.  Returns its timing: wall
+  ## clock, user and system CPU seconds, and peak resident set size in
+  ## kilobytes, with 'timeout' True if it was killed at deadline.  These
+  ## include whatever child waited for, such as the command run by the
+  ## shell.
+  timed_out = False
+  flags = deadline and os.WNOHANG or 0
+  delay = 0.001
+  while True:
+    try:
+      pid, status, rusage = os.wait4(child.pid, flags)
+    except OSError, e:
+      if e.errno != errno.EINTR:
+        raise
+      continue
+    if pid:
+      break
 
-  ## Remember where we started
-  cur_dir = os.path.abspath('.') + "/"
+    ## Still running, with its outputs closed
+    if time.time() >= deadline:
+      killChild(child)
+      timed_out = True
+      flags = 0
+    else:
+      time.sleep(min(delay, deadline - time.time()))
+      delay = min(delay * 2, 0.05)
 
-  ## cd into testname's location
-  os.chdir(os.path.dirname(os.path.abspath(testpath)))
+  if os.WIFSIGNALED(status):
+    child.returncode = -os.WTERMSIG(status)
+  else:
+    child.returncode = os.WEXITSTATUS(status)
+
+  timing = {'wall': time.time() - start, 'user': rusage.ru_utime, 'sys': rusage.ru_stime, 'maxrss': rusage.ru_maxrss}
+  if timed_out:
+    timing['timeout'] = True
+  return timing
+
+
+def recordTiming(results, stage, path, timing):
+  ## Keep the timing of a child run for stage of the test at path
+  timing = dict(timing)
+  timing['stage'] = stage
+  timing['path'] = path
+  results['timing'].append(timing)
+
+
+def runCompiler(testpath, results, settled=None):
+  ## Run COMMAND on testpath from within testpath's directory, stopping
+  ## it once settled says the verdict is in, see captureOutput.
+  ## The working directory is given to the child only; never os.chdir
+  ## here, as tests may be running in parallel.
+  stage = 'compile'
+  if '_lifted' in os.path.basename(testpath):
+    stage = 'lifted'
+
+  if os.path.abspath(testpath) in _precompiled:
+    stdout_output, stderr_output, timing = _precompiled[os.path.abspath(testpath)]
+
+  elif SERVER:
+    ## The server's own resource use is not per test, only the time is
+    start = time.time()
+    stdout_output, stderr_output, timed_out = runServerCompiler(testpath, TIMEOUTS[stage])
+    timing = {'wall': time.time() - start, 'user': None, 'sys': None, 'maxrss': None}
+    if timed_out:
+      timing['timeout'] = True
+
+  elif SPLIT_OUTPUT:
+    stdout_output, stderr_output, timing = runSplitCompiler(testpath, TIMEOUTS[stage], settled)
+
+  else:
+    start = time.time()
+    outputs = subprocess.Popen(RUN_COMMAND + ' ' + os.path.basename(testpath), shell=True,
+                               cwd=os.path.dirname(os.path.abspath(testpath)),
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE, preexec_fn=childGroup)
+
+    stdout_data, stderr_data, timing = captureOutput(outputs, start, TIMEOUTS[stage], settled)
+    stdout_output = cStringIO.StringIO(stdout_data).readlines()
+    stderr_output = cStringIO.StringIO(stderr_data).readlines()
+
+  recordTiming(results, stage, testpath, timing)
+  if stage == 'compile':
+    results['reported'].append(reportedLine(stdout_output))
+    results['said'].append(saidText(stdout_output, stderr_output))
+
+  return stdout_output, stderr_output
+
+
+def saidText(stdout_output, stderr_output):
+  ## The first line of stderr, and of where it was for a stack trace,
+  ## else the first line of stdout, else ''
+  if stderr_output:
+    return crashText(''.join(stderr_output))
+  if stdout_output:
+    return stdout_output[0]
+  return ''
+
+
+def preloadedExpected(expected_path):
+  ## The text of expected_path from _expected, found by the longest
+  ## path from the test directory it ends with, or None.  This holds
+  ## wherever the test is run from, in a tree of --diff or a sandbox.
+  parts = os.path.abspath(expected_path).split(os.sep)
+  for i in range(1, len(parts)):
+    text = _expected.get(os.path.join(*parts[i:]))
+    if text is not None:
+      return text
+  return None
+
+
+def reportedLine(stdout_output):
+  ## The line number of the error the compiler reports first, or None
+  ## if it reports no error or none with a line
+  if not stdout_output:
+    return None
+  match = re.match(r'(?:.*[Ll]ine[:]?\s+)?(\d+)', stdout_output[0])
+  if not match:
+    return None
+  return int(match.group(1))
+
+
+#######################################################################
+# Output capture (--timeout SECONDS or --timeout STAGE=SECONDS,...)
+#
+# Children are started in a process group of their own, and their
+# stdout and stderr read together as they come, so that neither pipe
+# can fill up and stop them.  A child is killed, along with whatever it
+# started, as soon as its verdict is in, as when a compiler has written
+# the first line of an error; once more than CAPTURE_LIMIT bytes come
+# on either pipe, past the length of .expected for a program's output;
+# or once it has run for the TIMEOUTS of its stage: compile, lifted,
+# gcc or run.  A test whose child runs out of time fails with TIMEOUT,
+# and its results are not cached.  A worker of the pool that is
+# terminated, as by --fail-fast, kills the children it was reading
+# first, see stopWorker, so that they are not left running.
+#######################################################################
+
+def captureOutput(child, start, timeout, settled=None, limit=CAPTURE_LIMIT, output=None):
+  ## Read the stdout and stderr of child, started at time start, until it
+  ## closes them, settled(stdout, stderr), given the chunks of each read
+  ## so far, is true, either passes limit bytes, or timeout seconds pass.
+  ## Returns (stdout, stderr, timing), timing as from reapChild, with
+  ## 'timeout' True if child ran out of time.  Given output, an
+  ## OutputFiles, stdout is fed to it instead, and only what it leaves
+  ## on stdout counts.
+  _children[child.pid] = child
+  streams = [stream for stream in [child.stdout, child.stderr] if stream]
+  fds = [stream.fileno() for stream in streams]
+  chunks = dict([(fd, []) for fd in fds])
+  sizes = dict([(fd, 0) for fd in fds])
+
+  deadline = timeout and start + timeout
+  timed_out = False
+
+  poller = select.poll()
+  for fd in chunks:
+    poller.register(fd, select.POLLIN)
+  reading = len(chunks)
+
+  while reading:
+    wait = None
+    if deadline:
+      wait = (deadline - time.time()) * 1000
+      if wait <= 0:
+        timed_out = True
+        break
+    try:
+      events = poller.poll(wait)
+    except select.error, e:
+      if e.args[0] != errno.EINTR:
+        raise
+      continue
+
+    for fd, event in events:
+      chunk = os.read(fd, 65536)
+      if not chunk:
+        poller.unregister(fd)
+        reading -= 1
+        continue
+      if output and fd == fds[0]:
+        output.feed(chunk)
+        continue
+      chunks[fd].append(chunk)
+      sizes[fd] += len(chunk)
+
+    if [size for size in sizes.values() if limit and size > limit]:
+      break
+    if settled and settled(output and output.stdout or chunks[fds[0]], child.stderr and chunks[fds[-1]] or []):
+      break
+
+  if reading:
+    ## The rest of the output is not needed
+    killChild(child)
+  for stream in streams:
+    stream.close()
+  timing = reapChild(child, start, deadline)
+  del _children[child.pid]
+
+  if timed_out:
+    timing['timeout'] = True
+  if output:
+    output.close()
+    chunks[fds[0]] = output.stdout
+  captured = [''.join(chunks[fd])[:limit or None] for fd in fds]
+  return captured[0], (child.stderr and captured[-1]) or '', timing
+
+
+def killChild(child):
+  ## Kill child and everything it started, see childGroup
+  try:
+    os.killpg(child.pid, signal.SIGKILL)
+  except OSError:
+    pass
+
+
+def startWorker():
+  ## initializer of the pools that may be terminated
+  signal.signal(signal.SIGTERM, stopWorker)
+
+
+def stopWorker(signum, frame):
+  ## SIGTERM of a pool worker, as from pool.terminate.  Its children run
+  ## in process groups of their own, and would outlive it.
+  for child in _children.values() + _all_servers:
+    killChild(child)
+  os._exit(1)
+
+
+def childGroup():
+  ## preexec_fn of children: a process group of their own, for killChild
+  os.setpgrp()
+
+
+def firstLine(chunks):
+  ## The first line of the output read so far, once it is complete
+  for i in range(len(chunks)):
+    if '\n' in chunks[i]:
+      return ''.join(chunks[:i + 1]).split('\n', 1)[0]
+  return None
 
-  ## Remove directory portion of testname
-  testname = os.path.basename(testpath)
 
-  outputs = subprocess.Popen(COMMAND + ' ' + testname, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+def positiveSettled(stdout, stderr):
+  ## A positive test fails with the first line of stdout, but with
+  ## REFERENCE_COMPILER only if it is an error, with a line number
+  line = firstLine(stdout)
+  return line is not None and (not REFERENCE_COMPILER or 'line' in line)
 
-  stdout_output = outputs.stdout.readlines()
-  stderr_output = outputs.stderr.readlines()
+
+def negativeSettled(stdout, stderr):
+  ## A negative test's verdict is in with the first line of stdout,
+  ## but for anything on stderr too, which fails it, unless
+  ## REFERENCE_COMPILER
+  return firstLine(stdout) is not None and (REFERENCE_COMPILER or len(stderr) > 0)
+
+
+def timedOut(results, test_type, count, testpath):
+  ## Fail the test at testpath with TIMEOUT if its last child ran out
+  ## of time
+  if not results['timing'] or not results['timing'][-1].get('timeout'):
+    return False
+  printTest(results, test_type, False, "TIMEOUT", testpath)
+  results[count][1] = results[count][1] + 1
+  results['fail']['TIMEOUT'].append(testpath)
+  return True
+
+
+#######################################################################
+# Output files (--split-output)
+#
+# Some compilers, such as Kiama's, write all of their output files on
+# stdout, each after a line '* ext', where ext is the extension of the
+# file, e.g. '* c' or '* _pp.ob', as testing/kobc used to split it with
+# a shell loop.  With --split-output, COMMAND is run on each test with
+# its stderr on its stdout, which is split as it comes, the lines after
+# '* ext' going to the test's file of that extension, and those before
+# any to stdout:
+#
+#   python supertest.py -nolifted A4 --split-output `./kobc -command A4`
+#
+# Tabs in a test are expanded first, for the columns the compiler
+# reports, and the test given to COMMAND as /dev/stdin.  A run whose
+# output has any of CRASH in it has crashed, and the first CRASH_LINES
+# lines of its output are taken as its stderr.
+#######################################################################
+
+CRASH = re.compile(r'No such file|StackOverflow')
+CRASH_LINES = 10
+
+
+class OutputFiles:
+  ## The output of a compiler, as it is split into files
+
+  def __init__(self, base):
+    self.base = base
+    self.stdout = [] # Lines before any '* ext'
+    self.head = [] # The first CRASH_LINES lines
+    self.crashed = False
+    self.written = set() # Files written so far, the rest are replaced
+    self.file = None
+    self.partial = ''
+
+  def feed(self, chunk):
+    lines = (self.partial + chunk).split('\n')
+    self.partial = lines.pop()
+    for line in lines:
+      self.line(line + '\n')
+
+  def line(self, line):
+    if len(self.head) < CRASH_LINES:
+      self.head.append(line)
+    if CRASH.search(line):
+      self.crashed = True
+
+    if line.startswith('* '):
+      ext = line[2:].rstrip('\n')
+      if '.' not in ext:
+        ext = '.' + ext
+      if self.file:
+        self.file.close()
+      path = self.base + ext
+      self.file = open(path, path in self.written and 'a' or 'w')
+      self.written.add(path)
+    elif self.file:
+      self.file.write(line)
+    else:
+      self.stdout.append(line)
+
+  def close(self):
+    if self.partial:
+      self.line(self.partial)
+      self.partial = ''
+    if self.file:
+      self.file.close()
+      self.file = None
+
+
+def feedInput(stream, text):
+  ## Write text to the stdin of a child, which may not read it all
+  try:
+    stream.write(text)
+    stream.close()
+  except IOError:
+    pass
+
+
+def runSplitCompiler(testpath, timeout, settled):
+  ## Run COMMAND on testpath, splitting its output into files.  Returns
+  ## (stdout, stderr, timing) as runCompiler has them.
+  test_dir = os.path.dirname(os.path.abspath(testpath))
+  name = os.path.basename(testpath)
+
+  ## A missing test is left to COMMAND, which should say No such file
+  source = ''
+  if os.path.exists(testpath):
+    f = open(testpath)
+    try:
+      source = f.read()
+    finally:
+      f.close()
+
+  argument = name
+  stdin = None
+  if '\t' in source:
+    argument = '/dev/stdin'
+    stdin = subprocess.PIPE
+
+  start = time.time()
+  child = subprocess.Popen(RUN_COMMAND + ' ' + argument, shell=True, cwd=test_dir, stdin=stdin,
+                           stdout=subprocess.PIPE, stderr=subprocess.STDOUT, preexec_fn=childGroup)
+  feeder = None
+  if stdin:
+    feeder = threading.Thread(target=feedInput, args=(child.stdin, source.expandtabs()))
+    feeder.start()
+
+  output = OutputFiles(os.path.join(test_dir, os.path.splitext(name)[0]))
+  stdout_data, stderr_data, timing = captureOutput(child, start, timeout, settled, CAPTURE_LIMIT, output)
+  if feeder:
+    feeder.join()
+
+  if output.crashed:
+    return [], output.head, timing
+  return cStringIO.StringIO(stdout_data).readlines(), [], timing
+
+
+#######################################################################
+# Compiler server protocol (--server)
+#
+# COMMAND is started once per process and kept warm.  For each test a
+# request line is written to its stdin:
+#
+#   <directory> TAB <filename> NEWLINE
+#
+# The server compiles <filename> as if run from within <directory> and
+# answers on its stdout with:
+#
+#   <exit status> SPACE <stdout bytes> SPACE <stderr bytes> NEWLINE
+#
+# followed by that many bytes of stdout and then of stderr.  Closing
+# its stdin asks the server to exit.  ob0_server.py is a reference
+# implementation of the protocol.
+#
+# A server that does not answer within the TIMEOUTS of the stage is
+# killed, the test fails with TIMEOUT, and a new server is started for
+# the next test.
+#######################################################################
+
+def startServer():
+  ## Start a server for the current thread
+  server = subprocess.Popen(RUN_COMMAND, shell=True, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            preexec_fn=childGroup)
+  server.pending = ''
+  _servers.server = server
+  _all_servers.append(server)
+  return server
+
+
+def stopServer(server):
+  if server.poll() is None:
+    server.stdin.close()
+    server.wait()
+
+
+def stopServers():
+  for server in _all_servers:
+    stopServer(server)
+  del _all_servers[:]
+
+
+def readServer(server, length, deadline):
+  ## Read length bytes of server's answer, or its next line if length
+  ## is None.  Returns None if the server closes its stdout first, or is
+  ## still not done at time deadline.  Reads go straight to the pipe, so
+  ## that what select sees is all there is; whatever comes past the end
+  ## is kept in server.pending for the next read.
+  fd = server.stdout.fileno()
+  while True:
+    if length is None and '\n' in server.pending:
+      end = server.pending.index('\n') + 1
+      break
+    if length is not None and len(server.pending) >= length:
+      end = length
+      break
+
+    wait = None
+    if deadline:
+      wait = deadline - time.time()
+      if wait <= 0:
+        return None
+    try:
+      ready = select.select([fd], [], [], wait)[0]
+    except select.error, e:
+      if e.args[0] != errno.EINTR:
+        raise
+      continue
+    if not ready:
+      continue
+
+    chunk = os.read(fd, 65536)
+    if not chunk:
+      return None
+    server.pending += chunk
+
+  data = server.pending[:end]
+  server.pending = server.pending[end:]
+  return data
+
+
+def runServerCompiler(testpath, timeout):
+  ## Same as a per-process runCompiler, but using this thread's server.
+  ## Returns (stdout, stderr, timed_out).
+  server = getattr(_servers, 'server', None)
+  if server is None or server.poll() is not None:
+    server = startServer()
+  deadline = timeout and time.time() + timeout
+
+  try:
+    server.stdin.write(os.path.dirname(os.path.abspath(testpath)) + '\t' + os.path.basename(testpath) + '\n')
+    server.stdin.flush()
+    header = (readServer(server, None, deadline) or '').split()
+  except IOError:
+    header = []
+
+  stdout_output = stderr_output = None
+  if len(header) == 3:
+    stdout_output = readServer(server, int(header[1]), deadline)
+    stderr_output = readServer(server, int(header[2]), deadline)
+
+  if stdout_output is None or stderr_output is None:
+    ## The server died or hung on this test; a new one is started for
+    ## the next
+    timed_out = deadline and time.time() >= deadline and server.poll() is None
+    killChild(server)
+    server.wait()
+    _servers.server = None
+    if timed_out:
+      return [], [], True
+    return [], ['supertest: compiler server exited while compiling ' + testpath + '\n'], False
+
+  return cStringIO.StringIO(stdout_output).readlines(), cStringIO.StringIO(stderr_output).readlines(), False
+
+
+def runPositiveTest(testpath, results):
+  success = False
+
+  stdout_output, stderr_output = runCompiler(testpath, results, positiveSettled)
+  if timedOut(results, "Positive test", 'positive', testpath):
+    return success
 
   if REFERENCE_COMPILER:
     if len(stdout_output) > 0:
       if 'line' in stdout_output[0]:
         ## Error found
-        printTest("Positive test", False, "ERROR", testpath)
+        printTest(results, "Positive test", False, "ERROR", testpath)
         results['positive'][1] = results['positive'][1] + 1
         results['fail']['ERROR'].append(testpath)
       else: # 'line' not in stdout_output[0]
         ## Output found, but no line -> just output
-        printTest("Positive test", True, "", testpath)
+        printTest(results, "Positive test", True, "", testpath)
         results['positive'][0] = results['positive'][0] + 1
         success = True
     elif len(stderr_output) > 0:
       ## Stderr found
-      printTest("Positive test", False, "STDERR", testpath)
+      printTest(results, "Positive test", False, "STDERR", testpath)
       results['positive'][1] = results['positive'][1] + 1
       results['fail']["STDERR"].append(testpath)
     else: # len(stdout_output) <= 0
       ## No output -> no error
-      printTest("Positive test", True, "", testpath)
+      printTest(results, "Positive test", True, "", testpath)
       results['positive'][0] = results['positive'][0] + 1
       success = True
 
   elif len(stdout_output) > 0:
-    printTest("Positive test", False, "ERROR", testpath)
+    printTest(results, "Positive test", False, "ERROR", testpath)
     results['positive'][1] = results['positive'][1] + 1
     results['fail']['ERROR'].append(testpath)
 
   elif len(stderr_output) > 0:
-    printTest("Positive test", False, "STDERR", testpath)
+    printTest(results, "Positive test", False, "STDERR", testpath)
     results['positive'][1] = results['positive'][1] + 1
     results['fail']["STDERR"].append(testpath)
 
   else:
-    printTest("Positive test", True, "", testpath)
+    printTest(results, "Positive test", True, "", testpath)
     results['positive'][0] = results['positive'][0] + 1
     success = True
   
-  ## cd back to where we started
-  os.chdir(os.path.dirname(cur_dir))
-  
   return success
 
  
 def runParseTest(testpath, results):
   success = False
 
-  ## Remember where we started
-  cur_dir = os.path.abspath('.') + "/"
-
-  ## cd into testname's location
-  os.chdir(os.path.dirname(os.path.abspath(testpath)))
-
-  ## Remove directory portion of testname
-  testname = os.path.basename(testpath)
-
-  outputs = subprocess.Popen(COMMAND + ' ' + testname, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-  
-  stdout_output = outputs.stdout.readlines()
-  stderr_output = outputs.stderr.readlines()
+  stdout_output, stderr_output = runCompiler(testpath, results, negativeSettled)
+  if timedOut(results, "Parse test", 'parse', testpath):
+    return success
 
   if REFERENCE_COMPILER:
     if len(stdout_output) > 0:
       ## Error found
-      printTest("Parse test", True, "", testpath)
+      printTest(results, "Parse test", True, "", testpath)
       results['parse'][0] = results['parse'][0] + 1
       success = True
 
     elif len(stderr_output) > 0:
       ## Stderr found
-      printTest("Parse test", False, "STDERR", testpath)
+      printTest(results, "Parse test", False, "STDERR", testpath)
       results['parse'][1] = results['parse'][1] + 1
       results['fail']["STDERR"].append(testpath)
 
     else: # len(stdout_output) <= 0 and len(stderr_output) <= 0
       ## No output -> no error
-      printTest("Parse test", False, "NO ERROR", testpath)
+      printTest(results, "Parse test", False, "NO ERROR", testpath)
       results['parse'][1] = results['parse'][1] + 1
       results['fail']["NO ERROR"].append(testpath)
 
   elif len(stdout_output) == 0 and len(stderr_output) == 0:
-    printTest("Parse test", False, "NO ERROR", testpath)
+    printTest(results, "Parse test", False, "NO ERROR", testpath)
     ## Fail - Must have errors to pass
     results['parse'][1] = results['parse'][1] + 1
     results['fail']["NO ERROR"].append(testpath)
 
   elif len(stderr_output) > 0:
-    printTest("Parse test", False, "STDERR", testpath)
+    printTest(results, "Parse test", False, "STDERR", testpath)
     ## Fail - Errors sent to stderr -> incorrect error.
     results['parse'][1] = results['parse'][1] + 1
     results['fail']["STDERR"].append(testpath)
 
   else: # len(returned_lines) != 0:
-    printTest("Parse test", True, "", testpath)
+    printTest(results, "Parse test", True, "", testpath)
     results['parse'][0] = results['parse'][0] + 1
     success = True
-  
-  ## cd back to where we started
-  os.chdir(os.path.dirname(cur_dir))
 
+  if not success:
+    explainTest(testpath, results)
+  
   return success
 
 
 def runNameTypeTest(testpath, results):
   success = False
 
-  ## Remember where we started
-  cur_dir = os.path.abspath('.') + "/"
-
-  ## cd into testname's location
-  os.chdir(os.path.dirname(os.path.abspath(testpath)))
-
   ## Remove directory portion of testname
   testname = os.path.basename(testpath)
 
-  outputs = subprocess.Popen(COMMAND + ' ' + testname, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-
-  stdout_output = outputs.stdout.readlines()
-  stderr_output = outputs.stderr.readlines()
+  stdout_output, stderr_output = runCompiler(testpath, results, negativeSettled)
+  if timedOut(results, "Name or Type Test", 'name_type', testpath):
+    return success
 
   if REFERENCE_COMPILER:
     if len(stdout_output) > 0:
@@ -181,30 +776,30 @@ def runNameTypeTest(testpath, results):
 
       else: # 'line' not in stdout_output[0]
         ## No line -> no error
-        printTest("Name or Type Test", False, "NO ERROR", testpath)
+        printTest(results, "Name or Type Test", False, "NO ERROR", testpath)
         results['name_type'][1] = results['name_type'][1] + 1
         results['fail']["NO ERROR"].append(testpath)
 
     elif len(stderr_output) > 0:
       ## Stderr found
-      printTest("Name or Type Test", False, "STDERR", testpath)
+      printTest(results, "Name or Type Test", False, "STDERR", testpath)
       results['name_type'][1] = results['name_type'][1] + 1
       results['fail']["STDERR"].append(testpath)
 
     else: # len(stdout_output) <= 0 and len(stderr_output) <= 0
       ## No output -> no error
-      printTest("Name or Type Test", False, "NO ERROR", testpath)
+      printTest(results, "Name or Type Test", False, "NO ERROR", testpath)
       results['name_type'][1] = results['name_type'][1] + 1
       results['fail']["NO ERROR"].append(testpath)
 
   elif len(stdout_output) == 0 and len(stderr_output) == 0:
-    printTest("Name or Type Test", False, "NO ERROR", testpath)
+    printTest(results, "Name or Type Test", False, "NO ERROR", testpath)
     ## Fail - Must have errors to pass
     results['name_type'][1] = results['name_type'][1] + 1
     results['fail']["NO ERROR"].append(testpath)
 
   elif len(stderr_output) > 0:
-    printTest("Name or Type Test", False, "STDERR", testpath)
+    printTest(results, "Name or Type Test", False, "STDERR", testpath)
     ## Fail - Errors sent to stderr -> incorrect error.
     results['name_type'][1] = results['name_type'][1] + 1
     results['fail']["STDERR"].append(testpath)
@@ -212,8 +807,8 @@ def runNameTypeTest(testpath, results):
   else: # len(returned_lines) != 0:
     success = checkErrorInNameOrTypeTest(stdout_output, results, testpath, testname)
 
-  ## cd back to where we started
-  os.chdir(os.path.dirname(cur_dir))
+  if not success:
+    explainTest(testpath, results)
 
   return success
 
@@ -231,7 +826,7 @@ def checkErrorInNameOrTypeTest(stdout_output, results, testpath, testname):
   match = re.match(line_pattern, stdout_output[0])
 
   if not match:
-    printTest("Name or Type Test", False, "NO LINE", testpath)
+    printTest(results, "Name or Type Test", False, "NO LINE", testpath)
     results['name_type'][1] = results['name_type'][1] + 1
     results['fail']["NO LINE"].append(testpath)
   else: # match
@@ -243,13 +838,13 @@ def checkErrorInNameOrTypeTest(stdout_output, results, testpath, testname):
 
     if not re.match(file_pattern, testname):
       # Line found in error doesn't match line found in filename
-      printTest("Name or Type Test", False, "LINE "+found_line, testpath)
+      printTest(results, "Name or Type Test", False, "LINE "+found_line, testpath)
       results['name_type'][1] = results['name_type'][1] + 1
       results['fail']["WRONG LINE"].append(testpath)
 
     else: #re.match(file_pattern, testname)
       # Line found in error matches line found in filename!
-      printTest("Name or Type Test", True, "", testpath)
+      printTest(results, "Name or Type Test", True, "", testpath)
       results['name_type'][0] = results['name_type'][0] + 1
       success = True
   
@@ -260,13 +855,13 @@ def compareLifted(lifted, lifted_lifted, results):
   success = False
   
   if not os.path.exists(lifted):
-    printTest("Compare Lifted", False, "NO FILE 1", lifted)
+    printTest(results, "Compare Lifted", False, "NO FILE 1", lifted)
     results['lifted_cmp'][1] = results['lifted_cmp'][1] + 1
     results['fail']["LIFTED ERR"].append(lifted)
 
   else: #os.path.exists(lifted)
     if not os.path.exists(lifted_lifted):
-      printTest("Compare Lifted", False, "NO FILE 2", lifted_lifted)
+      printTest(results, "Compare Lifted", False, "NO FILE 2", lifted_lifted)
       results['lifted_cmp'][1] = results['lifted_cmp'][1] + 1
       results['fail']["LIFTED ERR"].append(lifted_lifted)
 
@@ -274,255 +869,367 @@ def compareLifted(lifted, lifted_lifted, results):
       comparison = filecmp.cmp(lifted, lifted_lifted)
       
       if not comparison:
-        printTest("Compare Lifted", False, "DIFFERENT", lifted_lifted)
+        printTest(results, "Compare Lifted", False, "DIFFERENT", lifted_lifted)
         results['lifted_cmp'][1] = results['lifted_cmp'][1] + 1
         results['fail']["LIFTED ERR"].append(lifted_lifted)
 
       else: # comparison == True
-        printTest("Compare Lifted", True, "", lifted_lifted)
+        printTest(results, "Compare Lifted", True, "", lifted_lifted)
         results['lifted_cmp'][0] = results['lifted_cmp'][0] + 1
         success = True
   
   return success
 
 
-def runCCode(testpath, results):
+def compileCCode(testpath, results):
   success = False
 
   ## Check for existence
   if not os.path.exists(testpath):
-    printTest("Positive Run C", False, "NO C FILE", testpath)
+    printTest(results, "Positive Run C", False, "NO C FILE", testpath)
     results['compile_c'][1] = results['compile_c'][1] + 1
     results['fail']['NO C FILE'].append(testpath)
   else: #os.path.exists(testpath):
 
-    ## Remember where we started
-    cur_dir = os.path.abspath('.') + "/"
-
-    ## cd into testname's location
-    os.chdir(os.path.dirname(os.path.abspath(testpath)))
+    ## gcc, or the gcc cache
+    exit_code, messages, timing = buildExecutable(testpath)
+    results['log'].extend(messages)
+    recordTiming(results, 'gcc', testpath, timing)
 
-    ## Remove directory portion of testname
-    testname = os.path.basename(testpath)
-    executable = os.path.splitext(testname)[0] + '.a'
-
-    exit_code = os.system('gcc ' + testname + ' -o ' + executable)
-
-    if exit_code != 0:
-      printTest("Positive GCC", False, "GCC ERR: " + str(exit_code), testpath)
+    if timedOut(results, "Positive GCC", 'compile_c', testpath):
+      pass
+    elif exit_code != 0:
+      printTest(results, "Positive GCC", False, "GCC ERR: " + str(exit_code), testpath)
       results['compile_c'][1] = results['compile_c'][1] + 1
       results['fail']['GCC ERR'].append(testpath)
     else: #exit_code == 0
-      printTest("Positive GCC", True, "", testpath)
+      printTest(results, "Positive GCC", True, "", testpath)
       results['compile_c'][0] = results['compile_c'][0] + 1
+      success = True
 
-      ## Configure stdin
-      stdin_file = os.path.splitext(testname)[0] + '.stdin'
-      #print "STDIN FILE:", stdin_file
+  return success
 
-      stdin_text = ""
-      if os.path.exists(stdin_file):
-        stdin_text = "< " + stdin_file + " "
-      #print "STDIN TEXT:", stdin_text
 
-      ## Configure stdout
-      stdout_file = os.path.splitext(testname)[0] + '.stdout'
+def streamCompare(expected, state):
+  ## A settled function for captureOutput that compares a program's
+  ## stdout with the expected text as it comes, keeping in
+  ## state['offset'] the offset of the first difference, or None.
+  ## After a difference, reading goes on only to the end of that line,
+  ## and for at most OUTPUT_SLACK bytes, so a runaway program is not
+  ## read, or left running, for any longer than needed.
+  state['offset'] = None
+  state['length'] = 0
+  state['chunks'] = 0
 
-      if os.path.exists(stdout_file):
-        os.remove(stdout_file)
+  def settled(stdout, stderr):
+    for chunk in stdout[state['chunks']:]:
+      length = state['length']
+      if state['offset'] is None and chunk != expected[length:length + len(chunk)]:
+        offset = length
+        while offset - length < len(chunk) and offset < len(expected) and chunk[offset - length] == expected[offset]:
+          offset += 1
+        state['offset'] = offset
+      state['length'] = length + len(chunk)
+    state['chunks'] = len(stdout)
 
-      ## Run the compiled executable
-      outputs = subprocess.Popen('./' + executable + ' ' + stdin_text + ' > ' + stdout_file, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    offset = state['offset']
+    if offset is None:
+      return False
 
-      ## Not needed; redirected to stdout_file
-      #stdout_output = outputs.stdout.readlines()
+    ## Stop once the line that differs is complete
+    return '\n' in ''.join(stdout)[offset:] or state['length'] - offset > OUTPUT_SLACK
 
-      stderr_output = outputs.stderr.readlines()
+  return settled
 
-      if len(stderr_output) > 0:
-        printTest("Positive Run", False, "STDERR", executable)
-        results['run_c'][1] = results['run_c'][1] + 1
-        results['fail']['STDERR'].append(testpath)
-      else:
-        printTest("Positive Run", True, "", testpath)
-        results['run_c'][0] = results['run_c'][0] + 1
-
-        expected = os.path.splitext(testname)[0] + '.expected'
-
-        ## Compare stdout_file to .expected
-        if not os.path.exists(expected):
-          ## stdout file doesn't exist
-          if os.path.getsize(stdout_file) == 0:
-            ## .expected doesn't exist and no stdout -> Pass
-            printTest("Compare Empty", True, "", expected)
-            results['expected_cmp'][0] = results['expected_cmp'][0] + 1
-          else: #os.path.getsize(stdout_file) != 0
-            printTest("Compare Empty", False, "NO .expected FILE", expected)
-            results['expected_cmp'][1] = results['expected_cmp'][1] + 1
-            results['fail']['NO EXP FILE'].append(testpath)
-        else: #os.path.exists(expected)
-          if not os.path.exists(stdout_file):
-            printTest("Compare Expected", False, "NO STDOUT FILE", stdout_file)
-            results['expected_cmp'][1] = results['expected_cmp'][1] + 1
-            results['fail']['NO STDOUT FILE'].append(testpath)
-          else: #os.path.exists(stdout_file)
-            comparison = filecmp.cmp(expected, stdout_file)
-
-            if not comparison:
-              printTest("Compare Expected", False, "EXP CMP", stdout_file)
-              results['expected_cmp'][1] = results['expected_cmp'][1] + 1
-              results['fail']["EXP CMP"].append(testpath)
-            else: #comparison == True
-              printTest("Compare Expected", True, "", stdout_file)
-              results['expected_cmp'][0] = results['expected_cmp'][0] + 1
-              success = True
-
-    os.chdir(os.path.dirname(cur_dir))
 
+def firstMismatch(expected, output, offset):
+  ## (line number, expected line, output line) of the difference at
+  ## offset, with the lines cut short for the log
+  line_number = expected.count('\n', 0, offset) + 1
+  start = expected.rfind('\n', 0, offset) + 1
 
-  return success
+  def lineAt(text):
+    if start >= len(text):
+      return '<end of output>'
+    end = text.find('\n', start)
+    if end < 0:
+      end = len(text)
+    line = text[start:end]
+    if len(line) > 60:
+      line = line[:60] + '...'
+    return repr(line)
 
+  return line_number, lineAt(expected), lineAt(output)
 
-def printResults(results):
-  text = ""
-  if len(results['fail']) > 0:
-    text += '\n'
-    text += 'Failures:' + '\n' 
-    for fail_group in results['fail']:
-      if len(results['fail'][fail_group]) > 0:
-        text += '\t' + fail_group + '\n' 
-        for f in results['fail'][fail_group]:
-          text += '\t\t' + f + '\n' 
-  text += '\n' 
-  text += 'Positive tests:\tLifted compare:' + '\tCompare Expected:' + '\n' 
-  text += 'Pass: ' + str(results['positive'][0]) + '\t\tPass: ' + str(results['lifted_cmp'][0]) + '\t\tPass: ' + str(results['expected_cmp'][0]) + '\n' 
-  text += 'Fail: ' + str(results['positive'][1]) + '\t\tFail: ' + str(results['lifted_cmp'][1]) + '\t\tFail: ' + str(results['expected_cmp'][1]) + '\n' 
-  text += '\n'
-  text += 'Name or type tests:\tCompile C:' + '\n' 
-  text += 'Pass: ' + str(results['name_type'][0]) + '\t\tPass: ' + str(results['compile_c'][0]) + '\n' 
-  text += 'Fail: ' + str(results['name_type'][1]) + '\t\tFail: ' + str(results['compile_c'][1]) + '\n' 
-  text += '\n'
-  text += 'Parse tests:\tRun C:' + '\n' 
-  text += 'Pass: ' + str(results['parse'][0]) + '\t\tPass: ' + str(results['run_c'][0])  + '\n' 
-  text += 'Fail: ' + str(results['parse'][1]) + '\t\tPass: ' + str(results['run_c'][1])  + '\n' 
-  text += '\n'
-  text += 'Summary:' + '\n' 
-  text += 'Pass: ' + str(results['positive'][0] + 
-                         results['name_type'][0] +
-                         results['parse'][0] +
-                         results['lifted_cmp'][0] +
-                         results['compile_c'][0] +
-                         results['run_c'][0] +
-                         results['expected_cmp'][0]) + '\n' 
-  text += 'Fail: ' + str(results['positive'][1] + 
-                         results['name_type'][1] +
-                         results['parse'][1] +
-                         results['lifted_cmp'][1] +
-                         results['compile_c'][1] +
-                         results['run_c'][1] +
-                         results['expected_cmp'][1]) + '\n' 
 
-  print text.expandtabs(12)
+def runCCode(testpath, results):
+  ## Run the executable compileCCode built from testpath, comparing its
+  ## stdout with .expected as it runs
+  success = False
 
-def main():
-  global COMMAND
-  global TESTS
-  global LEVEL
-  global CODEGEN
-  global REFERENCE_COMPILER
-  global NO_LIFTED
+  test_dir = os.path.dirname(os.path.abspath(testpath))
+  testname = os.path.basename(testpath)
+  executable = os.path.splitext(testname)[0] + '.a'
 
-  if len(sys.argv) > 1:
-    ## Is the level specified?
-    artifact_pattern = r'-?(A(?:[1345]|2[ab]))'
-    for i in sys.argv[1:]:
-      m = re.match(artifact_pattern, i)
-      if m and not LEVEL:
-        artifact = m.group(1)
-        sys.argv.remove(m.group(0))
-        if artifact == 'A1':
-          LEVEL = ['L1', 'L2']
-          TESTS = ['T1', 'T2']
-        elif artifact == 'A2a':
-          LEVEL = ['L1', 'L2', 'L3']
-          TESTS = ['T1', 'T2']
-        elif artifact == 'A2b':
-          LEVEL = ['L1', 'L2']
-          TESTS = ['T1', 'T2', 'T3']
-        elif artifact == 'A3':
-          LEVEL = ['L1', 'L2', 'L3']
-          TESTS = ['T1', 'T2', 'T3']
-        elif artifact == 'A4':
-          LEVEL = ['L1', 'L2', 'L3', 'L4']
-          TESTS = ['T1', 'T2', 'T3', 'T5a']
-        elif artifact == 'A5':
-          LEVEL = ['L1', 'L2', 'L3', 'L4', 'L5']
-          TESTS = ['T1', 'T2', 'T3', 'T5a']
-        else:
-          print "Error: Unrecognized artifact:", artifact
-          sys.exit(0)
+  ## Configure stdin
+  stdin_path = os.path.join(test_dir, os.path.splitext(testname)[0] + '.stdin')
+  stdin_file = None
+  if os.path.exists(stdin_path):
+    stdin_file = open(stdin_path)
 
-    if not LEVEL or not TESTS:
-      print 'LEVEL: ALL'
-      LEVEL = ['L1', 'L2', 'L3', 'L4']
-      TESTS = ['T1', 'T2', 'T3', 'T5a']
+  ## Configure stdout; the .stdout file is only written with --keep-stdout
+  stdout_file = os.path.splitext(testname)[0] + '.stdout'
+  stdout_path = os.path.join(test_dir, stdout_file)
 
-    ## Is codegen specified?
-    if '-codegen' in sys.argv:
-      CODEGEN = True
-      sys.argv.remove('-codegen')
+  if os.path.exists(stdout_path):
+    os.remove(stdout_path)
 
-    if '-ref' in sys.argv:
-      REFERENCE_COMPILER = True
-      sys.argv.remove('-ref')
+  expected = os.path.splitext(testname)[0] + '.expected'
+  expected_path = os.path.join(test_dir, expected)
+  expected_text = preloadedExpected(expected_path)
+  has_expected = expected_text is not None or os.path.exists(expected_path)
+  if expected_text is None and has_expected:
+    f = open(expected_path)
+    try:
+      expected_text = f.read()
+    finally:
+      f.close()
+  expected_text = expected_text or ''
 
-    if '-nolifted' in sys.argv:
-      NO_LIFTED = True
-      print sys.argv
-      print "Set Lifted"
-      sys.argv.remove('-nolifted')
-      print sys.argv
+  ## Run the compiled executable
+  start = time.time()
+  outputs = subprocess.Popen([os.path.join(test_dir, executable)], cwd=test_dir, stdin=stdin_file,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, preexec_fn=childGroup)
+  if stdin_file:
+    stdin_file.close()
 
-    ## What's left is the running command
-    COMMAND = " ".join(sys.argv[1:])
+  ## Once the output differs, the verdict is in.  Output as long as
+  ## .expected is always read, only output running on past it is cut
+  compared = {}
+  stdout_output, stderr_output, timing = captureOutput(outputs, start, TIMEOUTS['run'], streamCompare(expected_text, compared),
+                                                       len(expected_text) + CAPTURE_LIMIT)
+  recordTiming(results, 'run', testpath, timing)
+  offset = compared['offset']
+  if offset is None and len(stdout_output) < len(expected_text):
+    offset = len(stdout_output)
+
+  if KEEP_STDOUT:
+    f = open(stdout_path, 'w')
+    try:
+      f.write(stdout_output)
+    finally:
+      f.close()
+
+  if timedOut(results, "Positive Run", 'run_c', testpath):
+    pass
+  elif len(stderr_output) > 0:
+    printTest(results, "Positive Run", False, "STDERR", executable)
+    results['run_c'][1] = results['run_c'][1] + 1
+    results['fail']['STDERR'].append(testpath)
   else:
-    print "Please supply commands to run compiler"
-    sys.exit(0)
+    printTest(results, "Positive Run", True, "", testpath)
+    results['run_c'][0] = results['run_c'][0] + 1
 
-  PATH_TO_TEST = '../tests/'
-  all_tests = []
-  ## results[test_type] = [num_pass, num_fail]
-  ## results['fail'][fail_type] = [fail_path0, fail_path1, ...]
-  results = {'positive':[0,0], 'name_type':[0,0], 'parse':[0,0], 'lifted_cmp':[0,0], 'compile_c':[0,0], 'run_c':[0,0], 'expected_cmp':[0,0],
-             'fail':{"ERROR":[], "NO ERROR":[], "WRONG LINE":[], "STDERR":[], "WRONG ERR":[], "LIFTED CMP":[], "GCC ERR":[], "NO C FILE":[], "NO EXP FILE":[], "NO STDOUT FILE":[], "EXP CMP":[], "NO LINE":[], "LIFTED ERR":[]} }
+    ## Compare stdout to .expected
+    if not has_expected:
+      if not stdout_output:
+        ## .expected doesn't exist and no stdout -> Pass
+        printTest(results, "Compare Empty", True, "", expected)
+        results['expected_cmp'][0] = results['expected_cmp'][0] + 1
+      else: #stdout_output
+        printTest(results, "Compare Empty", False, "NO .expected FILE", expected)
+        results['expected_cmp'][1] = results['expected_cmp'][1] + 1
+        results['fail']['NO EXP FILE'].append(testpath)
+    else: #os.path.exists(expected)
+      if offset is not None:
+        line_number, expected_line, output_line = firstMismatch(expected_text, stdout_output, offset)
+        printTest(results, "Compare Expected", False, "EXP CMP", expected + ':' + str(line_number))
+        results['log'].append('    expected: ' + expected_line)
+        results['log'].append('    got:      ' + output_line)
+        results['expected_cmp'][1] = results['expected_cmp'][1] + 1
+        results['fail']["EXP CMP"].append(testpath)
+      else: #offset is None
+        printTest(results, "Compare Expected", True, "", expected)
+        results['expected_cmp'][0] = results['expected_cmp'][0] + 1
+        success = True
 
+  return success
 
-  #####################################################################
-  # Find all Oberon0 files within PATH_TO_TEST
-  #
-  # Files are located in tests/positive/L*/*.ob and tests/negative/L*/*_errors/*.ob
-  #
-  # Within the path, the following items are found:
-  #  * Location of the test
-  #  * Whether the test is positive or negative
-  #  * The level of the test (L1, L2, etc)
-  #####################################################################
-  for test_dir in glob.glob(os.path.join(PATH_TO_TEST, "*/positive/L*/*.ob*")):
-    if not '_pp' in test_dir and not '_lifted' in test_dir:
-      all_tests.append(test_dir)
-	
 
-  for test_dir in glob.glob(os.path.join(PATH_TO_TEST, "*/negative/*_errors/L*/*.ob*")):
-    if not '_pp' in test_dir and not '_lifted' in test_dir:
-      all_tests.append(test_dir)
+#######################################################################
+# Test manifest
+#
+# The tests found under PATH_TO_TEST are kept in MANIFEST with, for
+# each test:
+#  * path: the test itself, as found by glob
+#  * impl: the implementation it came with (tests/<impl>/...)
+#  * level: L1 ... L5
+#  * category: positive, parse_errors, name_errors or type_errors
+#  * error_line: the line of the expected error, from the N_ prefix of
+#    the file name, or None
+#  * companions: the .stdin and .expected files next to it
+#
+# The modification time of every directory is recorded with it.  Only
+# directories whose time has changed are scanned again, and the
+# directory layout itself is only globbed again if one of the
+# directories above the tests has changed.
+#######################################################################
+
+def byteStrings(value):
+  ## json gives back unicode; the rest of supertest.py uses str
+  if isinstance(value, unicode):
+    return str(value)
+  elif isinstance(value, list):
+    return [byteStrings(v) for v in value]
+  elif isinstance(value, dict):
+    return dict([(byteStrings(k), byteStrings(v)) for (k, v) in value.items()])
+  else:
+    return value
 
-  all_tests.sort()
 
-  #####################################################################
-  # Run each test
-  #####################################################################
-  print LEVEL
-  print TESTS
+def manifestDirectories(path_to_test):
+  ## Returns (layout, leaves): the directories above the tests and the
+  ## directories holding the tests
+  layout = [path_to_test]
+  layout.extend(glob.glob(os.path.join(path_to_test, "*")))
+  layout.extend(glob.glob(os.path.join(path_to_test, "*/positive")))
+  layout.extend(glob.glob(os.path.join(path_to_test, "*/negative")))
+  layout.extend(glob.glob(os.path.join(path_to_test, "*/negative/*_errors")))
+
+  leaves = glob.glob(os.path.join(path_to_test, "*/positive/L*"))
+  leaves.extend(glob.glob(os.path.join(path_to_test, "*/negative/*_errors/L*")))
+
+  return sorted([d for d in layout if os.path.isdir(d)]), sorted([d for d in leaves if os.path.isdir(d)])
+
+
+def scanDirectory(path_to_test, test_dir):
+  ## Manifest records for the tests in test_dir
+  parts = os.path.relpath(test_dir, path_to_test).split(os.sep)
+  records = []
+
+  for test in sorted(glob.glob(os.path.join(test_dir, "*.ob*"))):
+    if '_pp' in test or '_lifted' in test:
+      continue
+
+    name = os.path.basename(test)
+    base = os.path.splitext(test)[0]
+    m = re.match(r'(\d+)_', name)
+    error_line = None
+    if m:
+      error_line = int(m.group(1))
+
+    category = parts[1]
+    if category == 'negative':
+      category = parts[2]
+
+    records.append({'path': test,
+                    'impl': parts[0],
+                    'level': parts[-1],
+                    'category': category,
+                    'error_line': error_line,
+                    'companions': [os.path.basename(base + ext) for ext in ['.stdin', '.expected'] if os.path.exists(base + ext)]})
+
+  return records
+
+
+def loadManifest(path_to_test):
+  ## All tests under path_to_test, as manifest records sorted by path
+  manifest = {'path_to_test': path_to_test, 'layout': {}, 'leaves': {}}
+  try:
+    f = open(MANIFEST)
+    try:
+      manifest = byteStrings(json.load(f))
+    finally:
+      f.close()
+  except (IOError, ValueError):
+    pass
+
+  if manifest.get('path_to_test') != path_to_test:
+    manifest = {'path_to_test': path_to_test, 'layout': {}, 'leaves': {}}
+
+  changed = False
+  layout = manifest['layout']
+  for d in layout.keys():
+    if not os.path.isdir(d) or os.path.getmtime(d) != layout[d]:
+      changed = True
+
+  if changed or not layout:
+    layout_dirs, leaf_dirs = manifestDirectories(path_to_test)
+    manifest['layout'] = dict([(d, os.path.getmtime(d)) for d in layout_dirs])
+    changed = True
+  else:
+    leaf_dirs = sorted(manifest['leaves'].keys())
+
+  leaves = {}
+  for d in leaf_dirs:
+    leaf = manifest['leaves'].get(d)
+    if not os.path.isdir(d):
+      changed = True
+      continue
+    if not leaf or leaf['mtime'] != os.path.getmtime(d):
+      leaf = {'mtime': os.path.getmtime(d), 'tests': scanDirectory(path_to_test, d)}
+      changed = True
+    leaves[d] = leaf
+  manifest['leaves'] = leaves
+
+  if changed:
+    writeStateFile(MANIFEST, json.dumps(manifest, indent=1, sort_keys=True))
+
+  records = []
+  for d in leaves:
+    records.extend(leaves[d]['tests'])
+  records.sort(key=lambda record: record['path'])
+
+  return records
+
+
+def writeStateFile(path, text):
+  ## Replace a file in STATE_DIR, even with other runs going on
+  if not os.path.isdir(STATE_DIR):
+    try:
+      os.makedirs(STATE_DIR)
+    except OSError:
+      pass
+  temp = path + '.' + str(os.getpid())
+  f = open(temp, 'w')
+  try:
+    f.write(text)
+  finally:
+    f.close()
+  os.rename(temp, path)
+
+
+def filterManifest(records, impls, levels, categories, pattern, only_failed):
+  ## Narrow down the manifest with the selection options from main
+  selected = []
+
+  failed = None
+  if only_failed:
+    failed = set()
+    if os.path.exists(LAST_FAILED):
+      failed = set(open(LAST_FAILED).read().split('\n'))
+
+  for record in records:
+    if impls and record['impl'] not in impls:
+      continue
+    if levels and record['level'] not in levels:
+      continue
+    if categories and record['category'] not in categories:
+      continue
+    if pattern and not re.search(pattern, record['path']):
+      continue
+    if failed is not None and record['path'] not in failed:
+      continue
+    selected.append(record)
+
+  return selected
+
+
+def selectTests(all_tests):
+  ## Pick the tests that LEVEL and TESTS ask for.
+  ## Returns a list of (test_kind, testpath) jobs for runBatch.
+  jobs = []
+
   for test in all_tests:
     dirname = os.path.dirname(test)
 
@@ -534,44 +1241,3160 @@ def main():
           if not ('L3' in dirname and 'L5' in LEVEL):
             ## T1 -> run tests in parse_errors
             if 'T1' in TESTS and 'parse_errors' in dirname:
-              runParseTest(test, results)
-  
+              jobs.append(('parse', test))
+
             ## T2 -> run tests in name_errors
             elif 'T2' in TESTS and 'name_errors' in dirname:
-              runNameTypeTest(test, results)
-            
+              jobs.append(('name_type', test))
+
             ## T3 -> run tests in type_errors
             elif 'T3' in TESTS and 'type_errors' in dirname:
-              runNameTypeTest(test, results)
+              jobs.append(('name_type', test))
 
         elif 'positive' in dirname:
-          i = 0
-          done = False
-          while i < len(LEVEL) and not done:
-            if LEVEL[i] in dirname:
-              done = True
-              success = runPositiveTest(test, results)
-
-              ## if base test succeeds and -codegen in args
-              if success and (not REFERENCE_COMPILER) and (CODEGEN or 'T5a' in TESTS):
-                splitext = os.path.splitext(test)
-                test_lifted = splitext[0] + '_lifted' + splitext[1]
-                test_lifted_lifted = splitext[0] + '_lifted_lifted' + splitext[1]
-
-                ## run the compiler on file_lifted.ob(0?), check for no errors
-                lifted_success = runPositiveTest(test_lifted, results)
-                if not NO_LIFTED and lifted_success:
-                  compareLifted(test_lifted, test_lifted_lifted, results)
-
-                ## run gcc on file.c, check for zero value return code
-                test_c = splitext[0] + '.c'
-                runCCode(test_c, results)
-            i += 1
+          jobs.append(('positive', test))
 
         else: # 'negative' not in test and 'positive' not in test
           print "Supertest error, Unknown test:", test
 
-  printResults(results)
+  return jobs
+
+
+#######################################################################
+# Stages of a test
+#
+# Each stage takes the state of a test, {'job': job, 'results': results}
+# as it is left by the stage before, and returns whether the stages
+# after it are to be run.  Only positive tests with codegen go beyond
+# the frontend.
+#######################################################################
+
+def codegenPaths(test):
+  ## The files the compiler makes from test, and that later stages use
+  splitext = os.path.splitext(test)
+  return {'lifted': splitext[0] + '_lifted' + splitext[1],
+          'lifted_lifted': splitext[0] + '_lifted_lifted' + splitext[1],
+          'c': splitext[0] + '.c'}
+
+
+def stageFrontend(state):
+  ## Run the compiler on the test itself
+  test_kind, test = state['job']
+  results = state['results']
+
+  if test_kind == 'parse':
+    runParseTest(test, results)
+    return False
+
+  elif test_kind == 'name_type':
+    runNameTypeTest(test, results)
+    return False
+
+  else: # test_kind == 'positive'
+    success = runPositiveTest(test, results)
+
+    ## if base test succeeds and -codegen in args
+    return success and (not REFERENCE_COMPILER) and (CODEGEN or 'T5a' in TESTS)
+
+
+def stageLifted(state):
+  ## run the compiler on file_lifted.ob(0?), check for no errors
+  test_kind, test = state['job']
+  paths = codegenPaths(test)
+
+  lifted_success = runPositiveTest(paths['lifted'], state['results'])
+  if not NO_LIFTED and lifted_success:
+    compareLifted(paths['lifted'], paths['lifted_lifted'], state['results'])
+
+  ## The C code is tried whatever happened to the lifted code
+  return True
+
+
+def stageCompileC(state):
+  ## run gcc on file.c, check for zero value return code
+  test_kind, test = state['job']
+  return compileCCode(codegenPaths(test)['c'], state['results'])
+
+
+def stageRunC(state):
+  ## run file.a, compare its output with file.expected
+  test_kind, test = state['job']
+  runCCode(codegenPaths(test)['c'], state['results'])
+  return False
+
+
+STAGES = [stageFrontend, stageLifted, stageCompileC, stageRunC]
+
+
+#######################################################################
+# Pipeline (--pipeline F,L,C,R)
+#
+# Rather than each test running its STAGES one after another, every
+# stage gets a queue and a pool of worker threads of its own: F for the
+# frontend, L for the lifted round trip, C for gcc and R for running
+# the programs.  gcc for one test then overlaps with compiling the
+# next, while the JVM bound and gcc bound stages each get as much
+# concurrency as suits them.  Results are handed back in test order.
+# The pipeline takes the place of -j and --batch, which can't be given
+# with it.
+#######################################################################
+
+def pipelineWorker(stage, inbox, outbox, done):
+  while True:
+    state = inbox.get()
+    if state is None:
+      break
+
+    try:
+      go_on = STAGES[stage](state)
+    except Exception:
+      ## Don't lose the test, show what went wrong with it instead
+      state['results']['log'].extend(traceback.format_exc().splitlines())
+      go_on = False
+
+    if go_on and outbox:
+      outbox.put(state)
+    else:
+      done.put(state)
+
+
+def runPipeline(jobs):
+  ## Run jobs through a pipeline, yielding their results in order
+  queues = [Queue.Queue() for stage in STAGES]
+  done = Queue.Queue()
+  workers = []
+
+  for stage in range(len(STAGES)):
+    outbox = None
+    if stage + 1 < len(STAGES):
+      outbox = queues[stage + 1]
+    for i in range(PIPELINE[stage]):
+      worker = threading.Thread(target=pipelineWorker, args=(stage, queues[stage], outbox, done))
+      worker.daemon = True
+      worker.start()
+      workers.append((stage, worker))
+
+  for index in range(len(jobs)):
+    results = None
+    if CACHE:
+      results = loadCachedResults(jobs[index])
+
+    if results is None:
+      state = {'index': index, 'job': jobs[index], 'results': newResults()}
+      if SANDBOX:
+        state['sandbox'], [state['job']] = openSandbox([jobs[index]])
+      queues[0].put(state)
+    else:
+      done.put({'index': index, 'job': jobs[index], 'results': results, 'cached': True})
+
+  ## Hold back results that overtake the ones before them
+  finished = {}
+  next_index = 0
+  try:
+    while next_index < len(jobs):
+      state = done.get()
+      if 'sandbox' in state:
+        closeSandbox(state['sandbox'], [jobs[state['index']]], [state['results']])
+      if CACHE and not state.get('cached'):
+        storeCachedResults(jobs[state['index']], state['results'])
+      finished[state['index']] = state['results']
+
+      while next_index in finished:
+        yield finished.pop(next_index)
+        next_index += 1
+  finally:
+    ## When stopped early, as by --fail-fast, drop the tests not started
+    def dropStates(queue):
+      try:
+        while True:
+          state = queue.get_nowait()
+          if state and 'sandbox' in state:
+            shutil.rmtree(state['sandbox'], True)
+      except Queue.Empty:
+        pass
+
+    for queue in queues:
+      dropStates(queue)
+
+    for stage, worker in workers:
+      queues[stage].put(None)
+    for stage, worker in workers:
+      worker.join()
+
+    ## and those that were under way, which may have been handed on to
+    ## a stage whose workers had already stopped
+    for queue in queues + [done]:
+      dropStates(queue)
+
+
+#######################################################################
+# Batch compilation (--batch N)
+#
+# Up to N tests from the same directory are given to a single run of
+# COMMAND, as in "COMMAND a.ob b.ob c.ob".  The compiler must start the
+# output of each file with a line
+#
+#   ==> a.ob <==
+#
+# on stdout, and on stderr too if it writes anything there.  The output
+# between markers is then treated as if it came from a run of COMMAND
+# on that file alone.  If a batch crashes, that is some file has no
+# marker, there is output before the first marker, or the compiler is
+# killed by a signal, its tests are compiled one file at a time, and so
+# are all tests after it: a compiler that does not follow the protocol
+# would only pay for each batch twice.  ob0_batch.py adapts any COMMAND
+# to the protocol, as in "--batch N python $PWD/ob0_batch.py COMMAND";
+# like COMMAND, it is run from within the directory of the tests.
+#######################################################################
+
+## Set once a batch has crashed, in every process of the run
+_batch_failed = multiprocessing.Value('b', 0)
+
+def batchTests(jobs):
+  ## Group consecutive jobs from selectTests by directory, BATCH at most
+  batches = []
+
+  for job in jobs:
+    test_kind, test = job
+    if batches and len(batches[-1]) < BATCH and os.path.dirname(batches[-1][0][1]) == os.path.dirname(test):
+      batches[-1].append(job)
+    else:
+      batches.append([job])
+
+  return batches
+
+
+def splitBatchOutput(lines, names, required):
+  ## Split the lines of a batch's output on the ==> name <== markers.
+  ## Returns {name: lines}, or None if the lines can't be split up.
+  parts = {}
+  current = None
+
+  for line in lines:
+    m = re.match(r'==> (.*) <==$', line.rstrip('\r\n'))
+    if m and m.group(1) in names:
+      current = m.group(1)
+      parts[current] = []
+    elif current is None:
+      ## Output that belongs to no file
+      return None
+    else:
+      parts[current].append(line)
+
+  if required and len(parts) != len(names):
+    return None
+
+  for name in names:
+    parts.setdefault(name, [])
+
+  return parts
+
+
+def compileBatch(testpaths):
+  ## Compile testpaths, all in one directory, with a single run of
+  ## COMMAND.  Their outputs are left in _precompiled for runCompiler.
+  ## Output to split is only ever that of one test.
+  if len(testpaths) < 2 or SPLIT_OUTPUT or _batch_failed.value:
+    return
+
+  test_dir = os.path.dirname(os.path.abspath(testpaths[0]))
+  names = [os.path.basename(testpath) for testpath in testpaths]
+
+  start = time.time()
+  outputs = subprocess.Popen(RUN_COMMAND + ' ' + ' '.join(names), shell=True, cwd=test_dir,
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, preexec_fn=childGroup)
+
+  ## Each file may take as long as if compiled alone, and each may write
+  ## as much
+  timeout = TIMEOUTS['compile'] and TIMEOUTS['compile'] * len(testpaths)
+  stdout_data, stderr_data, timing = captureOutput(outputs, start, timeout, None, CAPTURE_LIMIT * len(testpaths))
+
+  ## Each file is taken to have cost an equal share of the batch
+  for key in ['wall', 'user', 'sys']:
+    timing[key] = timing[key] / len(testpaths)
+  timing['batch'] = len(testpaths)
+
+  stdout_parts = splitBatchOutput(cStringIO.StringIO(stdout_data).readlines(), names, True)
+  stderr_parts = splitBatchOutput(cStringIO.StringIO(stderr_data).readlines(), names, False)
+
+  if stdout_parts is None or stderr_parts is None or outputs.returncode < 0 or timing.get('timeout'):
+    ## The batch crashed, leave its tests and all later ones to be
+    ## compiled one at a time
+    _batch_failed.get_lock().acquire()
+    try:
+      first = not _batch_failed.value
+      _batch_failed.value = 1
+    finally:
+      _batch_failed.get_lock().release()
+    if first:
+      print 'Warning: a batch of COMMAND crashed in', test_dir + ', compiling one file at a time from now on'
+    return
+
+  for testpath, name in zip(testpaths, names):
+    _precompiled[os.path.abspath(testpath)] = (stdout_parts[name], stderr_parts[name], timing)
+
+
+def runBatch(batch):
+  ## Run a group of jobs from batchTests, replaying cached results when
+  ## possible.  Returns a list of results, one for each job.
+  results = [None] * len(batch)
+  if CACHE:
+    results = [loadCachedResults(job) for job in batch]
+
+  todo = [job for (job, result) in zip(batch, results) if result is None]
+  run = todo
+  sandbox = None
+  if SANDBOX and todo:
+    sandbox, run = openSandbox(todo)
+  states = [{'job': job, 'results': newResults()} for job in run]
+
+  try:
+    compileBatch([test for (test_kind, test) in run])
+
+    ## The _lifted.ob files of positive tests that pass are a batch too
+    if not REFERENCE_COMPILER and (CODEGEN or 'T5a' in TESTS):
+      lifted = []
+      for test_kind, test in run:
+        if test_kind == 'positive' and os.path.abspath(test) in _precompiled and runPositiveTest(test, newResults()):
+          test_lifted = codegenPaths(test)['lifted']
+          if os.path.exists(test_lifted):
+            lifted.append(test_lifted)
+      compileBatch(lifted)
+
+    ## Each stage is run for the whole batch before the next, so that the
+    ## .c files of the batch can be built together
+    going = states
+    for stage in STAGES:
+      if stage == stageCompileC:
+        buildExecutables([codegenPaths(state['job'][1])['c'] for state in going])
+      going = [state for state in going if stage(state)]
+  finally:
+    if sandbox:
+      closeSandbox(sandbox, todo, [state['results'] for state in states])
+
+  for job, state in zip(todo, states):
+    results[batch.index(job)] = state['results']
+    if CACHE:
+      storeCachedResults(job, state['results'])
+
+  _precompiled.clear()
+  _prebuilt.clear()
+
+  return results
+
+
+def runJobs(jobs, pool):
+  ## Run jobs through the pipeline, the pool or one at a time, yielding
+  ## each (job, results) in the order of jobs
+  if PIPELINE:
+    batch_results = ([test_result] for test_result in runPipeline(jobs))
+  elif pool:
+    batch_results = pool.imap(runBatch, batchTests(jobs))
+  else:
+    batch_results = itertools.imap(runBatch, batchTests(jobs))
+
+  done = 0
+  try:
+    for test_results in batch_results:
+      for test_result in test_results:
+        yield jobs[done], test_result
+        done += 1
+  finally:
+    if hasattr(batch_results, 'close'):
+      batch_results.close()
+
+
+#######################################################################
+# Sandboxes (--no-sandbox, --sandbox-dir DIR, --keep-failed)
+#
+# Each batch of tests, a single test unless --batch is given, is run in
+# a sandbox of its own: a new directory under --sandbox-dir, /dev/shm by
+# default, holding links to the tests and their .stdin and .expected
+# files, or copies of them across file systems, under the same path as
+# in the tree, e.g. tests/silver/positive/L1/.  Whatever the compiler,
+# gcc and the programs write is left there, not in the test tree, so
+# runs of different artifacts don't clobber each other, and the small
+# files are written to memory rather than to disk.  The paths in the
+# results are those of the tests in the tree, as without sandboxes.
+#
+# Sandboxes are removed as soon as their tests are done.  With
+# --keep-failed, that of a test that failed is first copied to
+# FAILED_DIR, under the test's path, after FAILED_DIR is cleared at the
+# start of the run.  Sandboxes left by runs that were killed are
+# removed by the next run, see clearSandboxes.
+#######################################################################
+
+FAILED_DIR = os.path.join(STATE_DIR, 'failed')
+
+
+def sandboxPath(directory):
+  ## Where the tests of directory go within a sandbox: their path from
+  ## here, less any leading ../
+  return re.sub(r'^(\.\.[/\\])+', '', os.path.relpath(directory))
+
+
+def openSandbox(jobs):
+  ## Make a sandbox for jobs, all from one directory.  Returns the
+  ## sandbox and the jobs as found in it.
+  sandbox = tempfile.mkdtemp(prefix='supertest-%d-' % os.getpid(), dir=SANDBOX_DIR)
+  test_dir = os.path.join(sandbox, sandboxPath(os.path.dirname(jobs[0][1])))
+
+  sandbox_jobs = []
+  for test_kind, test in jobs:
+    base = os.path.splitext(test)[0]
+    sandbox_base = os.path.join(test_dir, os.path.basename(base))
+    for ext in [os.path.splitext(test)[1], '.stdin', '.expected']:
+      if os.path.exists(base + ext):
+        shareFile(base + ext, sandbox_base + ext)
+    sandbox_jobs.append((test_kind, sandbox_base + os.path.splitext(test)[1]))
+
+  return sandbox, sandbox_jobs
+
+
+def closeSandbox(sandbox, jobs, results):
+  ## Give the results of jobs, run in sandbox, the paths of the tests
+  ## in the tree, keep the sandbox if asked to and a test failed, and
+  ## remove it
+  test_dir = os.path.dirname(jobs[0][1])
+  inside = os.path.join(sandbox, sandboxPath(test_dir), '')
+  outside = os.path.join(test_dir, '')
+
+  for test_results in results:
+    test_results['log'] = [line.replace(inside, outside) for line in test_results['log']]
+    for fail_group in test_results['fail']:
+      test_results['fail'][fail_group] = [path.replace(inside, outside) for path in test_results['fail'][fail_group]]
+    for timing in test_results['timing']:
+      timing['path'] = timing['path'].replace(inside, outside)
+
+  if KEEP_FAILED and [test_results for test_results in results if countFailures(test_results)]:
+    kept = os.path.join(FAILED_DIR, sandboxPath(test_dir))
+    for directory, subdirectories, names in os.walk(inside):
+      for name in names:
+        path = os.path.join(directory, name)
+        shareFile(path, os.path.join(kept, os.path.relpath(path, inside)))
+
+  shutil.rmtree(sandbox, True)
+
+
+def clearSandboxes():
+  ## Remove the sandboxes of runs that are no longer running
+  for sandbox in glob.glob(os.path.join(SANDBOX_DIR, 'supertest-*-*')):
+    m = re.match(r'supertest-(\d+)-', os.path.basename(sandbox))
+    if not m:
+      continue
+    try:
+      os.kill(int(m.group(1)), 0)
+    except OSError, e:
+      if e.errno == errno.ESRCH:
+        shutil.rmtree(sandbox, True)
+
+
+#######################################################################
+# Result cache (--no-cache, --cache-size MB, --cache-key-file FILE)
+#
+# The results of a test are stored under a hash of the test's source,
+# its .stdin and .expected files, the compiler command, the contents of
+# the files that command names, and the settings that choose which
+# stages run.  When none of these have changed the stored results are
+# replayed instead of running the compiler, gcc and the executable.
+# Entries are evicted least recently used first, see trimCache.
+#
+# Only files named in COMMAND itself are hashed.  A wrapper script, as
+# in simpl_a1, is hashed, but not the jar or executable it starts, so
+# a rebuilt compiler would replay stale results.  Give each such file
+# with --cache-key-file FILE, as often as needed, or use --no-cache.
+# --watch watches these files too.
+#######################################################################
+
+def takeOption(name):
+  ## Remove "name value" or "name=value" from sys.argv and return value
+  for i in range(1, len(sys.argv)):
+    if sys.argv[i] == name and i + 1 < len(sys.argv):
+      value = sys.argv[i + 1]
+      del sys.argv[i:i + 2]
+      return value
+    elif sys.argv[i].startswith(name + '='):
+      value = sys.argv[i][len(name) + 1:]
+      del sys.argv[i]
+      return value
+  return None
+
+
+def hashFile(path, digest):
+  ## Add the contents of path to digest
+  f = open(path, 'rb')
+  try:
+    chunk = f.read(65536)
+    while chunk:
+      digest.update(chunk)
+      chunk = f.read(65536)
+  finally:
+    f.close()
+
+
+def commandFiles():
+  ## Every file named by COMMAND (jars, scripts, class path entries and
+  ## the executable), gcc, and the CACHE_KEY_FILES
+  words = COMMAND.split()
+  paths = list(CACHE_KEY_FILES)
+  for word in words:
+    paths.extend(word.split(':'))
+  for executable in words[:1] + ['gcc']:
+    found = distutils.spawn.find_executable(executable)
+    if found:
+      paths.append(found)
+
+  return [path for path in paths if os.path.isfile(path)]
+
+
+def commandDigest():
+  ## Hash COMMAND, the stage settings, and the files it uses
+  digest = hashlib.sha1(repr((COMMAND, REFERENCE_COMPILER, CODEGEN, NO_LIFTED, TESTS, GCC_FLAGS, SPLIT_OUTPUT)))
+
+  for path in commandFiles():
+    digest.update(path)
+    hashFile(path, digest)
+
+  return digest.hexdigest()
+
+
+def testDigest(job):
+  ## Hash a job from selectTests together with its input files
+  test_kind, test = job
+  digest = hashlib.sha1(_command_digest)
+  digest.update(repr(job))
+
+  base = os.path.splitext(test)[0]
+  for path in [test, base + '.stdin', base + '.expected']:
+    if os.path.exists(path):
+      digest.update(os.path.splitext(path)[1])
+      hashFile(path, digest)
+    else:
+      digest.update(os.path.splitext(path)[1] + ' missing')
+
+  return digest.hexdigest()
+
+
+def loadCachedResults(job):
+  ## The stored results of job, or None if there are none
+  entry = os.path.join(CACHE_DIR, testDigest(job))
+
+  try:
+    f = open(entry, 'rb')
+    try:
+      results = cPickle.load(f)
+    finally:
+      f.close()
+    ## Mark as recently used for trimCache
+    os.utime(entry, None)
+  except (IOError, OSError, EOFError, cPickle.UnpicklingError):
+    return None
+
+  results['cached'] = [1, 0]
+  return results
+
+
+def storeCachedResults(job, results):
+  results['cached'] = [0, 1]
+  ## A test that ran out of time may not another time
+  if not results['fail'].get('TIMEOUT'):
+    writeCacheEntry(CACHE_DIR, os.path.join(CACHE_DIR, testDigest(job)), results)
+
+
+def writeCacheEntry(directory, entry, value):
+  ## Write to a private name first so that a parallel run never reads
+  ## a half written entry
+  if not os.path.isdir(directory):
+    try:
+      os.makedirs(directory)
+    except OSError:
+      pass
+  temp = entry + '.' + str(os.getpid()) + '.' + str(threading.current_thread().ident)
+  f = open(temp, 'wb')
+  try:
+    cPickle.dump(value, f, cPickle.HIGHEST_PROTOCOL)
+  finally:
+    f.close()
+  os.rename(temp, entry)
+
+
+def trimCache(directory, limit):
+  ## Evict the least recently used entries until directory fits in limit
+  if not os.path.isdir(directory):
+    return
+
+  ## Another run may be trimming too, or replacing an entry; whatever
+  ## is gone already is skipped
+  entries = []
+  for name in os.listdir(directory):
+    path = os.path.join(directory, name)
+    try:
+      stat = os.stat(path)
+    except OSError, e:
+      if e.errno != errno.ENOENT:
+        raise
+      continue
+    entries.append((stat.st_mtime, stat.st_size, path))
+  entries.sort()
+
+  total = sum([entry[1] for entry in entries])
+  while total > limit and entries:
+    mtime, size, path = entries.pop(0)
+    try:
+      os.remove(path)
+    except OSError, e:
+      if e.errno != errno.ENOENT:
+        raise
+    total -= size
+
+
+#######################################################################
+# gcc cache (--gcc-flags FLAGS, --gcc-jobs N, --no-gcc-cache)
+#
+# The executable gcc makes from a .c file is kept in GCC_CACHE_DIR under
+# a hash of the .c file, the local files it #includes, the gcc version
+# and GCC_FLAGS, together with gcc's messages and exit code.  When the
+# compiler's front end changes but its C output does not, the
+# executable is copied from the cache instead of built again.  Entries
+# are evicted least recently used first beyond GCC_CACHE_SIZE.
+#
+# --gcc-flags sets the flags, such as -O0 for quick builds or -O2 to
+# time the programs.  With --batch, --gcc-jobs N builds the .c files of
+# a batch together, N gcc runs at a time, before they are tested.
+#######################################################################
+
+GCC_CACHE_DIR = os.path.join(STATE_DIR, 'gcc')
+
+## Quoted #include lines, whose files are part of what gcc is given
+LOCAL_INCLUDE = re.compile(r'^\s*#\s*include\s*"([^"]+)"', re.MULTILINE)
+
+
+def gccIdentity():
+  ## The version and target of gcc, worked out once per process
+  global _gcc_identity
+  if _gcc_identity is None:
+    outputs = subprocess.Popen('gcc --version; gcc -dumpmachine', shell=True,
+                               stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    _gcc_identity = outputs.communicate()[0]
+  return _gcc_identity
+
+
+def gccDigest(c_path):
+  ## Hash of everything the executable built from c_path depends on
+  digest = hashlib.sha1(repr((gccIdentity(), GCC_FLAGS)))
+
+  f = open(c_path, 'rb')
+  try:
+    source = f.read()
+  finally:
+    f.close()
+  digest.update(source)
+
+  for include in sorted(set(LOCAL_INCLUDE.findall(source))):
+    include_path = os.path.join(os.path.dirname(c_path), include)
+    digest.update(include)
+    if os.path.isfile(include_path):
+      hashFile(include_path, digest)
+
+  return digest.hexdigest()
+
+
+def buildExecutable(c_path):
+  ## Build the executable compileCCode expects next to c_path.  Returns
+  ## (exit code, gcc's messages, timing).
+  c_path = os.path.abspath(c_path)
+  if c_path in _prebuilt:
+    return _prebuilt.pop(c_path)
+
+  test_dir = os.path.dirname(c_path)
+  testname = os.path.basename(c_path)
+  executable = os.path.join(test_dir, os.path.splitext(testname)[0] + '.a')
+
+  start = time.time()
+  entry = None
+  if GCC_CACHE:
+    entry = os.path.join(GCC_CACHE_DIR, gccDigest(c_path))
+    try:
+      f = open(entry, 'rb')
+      try:
+        exit_code, messages = cPickle.load(f)
+      finally:
+        f.close()
+      if exit_code == 0:
+        shareFile(entry + '.a', executable)
+      os.utime(entry, None)
+      return exit_code, messages, {'wall': time.time() - start, 'user': None, 'sys': None, 'maxrss': None, 'cached': True}
+    except (IOError, OSError, EOFError, ValueError, cPickle.UnpicklingError):
+      pass
+
+  ## gcc's own messages are kept with this test's log so that they
+  ## stay in order when tests run in parallel
+  gcc = subprocess.Popen('gcc ' + GCC_FLAGS + ' ' + testname + ' -o ' + os.path.basename(executable), shell=True,
+                         cwd=test_dir, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, preexec_fn=childGroup)
+  gcc_output, unused, timing = captureOutput(gcc, start, TIMEOUTS['gcc'])
+  messages = [line.rstrip('\n') for line in cStringIO.StringIO(gcc_output).readlines()]
+
+  if entry and not timing.get('timeout'):
+    if gcc.returncode == 0:
+      shareFile(executable, entry + '.a')
+    writeCacheEntry(GCC_CACHE_DIR, entry, (gcc.returncode, messages))
+
+  return gcc.returncode, messages, timing
+
+
+def shareFile(source, target):
+  ## Replace target with a hard link to source, or a copy of it across
+  ## file systems.  Executables are never written by this process where
+  ## it can be helped: a child started by another thread meanwhile
+  ## would inherit the open file, and running it would then fail with
+  ## ETXTBSY.  gcc replaces its output file rather than writing into
+  ## it, so the cached executable is left alone.
+  if not os.path.isdir(os.path.dirname(target)):
+    try:
+      os.makedirs(os.path.dirname(target))
+    except OSError:
+      pass
+  temp = target + '.' + str(os.getpid()) + '.' + str(threading.current_thread().ident)
+
+  try:
+    os.link(source, temp)
+  except OSError, e:
+    if e.errno != errno.EXDEV:
+      raise
+    f = open(source, 'rb')
+    try:
+      fd = os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0755)
+      fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+      try:
+        chunk = f.read(65536)
+        while chunk:
+          os.write(fd, chunk)
+          chunk = f.read(65536)
+      finally:
+        os.close(fd)
+    finally:
+      f.close()
+
+  os.rename(temp, target)
+
+
+def buildExecutables(c_paths):
+  ## Build c_paths GCC_JOBS at a time, leaving the outcomes in _prebuilt
+  ## for buildExecutable
+  c_paths = [os.path.abspath(c_path) for c_path in c_paths if os.path.exists(c_path)]
+  if GCC_JOBS < 2 or len(c_paths) < 2:
+    return
+
+  todo = Queue.Queue()
+  for c_path in c_paths:
+    todo.put(c_path)
+
+  def worker():
+    while True:
+      try:
+        c_path = todo.get_nowait()
+      except Queue.Empty:
+        return
+      _prebuilt[c_path] = buildExecutable(c_path)
+
+  workers = [threading.Thread(target=worker) for i in range(min(GCC_JOBS, len(c_paths)))]
+  for thread in workers:
+    thread.start()
+  for thread in workers:
+    thread.join()
+
+
+#######################################################################
+# Class data sharing (--no-cds, --jvm-flags FLAGS)
+#
+# A COMMAND that runs java on jars, with -jar or -classpath, starts a
+# new JVM for every test, which loads and verifies the same classes
+# every time.  Instead, the first run trains an AppCDS archive of those
+# classes, kept in CDS_DIR under a hash of the jars, the java version and
+# JVM_FLAGS, by compiling the largest positive test selected once with
+# -XX:ArchiveClassesAtExit.  COMMAND is then run with the archive, and
+# JVM_FLAGS, which make a short lived JVM start faster:
+#
+#   java -XX:SharedArchiveFile=... JVM_FLAGS -jar compiler.jar
+#
+# When a jar changes, so does the hash, and a new archive is trained.
+# If the JVM can't make an archive (before Java 13), or its output on
+# the training test is not the same with the archive as without it, a
+# note is kept in CDS_DIR instead, and only JVM_FLAGS are given.  The
+# same goes for every compiler of --diff.  Commands that start java
+# from a script of their own are left alone.  Only RUN_COMMAND has the
+# archive in it: the history and cached results of COMMAND are kept
+# under COMMAND as given, whichever archive it is run with.  --bench,
+# --perf-baseline and --runtime-bench time COMMAND as it is run, and
+# show and record that, so a compiler can be timed as it is shipped with
+# --no-cds --jvm-flags ''.  --watch trains a new archive when a jar
+# changes.
+#######################################################################
+
+CDS_DIR = os.path.join(STATE_DIR, 'cds')
+CDS_SIZE = 512 * 1024 * 1024
+
+## Flags that suit a JVM run for a second or two: no optimizing JIT, a
+## simple collector and no shared performance counters (--jvm-flags)
+JVM_FLAGS = '-XX:TieredStopAtLevel=1 -XX:+UseSerialGC -XX:-UsePerfData'
+
+## The JVM says nothing of archives it can't use, on the outputs tested
+CDS_FLAGS = '-Xshare:auto -Xlog:cds=off -Xlog:cds+dynamic=off'
+
+
+def javaClassPath(command):
+  ## The jars command runs java on, or None if it doesn't run java or
+  ## the class path has anything but jars in it, which CDS can't archive
+  words = command.split()
+  if not words or os.path.basename(words[0]) != 'java':
+    return None
+
+  jars = None
+  i = 1
+  while i < len(words):
+    if words[i] == '-jar' and i + 1 < len(words):
+      jars = [words[i + 1]]
+      break
+    elif words[i] in ['-cp', '-classpath', '--class-path'] and i + 1 < len(words):
+      jars = [jar for jar in words[i + 1].split(':') if jar]
+      i += 2
+    elif words[i].startswith('-'):
+      i += 1
+    else:
+      ## The main class, the rest is for it
+      break
+
+  if not jars or [jar for jar in jars if not os.path.isfile(jar)]:
+    return None
+  return jars
+
+
+def javaIdentity(java):
+  ## The java executable and its version, which archives are made for
+  outputs = subprocess.Popen(java + ' -version', shell=True, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+  return (distutils.spawn.find_executable(java) or java) + '\n' + outputs.communicate()[0]
+
+
+def trainingRun(command, job):
+  ## Run command on the test of job in a sandbox.  Returns its exit code,
+  ## stdout and stderr.
+  sandbox, [(test_kind, test)] = openSandbox([job])
+  try:
+    start = time.time()
+    child = subprocess.Popen(command + ' ' + os.path.basename(test), shell=True, cwd=os.path.dirname(test),
+                             stdout=subprocess.PIPE, stderr=subprocess.PIPE, preexec_fn=childGroup)
+    stdout_data, stderr_data, timing = captureOutput(child, start, TIMEOUTS['compile'])
+    return child.returncode, stdout_data, stderr_data
+  finally:
+    shutil.rmtree(sandbox, True)
+
+
+def archiveCommand(command, jobs):
+  ## command, if it runs java on jars, with JVM_FLAGS and the archive of
+  ## its jars, trained on one of jobs if there is none yet
+  jars = javaClassPath(command)
+  if not jars or not jobs or 'SharedArchiveFile=' in command:
+    return command
+  java, rest = command.split(None, 1)
+  tuned = ' '.join([java] + JVM_FLAGS.split() + [rest])
+
+  digest = hashlib.sha1(javaIdentity(java))
+  digest.update(JVM_FLAGS)
+  for jar in jars:
+    hashFile(jar, digest)
+  archive = os.path.join(CDS_DIR, digest.hexdigest() + '.jsa')
+  unusable = os.path.splitext(archive)[0] + '.unusable'
+
+  def sharing(path):
+    return ' '.join([java, '-XX:SharedArchiveFile=' + path] + CDS_FLAGS.split() + JVM_FLAGS.split() + [rest])
+
+  if os.path.exists(unusable):
+    return tuned
+
+  if not os.path.exists(archive):
+    ## Train on the largest positive test, which should load the most
+    positives = [job for job in jobs if job[0] == 'positive'] or jobs
+    job = max(positives, key=lambda job: os.path.getsize(job[1]))
+    print 'Training a class data sharing archive for', ' '.join(jars), 'on', job[1]
+
+    if not os.path.isdir(CDS_DIR):
+      os.makedirs(CDS_DIR)
+    temp = archive + '.' + str(os.getpid())
+    trained = trainingRun(' '.join([java, '-XX:ArchiveClassesAtExit=' + temp] + CDS_FLAGS.split() + JVM_FLAGS.split() + [rest]), job)
+
+    if not os.path.exists(temp) or trainingRun(sharing(temp), job)[1:] != trainingRun(tuned, job)[1:]:
+      print 'Class data sharing is not available for', ' '.join(jars) + ', see', unusable
+      writeStateFile(unusable, trained[2])
+      if os.path.exists(temp):
+        os.remove(temp)
+      return tuned
+    os.rename(temp, archive)
+
+  os.utime(archive, None)
+  return sharing(archive)
+
+
+def shareClasses(compilers, jobs):
+  ## The compilers of diffCompilers, with archives of their classes
+  if CDS:
+    for compiler in compilers:
+      compiler['run'] = archiveCommand(compiler.get('run', compiler['command']), jobs)
+  return compilers
+
+
+#######################################################################
+# Run history (--no-history, --fail-fast)
+#
+# HISTORY is a small SQLite database holding, for each COMMAND and
+# test, the number of runs and failures, whether the last run failed
+# and when a run last failed, and a running average of how long the
+# test takes.  Tests are run with the ones that failed last time first,
+# most recent failures first, then the longest first, so that parallel
+# workers are not left waiting on one slow test at the end.  Tests
+# grouped into one --batch stay together.  --no-history runs tests in
+# path order and leaves the database alone.  --fail-fast stops at the
+# first test to fail that passed, or had never run, before.
+#######################################################################
+
+HISTORY = os.path.join(STATE_DIR, 'history.sqlite')
+
+## Weight of the newest duration in the running average of a test
+HISTORY_WEIGHT = 0.5
+
+
+def openHistory():
+  if not os.path.isdir(STATE_DIR):
+    try:
+      os.makedirs(STATE_DIR)
+    except OSError:
+      pass
+
+  ## Parallel runs of supertest.py wait their turn to write
+  connection = sqlite3.connect(HISTORY, timeout=60)
+  connection.execute('CREATE TABLE IF NOT EXISTS history ('
+                     'command TEXT, kind TEXT, test TEXT, runs INTEGER, failures INTEGER, '
+                     'failed INTEGER, last_failure REAL, duration REAL, '
+                     'PRIMARY KEY (command, kind, test))')
+  return connection
+
+
+def loadHistory(connection):
+  ## {job: record} of the tests run with COMMAND before
+  history = {}
+  rows = connection.execute('SELECT kind, test, runs, failures, failed, last_failure, duration '
+                            'FROM history WHERE command = ?', (COMMAND,))
+  for kind, test, runs, failures, failed, last_failure, duration in rows:
+    history[(str(kind), str(test))] = {'runs': runs, 'failures': failures, 'failed': bool(failed),
+                                       'last_failure': last_failure, 'duration': duration}
+  return history
+
+
+def recordHistory(connection, history, job, results):
+  ## Add the results of job to the database.  Replayed results count as
+  ## a run, but their timings are old and leave the duration alone.
+  failed = countFailures(results) > 0
+  record = history.get(job, {'runs': 0, 'failures': 0, 'last_failure': None, 'duration': None})
+
+  duration = record['duration']
+  if results['cached'][0] == 0:
+    latest = sum([timing['wall'] for timing in results['timing']])
+    if duration is None:
+      duration = latest
+    else:
+      duration = HISTORY_WEIGHT * latest + (1 - HISTORY_WEIGHT) * duration
+
+  last_failure = record['last_failure']
+  if failed:
+    last_failure = time.time()
+
+  connection.execute('INSERT OR REPLACE INTO history VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                     (COMMAND, job[0], job[1], record['runs'] + 1, record['failures'] + int(failed),
+                      int(failed), last_failure, duration))
+
+
+def isNewFailure(history, job, results):
+  ## Whether job failed now but not the last time it ran
+  return countFailures(results) > 0 and not history.get(job, {}).get('failed')
+
+
+def scheduleJobs(jobs, history):
+  ## jobs in the order to run them, see above
+  def priority(batch):
+    known = [history[job] for job in batch if job in history]
+    failures = [record['last_failure'] or 0 for record in known if record['failed']]
+    duration = sum([record['duration'] or 0 for record in known])
+    return (not failures, -max(failures or [0]), -duration)
+
+  ## sorted is stable, so tests never run before stay in path order
+  batches = sorted(batchTests(jobs), key=priority)
+  return [job for batch in batches for job in batch]
+
+
+#######################################################################
+# Sharding (--shard I/N [--shard-costs FILE], --merge FILE...)
+#
+# --shard I/N runs the I-th of N parts of the selected tests, I from 1
+# to N, and writes its results as a JSON report (see writeJsonReport)
+# to --json FILE, or to .supertest/shard-I-of-N.json.  Every machine
+# running a shard must select the same tests with the same options, as
+# the parts are worked out from the selection alone: tests are dealt
+# out longest first, each to the part with the least work so far.
+# How long a test takes comes from --shard-costs FILE, a JSON report or
+# merged shards of an earlier run that all machines are given, else it
+# is estimated from the stages the test goes through.  The history
+# database is not used, as it differs from machine to machine.
+#
+#   python supertest.py --merge shard-1-of-4.json ... [--json FILE]
+#
+# combines the shard reports into the summary a single run would have
+# printed, and into one JSON report with --json.
+#######################################################################
+
+def estimateCost(job):
+  ## Relative cost of a job, counting the stages it goes through
+  test_kind, test = job
+  cost = 1.0
+  if test_kind == 'positive' and not REFERENCE_COMPILER and (CODEGEN or 'T5a' in TESTS):
+    ## The lifted round trip, then gcc and the program
+    cost += 2.0 + 3.0
+  return cost
+
+
+def loadShardCosts(path):
+  ## {job: seconds} from a JSON report
+  f = open(path)
+  try:
+    report = byteStrings(json.load(f))
+  finally:
+    f.close()
+  return dict([((test['kind'], test['path']), test['wall']) for test in report['results']])
+
+
+def shardJobs(jobs, index, count, costs):
+  ## The jobs of part index (1 to count), in the order of jobs
+  known = [costs[job] / estimateCost(job) for job in jobs if job in costs]
+  scale = percentile(known, 0.5) or 1.0
+
+  def cost(job):
+    if job in costs:
+      return costs[job]
+    return estimateCost(job) * scale
+
+  loads = [0.0] * count
+  part = {}
+  for job in sorted(jobs, key=lambda job: (-cost(job), job)):
+    least = loads.index(min(loads))
+    loads[least] += cost(job)
+    part[job] = least
+
+  return [job for job in jobs if part[job] == index - 1]
+
+
+def mergeShards(paths, json_report):
+  ## Print the summary of the shard reports at paths, as one run
+  global COMMAND
+  global LEVEL
+  global TESTS
+
+  results = newResults()
+  reports = []
+  shards = []
+  for path in paths:
+    f = open(path)
+    try:
+      report = byteStrings(json.load(f))
+    finally:
+      f.close()
+
+    part = newResults()
+    for test_type, totals in report['totals'].items():
+      part[test_type] = totals
+    mergeResults(results, part)
+    reports.extend(report['results'])
+    shards.append(report.get('shard'))
+
+    COMMAND, LEVEL, TESTS = report['command'], report['level'], report['tests']
+    print 'Shard', '%d/%d' % tuple(report['shard'] or [1, 1]) + ':', len(report['results']), 'tests from', path
+
+  ## In path order, as a run with --no-history would have them
+  for fail_group in results['fail']:
+    results['fail'][fail_group].sort()
+  reports.sort(key=lambda test: test['path'])
+
+  counts = set([shard and shard[1] for shard in shards])
+  if len(counts) == 1 and None not in counts:
+    missing = sorted(set(range(1, counts.pop() + 1)) - set([shard[0] for shard in shards]))
+    if missing:
+      print 'Warning: no results from shards', ', '.join([str(i) for i in missing])
+  else:
+    print 'Warning: these reports are not the shards of one run'
+
+  if json_report:
+    writeJsonReport(json_report, reports, results)
+
+  printResults(results)
+
+
+#######################################################################
+# Differential matrix (--diff [NAME=]COMMAND ... [--diff-json FILE])
+#
+# Runs several compilers on the same tests at once and compares them,
+# e.g. two implementations against the reference compiler:
+#
+#   python supertest.py A3 --diff 'silver=java -jar silver.jar' \
+#     --diff 'kiama=java -jar kiama.jar' --diff 'ref=ob0c -ref'
+#
+# COMMAND, if any, is one more compiler.  A -ref among the words of a
+# compiler's command makes it a reference compiler, as -ref does for
+# COMMAND.  Each compiler works in a tree of its own, holding links to
+# the selected tests and their .stdin and .expected files, so that the
+# files they write next to the tests don't clash.  The trees are made
+# afresh for each run in a temporary directory under --sandbox-dir, and
+# removed when it is done.  The tests are found, and their .expected
+# files read, once for all of the compilers, which share a pool of one
+# process each, or of -jN.
+#
+# For each compiler and test the matrix holds the verdict, the line of
+# the first error reported, and the first line of the program's output
+# that differs from .expected.  Tests where the compilers disagree are
+# shown, with the cells that differ from the first reference compiler,
+# else the first compiler, marked by a *.  The whole matrix is written
+# to --diff-json FILE, or .supertest/diff-DATE.json.
+#######################################################################
+
+def diffCompilers(specs):
+  ## Compilers from the --diff options, each a dict of name, command
+  ## and whether it is a reference compiler
+  compilers = []
+  for spec in specs:
+    name = None
+    m = re.match(r'(\w+)=(.*)$', spec)
+    if m:
+      name, spec = m.group(1), m.group(2)
+
+    words = spec.split()
+    reference = '-ref' in words
+    words = [word for word in words if word != '-ref']
+    if not name:
+      ## The jar or script the command runs, else the command itself
+      files = [word for word in words[1:] if os.path.isfile(word)] or words[:1]
+      name = re.sub(r'\W', '_', os.path.splitext(os.path.basename(files[-1]))[0])
+
+    ## Names must tell the compilers, and their trees, apart
+    taken = [compiler['name'] for compiler in compilers]
+    unique = name
+    i = 2
+    while unique in taken:
+      unique = name + str(i)
+      i += 1
+
+    compilers.append({'name': unique, 'command': ' '.join(words), 'reference': reference})
+
+  return compilers
+
+
+def useCompiler(compiler):
+  ## Make compiler the one runBatch runs
+  global COMMAND
+  global RUN_COMMAND
+  global REFERENCE_COMPILER
+  global _command_digest
+  COMMAND = compiler['command']
+  RUN_COMMAND = compiler.get('run', COMMAND)
+  REFERENCE_COMPILER = compiler['reference']
+  _command_digest = compiler.get('digest')
+
+
+def diffTree(compiler, jobs, path_to_test, diff_dir):
+  ## Lay out compiler's tree for jobs in diff_dir, returning its jobs
+  tree = os.path.join(diff_dir, compiler['name'])
+  tree_jobs = []
+  for test_kind, test in jobs:
+    tree_test = os.path.join(tree, os.path.relpath(test, path_to_test))
+    base = os.path.splitext(test)[0]
+    tree_base = os.path.splitext(tree_test)[0]
+    for ext in [os.path.splitext(test)[1], '.stdin', '.expected']:
+      if os.path.exists(base + ext):
+        shareFile(base + ext, tree_base + ext)
+    tree_jobs.append((test_kind, tree_test))
+
+  return tree_jobs
+
+
+def runDiffBatch(task):
+  ## Run a batch of one compiler's jobs in a worker
+  compiler, batch = task
+  useCompiler(compiler)
+  return runBatch(batch)
+
+
+def diffCell(results):
+  ## What the matrix shows of one compiler's results for one test
+  failures = sorted([fail_group for fail_group in results['fail'] if results['fail'][fail_group]])
+  reported = results.get('reported') or [None]
+
+  output = None
+  if results['expected_cmp'][0]:
+    output = 'ok'
+  elif results['expected_cmp'][1]:
+    ## The mismatch as logged by runCCode, less the path to the tree
+    for i in range(len(results['log'])):
+      if 'EXP CMP' in results['log'][i]:
+        output = ' '.join([os.path.basename(results['log'][i].split()[-1])] +
+                          [line.split(':', 1)[1].strip() for line in results['log'][i + 1:i + 3]])
+        break
+    else:
+      output = 'differs'
+  elif results['run_c'][1]:
+    output = 'STDERR'
+
+  return {'verdict': ','.join(failures) or 'PASS', 'line': reported[0], 'output': output}
+
+
+def diffDisagrees(cells, baseline):
+  ## The names of the compilers whose cells differ from baseline's.
+  ## Outputs are only compared between compilers that ran the program.
+  differing = []
+  for name, cell in cells.items():
+    if cell['verdict'] != cells[baseline]['verdict'] or cell['line'] != cells[baseline]['line']:
+      differing.append(name)
+    elif None not in [cell['output'], cells[baseline]['output']] and cell['output'] != cells[baseline]['output']:
+      differing.append(name)
+  return sorted(differing)
+
+
+def runDiff(compilers, jobs, path_to_test):
+  ## Run jobs with every compiler, returning the matrix
+  names = [compiler['name'] for compiler in compilers]
+  diff_dir = tempfile.mkdtemp(prefix='supertest-%d-diff-' % os.getpid(), dir=SANDBOX_DIR)
+  try:
+    trees = {}
+    for compiler in compilers:
+      trees[compiler['name']] = diffTree(compiler, jobs, path_to_test, diff_dir)
+      if CACHE:
+        useCompiler(compiler)
+        compiler['digest'] = commandDigest()
+
+    ## Read once here, the workers are forked with them.  Each is kept by
+    ## its path from path_to_test, which is where it is in every tree
+    ## and in the sandboxes made of them.
+    _expected.clear()
+    for test_kind, test in jobs:
+      expected_path = os.path.splitext(test)[0] + '.expected'
+      if os.path.exists(expected_path):
+        f = open(expected_path)
+        try:
+          _expected[os.path.relpath(expected_path, path_to_test)] = f.read()
+        finally:
+          f.close()
+
+    ## Every compiler's first batch, then every compiler's second, ...
+    batches = dict([(name, batchTests(trees[name])) for name in names])
+    tasks = []
+    for i in range(max([len(batches[name]) for name in names] + [0])):
+      for compiler in compilers:
+        if i < len(batches[compiler['name']]):
+          tasks.append((compiler, batches[compiler['name']][i]))
+
+    pool = multiprocessing.Pool(JOBS > 1 and JOBS or len(compilers))
+    try:
+      results = pool.map(runDiffBatch, tasks)
+    finally:
+      pool.close()
+      pool.join()
+  finally:
+    shutil.rmtree(diff_dir, True)
+    _expected.clear()
+
+  by_test = {}
+  totals = dict([(name, newResults()) for name in names])
+  positions = dict([(name, dict([(trees[name][index], index) for index in range(len(jobs))])) for name in names])
+  for (compiler, batch), batch_results in zip(tasks, results):
+    for tree_job, test_results in zip(batch, batch_results):
+      index = positions[compiler['name']][tree_job]
+      by_test.setdefault(index, {})[compiler['name']] = diffCell(test_results)
+      mergeResults(totals[compiler['name']], test_results)
+
+  references = [compiler['name'] for compiler in compilers if compiler['reference']]
+  baseline = (references or names)[0]
+
+  tests = []
+  for index in range(len(jobs)):
+    cells = by_test[index]
+    tests.append({'path': jobs[index][1],
+                  'kind': jobs[index][0],
+                  'cells': cells,
+                  'disagree': diffDisagrees(cells, baseline)})
+
+  return {'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+          'artifact': ARTIFACT,
+          'baseline': baseline,
+          'compilers': [{'name': compiler['name'], 'command': compiler['command'], 'reference': compiler['reference'],
+                         'passed': sum([1 for test in tests if test['cells'][compiler['name']]['verdict'] == 'PASS']),
+                         'failures': countFailures(totals[compiler['name']])}
+                        for compiler in compilers],
+          'tests': tests}
+
+
+def printDiff(matrix):
+  names = [compiler['name'] for compiler in matrix['compilers']]
+
+  def showCell(cell, marked):
+    text = cell['verdict']
+    if cell['line'] is not None:
+      text += ' @' + str(cell['line'])
+    if cell['output'] not in [None, 'ok']:
+      text += ' [' + cell['output'] + ']'
+    if marked:
+      text = '*' + text
+    return text
+
+  disagreements = [test for test in matrix['tests'] if test['disagree']]
+
+  text = '\n'
+  text += 'Differential matrix of ' + str(matrix['artifact']) + ', against ' + matrix['baseline'] + ':\n'
+  for test in disagreements:
+    text += test['path'] + '\n'
+    for name in names:
+      text += '\t' + name + ':\t' + showCell(test['cells'][name], name in test['disagree']) + '\n'
+
+  text += '\n'
+  text += 'Compiler:\tPassed:\tFailures:\tCommand:\n'
+  for compiler in matrix['compilers']:
+    text += '%s%s\t%d/%d\t%d\t%s\n' % (compiler['name'], compiler['reference'] and ' (ref)' or '', compiler['passed'],
+                                         len(matrix['tests']), compiler['failures'], compiler['command'])
+  text += '\n'
+  text += 'Disagreements: %d of %d tests\n' % (len(disagreements), len(matrix['tests']))
+
+  print text.expandtabs(16)
+
+
+#######################################################################
+# Oracle (--oracle)
+#
+# ob0check.py parses and checks Oberon0 in process, in a fraction of a
+# millisecond per test, and knows what the tests should give from the
+# N_ in their names.  With --oracle the selected tests are checked by it
+# rather than by COMMAND, to find tests that are themselves wrong, e.g.
+#
+#   python supertest.py A5 --oracle
+#
+# When a compiler fails a parse, name or type test, what ob0check.py
+# finds in it is logged with the failure, and the programs of --scale
+# are checked by it before the compiler is run on them.
+#######################################################################
+
+def oracleText(found):
+  ## What ob0check.check found, as shown to the user
+  if not found:
+    return 'no errors'
+  return found[0] + ' error at line ' + str(found[1]) + ': ' + found[2]
+
+
+def explainTest(testpath, results):
+  ## Log what ob0check.py finds in a negative test COMMAND failed
+  found = ob0check.checkFile(testpath)
+  results['log'].append(('\toracle: ' + oracleText(found)).expandtabs(20))
+
+
+def runOracle(jobs):
+  ## [(path, found)] of the tests ob0check.py disagrees with
+  disagreements = []
+  for test_kind, test in jobs:
+    found = ob0check.checkFile(test)
+    if not ob0check.agrees(ob0check.expectation(test), found):
+      disagreements.append((test, found))
+  return disagreements
+
+
+def printOracle(disagreements, count, elapsed):
+  text = '\n'
+  for test, found in disagreements:
+    text += test + '\n'
+    text += '\toracle:\t' + oracleText(found) + '\n'
+  text += '\n'
+  text += 'Checked %d tests in %.3fs, %d per second\n' % (count, elapsed, count / max(elapsed, 1e-9))
+  text += 'Disagreements: %d of %d tests\n' % (len(disagreements), count)
+
+  print text.expandtabs(10)
+
+
+#######################################################################
+# Benchmark (--bench N [--bench-json FILE])
+#
+# Runs the compiler N times on each selected test, taking the first
+# run as the cold start and the rest as warm runs.  With --server the
+# server is restarted before each cold run, so that its start up is
+# counted there, and the warm runs reuse it.  Reported per level: the
+# median cold time, the median and 95th percentile of warm compile
+# latency, and the throughput in source lines per second.  Large tests
+# such as rascal/positive/L1/big.ob can be picked with --impl or -k.
+#######################################################################
+
+def percentile(values, fraction):
+  ## Nearest rank percentile of values, 0.5 for the median
+  if not values:
+    return None
+  values = sorted(values)
+  rank = int(round(fraction * (len(values) - 1)))
+  return values[rank]
+
+
+def countLines(path):
+  f = open(path)
+  try:
+    return len(f.readlines())
+  finally:
+    f.close()
+
+
+def benchmarkSummary(tests):
+  ## Cold and warm statistics of a group of benchmarked tests
+  warm = []
+  for test in tests:
+    warm.extend(test['warm'])
+
+  lines = sum([test['lines'] for test in tests])
+  warm_time = sum([percentile(test['warm'], 0.5) for test in tests if test['warm']])
+
+  return {'tests': len(tests),
+          'lines': lines,
+          'cold_median': percentile([test['cold'] for test in tests], 0.5),
+          'warm_median': percentile(warm, 0.5),
+          'warm_p95': percentile(warm, 0.95),
+          'lines_per_second': warm_time and lines / warm_time or None}
+
+
+def runBenchmark(jobs, records, runs):
+  levels = dict([(record['path'], record['level']) for record in records])
+  tests = []
+
+  for test_kind, test in jobs:
+    results = newResults()
+
+    ## Only the first run of a new server pays for its start up
+    if SERVER and getattr(_servers, 'server', None):
+      stopServer(_servers.server)
+      _servers.server = None
+
+    sandbox = None
+    run_test = test
+    if SANDBOX:
+      sandbox, [(test_kind, run_test)] = openSandbox([(test_kind, test)])
+    try:
+      for run in range(runs):
+        runCompiler(run_test, results)
+    finally:
+      if sandbox:
+        shutil.rmtree(sandbox, True)
+
+    walls = [timing['wall'] for timing in results['timing']]
+    tests.append({'path': test,
+                  'level': levels.get(test),
+                  'lines': countLines(test),
+                  'cold': walls[0],
+                  'warm': walls[1:],
+                  'maxrss': max([timing['maxrss'] or 0 for timing in results['timing']])})
+
+  summary = {}
+  for level in sorted(set([test['level'] for test in tests])):
+    summary[level] = benchmarkSummary([test for test in tests if test['level'] == level])
+  summary['all'] = benchmarkSummary(tests)
+
+  return {'command': COMMAND,
+          'run_command': RUN_COMMAND,
+          'artifact': ARTIFACT,
+          'server': SERVER,
+          'runs': runs,
+          'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+          'levels': summary,
+          'tests': tests}
+
+
+def printBenchmark(bench):
+  def seconds(value):
+    if value is None:
+      return '-'
+    return '%.3fs' % value
+
+  text = '\n'
+  text += 'Benchmark of ' + str(bench['artifact']) + ', ' + str(bench['runs']) + ' runs of each test:\n'
+  if bench['run_command'] != bench['command']:
+    text += 'Run as: ' + bench['run_command'] + '\n'
+  text += 'Level:\tTests:\tLines:\tCold median:\tWarm median:\tWarm p95:\tLines/s:\n'
+
+  levels = sorted([level for level in bench['levels'] if level != 'all']) + ['all']
+  for level in levels:
+    summary = bench['levels'][level]
+    lines_per_second = '-'
+    if summary['lines_per_second']:
+      lines_per_second = '%.0f' % summary['lines_per_second']
+    text += '%s\t%d\t%d\t%s\t%s\t%s\t%s\n' % (level, summary['tests'], summary['lines'],
+              seconds(summary['cold_median']), seconds(summary['warm_median']), seconds(summary['warm_p95']), lines_per_second)
+
+  print text.expandtabs(14)
+
+
+#######################################################################
+# Performance baseline (--perf-baseline save|check [--perf-runs K]
+#                       [--perf-threshold PERCENT] [--perf-file FILE])
+#
+# Runs the selected tests K times, PERF_RUNS by default, and takes for
+# each test the median and the median absolute deviation (MAD) of its
+# compile time, the compiler on the test and its _lifted.ob, and of the
+# time its program runs.  The same is kept for the artifact as a whole,
+# from the sums of the medians.  "save" stores these for the artifact
+# and COMMAND in PERF_FILE, or --perf-file FILE, next to those of other
+# artifacts and compilers, so that implementations run at the same
+# artifact keep baselines of their own.
+# "check" compares against what was saved and fails the run, with exit
+# status 1, when a test or the artifact got slower by more than
+# PERF_THRESHOLD, and by more than PERF_Z standard errors of the
+# medians, so that a noisy test does not fail a run by chance.  Changes
+# of less than PERF_FLOOR seconds are never counted.  The result cache
+# is not used, so that every run is timed.
+#######################################################################
+
+PERF_FILE = os.path.join(STATE_DIR, 'perf-baseline.json')
+
+PERF_RUNS = 5
+
+## Slowdown, as a fraction of the baseline median, that fails a check
+PERF_THRESHOLD = 0.2
+
+## Standard errors a slowdown must exceed to be taken as real
+PERF_Z = 3.0
+
+## Seconds below which a slowdown is taken to be noise
+PERF_FLOOR = 0.01
+
+## Stages timed, and the stages of reapChild timings they are made of
+PERF_STAGES = [('compile', ['compile', 'lifted']), ('run', ['run'])]
+
+
+def perfSample(results):
+  ## The time of each of PERF_STAGES in one run of a test, None for a
+  ## stage the test did not reach
+  sample = {}
+  for stage, parts in PERF_STAGES:
+    walls = [timing['wall'] for timing in results['timing'] if timing['stage'] in parts]
+    sample[stage] = walls and sum(walls) or None
+  return sample
+
+
+def perfStatistics(values):
+  ## Median and MAD of the times of one stage of one test
+  median = percentile(values, 0.5)
+  return {'median': median,
+          'mad': percentile([abs(value - median) for value in values], 0.5),
+          'runs': len(values)}
+
+
+def perfStandardError(statistics):
+  ## Standard error of a median, taking 1.4826 MAD as the deviation of
+  ## normal samples
+  return 1.2533 * 1.4826 * statistics['mad'] / math.sqrt(statistics['runs'])
+
+
+def perfSummary(samples):
+  ## Statistics of every test, and of the artifact, from
+  ## samples[test] = [sample0, sample1, ...] of perfSample
+  tests = {}
+  for test in samples:
+    tests[test] = {}
+    for stage, parts in PERF_STAGES:
+      values = [sample[stage] for sample in samples[test] if sample[stage] is not None]
+      if values:
+        tests[test][stage] = perfStatistics(values)
+
+  total = {}
+  for stage, parts in PERF_STAGES:
+    stats = [tests[test][stage] for test in tests if stage in tests[test]]
+    if stats:
+      total[stage] = {'median': sum([s['median'] for s in stats]),
+                      'se': math.sqrt(sum([perfStandardError(s) ** 2 for s in stats]))}
+
+  return {'command': COMMAND,
+          'run_command': RUN_COMMAND,
+          'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+          'runs': max([len(samples[test]) for test in samples] + [0]),
+          'total': total,
+          'tests': tests}
+
+
+def perfRegression(baseline, current, base_se, current_se):
+  ## Whether the median current is a significant slowdown from baseline
+  slowdown = current - baseline
+  if slowdown < PERF_FLOOR or slowdown <= PERF_THRESHOLD * baseline:
+    return False
+  se = math.sqrt(base_se ** 2 + current_se ** 2)
+  return se == 0 or slowdown / se > PERF_Z
+
+
+def checkPerf(baseline, summary):
+  ## Compare summary with the saved baseline of the same artifact.
+  ## Returns a list of (test or None for the artifact, stage, baseline
+  ## median, current median) for every slowdown.
+  regressions = []
+  for test in sorted(summary['tests']):
+    if test not in baseline['tests']:
+      continue
+    for stage, parts in PERF_STAGES:
+      if stage in summary['tests'][test] and stage in baseline['tests'][test]:
+        base = baseline['tests'][test][stage]
+        now = summary['tests'][test][stage]
+        if perfRegression(base['median'], now['median'], perfStandardError(base), perfStandardError(now)):
+          regressions.append((test, stage, base['median'], now['median']))
+
+  for stage, parts in PERF_STAGES:
+    totals = perfTotals(baseline, summary, stage)
+    if totals and perfRegression(*totals):
+      regressions.append((None, stage, totals[0], totals[1]))
+
+  return regressions
+
+
+def perfTotals(baseline, summary, stage):
+  ## (baseline, current, baseline standard error, current standard
+  ## error) of the sum of the medians of stage, or None.  Only tests
+  ## both have count, so that adding or removing tests does not look
+  ## like a change in speed.
+  both = [test for test in summary['tests'] if test in baseline['tests']
+          and stage in summary['tests'][test] and stage in baseline['tests'][test]]
+  if not both:
+    return None
+
+  ## Standard errors of a sum add as variances
+  return (sum([baseline['tests'][test][stage]['median'] for test in both]),
+          sum([summary['tests'][test][stage]['median'] for test in both]),
+          math.sqrt(sum([perfStandardError(baseline['tests'][test][stage]) ** 2 for test in both])),
+          math.sqrt(sum([perfStandardError(summary['tests'][test][stage]) ** 2 for test in both])))
+
+
+def loadPerfBaselines(path):
+  ## Saved baselines by COMMAND, then by artifact
+  try:
+    f = open(path)
+    try:
+      return byteStrings(json.load(f))
+    finally:
+      f.close()
+  except (IOError, ValueError):
+    return {}
+
+
+def printPerf(mode, summary, baseline, regressions):
+  def seconds(value):
+    if value is None:
+      return '-'
+    return '%.3fs' % value
+
+  text = '\n'
+  text += 'Performance of ' + str(ARTIFACT) + ', ' + str(summary['runs']) + ' runs of each test:\n'
+  if summary['run_command'] != summary['command']:
+    text += 'Run as: ' + summary['run_command'] + '\n'
+  if baseline and baseline.get('run_command', baseline['command']) != summary['run_command']:
+    text += 'The baseline was run as: ' + baseline.get('run_command', baseline['command']) + '\n'
+  text += 'Stage:\tMedian:\tBaseline:\tChange:\n'
+  for stage, parts in PERF_STAGES:
+    now = summary['total'].get(stage, {}).get('median')
+    base = None
+    totals = baseline and perfTotals(baseline, summary, stage)
+    if totals:
+      base, now = totals[:2]
+    change = '-'
+    if base and now is not None:
+      change = '%+.0f%%' % (100.0 * (now - base) / base)
+    text += '%s\t%s\t%s\t%s\n' % (stage, seconds(now), seconds(base), change)
+
+  if mode == 'check':
+    text += '\n'
+    if not baseline:
+      text += 'No baseline saved for ' + str(ARTIFACT) + ' of this COMMAND; use --perf-baseline save first\n'
+    elif regressions:
+      text += 'Slowdowns beyond %d%%:\n' % round(100 * PERF_THRESHOLD)
+      for test, stage, base, now in regressions:
+        text += '\t%s\t%s -> %s\t(%.1fx)\t%s\n' % (stage, seconds(base), seconds(now), now / base, test or 'ALL TESTS')
+    else:
+      text += 'No slowdowns beyond %d%%\n' % round(100 * PERF_THRESHOLD)
+
+  print text.rstrip('\n').expandtabs(12)
+
+
+#######################################################################
+# Scaling (--scale KNOB=SIZE,SIZE,... [--scale-json FILE])
+#
+# Generates a program for each SIZE of an ob0gen.py knob (decls, depth,
+# procs, statements or type_depth), at the highest level selected by
+# --level or the artifact, compiles each --bench N times (once by
+# default), and plots the median compile time and the peak memory of
+# the compiler against the size of the program in lines, e.g.
+#
+#   python supertest.py A4 --scale statements=10,100,1000,10000 COMMAND
+#
+# The programs are kept in .supertest/scale, with their .stdin and
+# .expected files, so that a slow or failing one can be looked at.
+#######################################################################
+
+SCALE_DIR = os.path.join(STATE_DIR, 'scale')
+
+
+def runScaling(level, knob, sizes, runs):
+  points = []
+
+  for size in sizes:
+    test = os.path.join(SCALE_DIR, level, knob + '_' + str(size), 'Scale.ob')
+    if not os.path.isdir(os.path.dirname(test)):
+      os.makedirs(os.path.dirname(test))
+    ob0gen.writeProgram(test, level, **{knob: size})
+    found = ob0check.checkFile(test, level)
+    if found:
+      print 'Warning: ob0check.py finds a', oracleText(found), 'in', test
+
+    results = newResults()
+    for run in range(runs):
+      stdout_output, stderr_output = runCompiler(test, results)
+
+    timings = results['timing']
+    points.append({'size': size,
+                   'path': test,
+                   'lines': countLines(test),
+                   'wall': percentile([timing['wall'] for timing in timings], 0.5),
+                   'maxrss': max([timing['maxrss'] or 0 for timing in timings]),
+                   'stderr': len(stderr_output) > 0,
+                   'oracle': found and oracleText(found)})
+
+  return {'command': COMMAND,
+          'level': level,
+          'knob': knob,
+          'runs': runs,
+          'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+          'points': points}
+
+
+def printScaling(scaling):
+  ## One bar of compile time and one of peak memory per size, scaled
+  ## to the largest of each
+  width = 40
+  points = scaling['points']
+  max_wall = max([point['wall'] for point in points] + [1e-9])
+  max_rss = max([point['maxrss'] for point in points] + [1])
+
+  text = '\n'
+  text += 'Scaling of ' + scaling['level'] + ' programs by ' + scaling['knob'] + ', ' + str(scaling['runs']) + ' runs of each:\n'
+  text += 'Size:\tLines:\tTime:\tPeak memory:\n'
+  for point in points:
+    time_bar = '#' * int(round(width * point['wall'] / max_wall))
+    rss_bar = '=' * int(round(width * point['maxrss'] / max_rss))
+    note = ''
+    if point['stderr']:
+      note = '\tSTDERR'
+    text += '%d\t%d\t%.3fs\t%dKB%s\n' % (point['size'], point['lines'], point['wall'], point['maxrss'], note)
+    text += '\ttime\t' + time_bar + '\n'
+    text += '\tmemory\t' + rss_bar + '\n'
+
+  print text.expandtabs(10)
+
+
+#######################################################################
+# Fuzzing (--fuzz N [--fuzz-seed S] [--fuzz-dir DIR] [--fuzz-json FILE])
+#
+# Generates N programs with ob0gen.py, small ones at each level selected
+# by --level or the artifact in turn, and tests COMMAND with them as
+# with the tests, -jN at once or one per CPU, e.g.
+#
+#   python supertest.py A4 --fuzz 10000 --timeout 10 COMMAND
+#
+# Half of the programs are positive tests, with .expected output from
+# ob0gen.py's interpreter.  The others are mutated by ob0gen.mutate into
+# parse, name or type tests, as ob0check.py finds them, the first error
+# line making the N_ of their names; mutants with no errors are dropped.
+# Programs are made, and tested, FUZZ_ROUND at a time, in the workers,
+# in a tree of their own under SANDBOX_DIR.
+#
+# A program fails as a test does: the compiler writes to stderr, as when
+# it crashes, is stopped by --timeout, reports an error in a positive
+# test, none or one on another line in a mutant, or the program's output
+# is not .expected.  With compilers given by --diff, such as the
+# reference compiler, 'ref=ob0c -ref', every program is tested with each
+# of them, and COMMAND, and fails where they disagree.
+#
+# Each failure has a signature: the kind of test, how it failed, and
+# the first line of the compiler's stderr (and of its stack trace) or
+# stdout, or else the error ob0check.py finds, less names and numbers.
+# The first program with each signature is kept in FUZZ_DIR, or DIR,
+# laid out as tests/<impl> is, e.g. negative/type_errors/L3/
+# 12_fuzz_<signature hash>.ob, so DIR can be ../tests/fuzz.  Later ones
+# with a signature already kept, in this run or another, are counted.
+# Program I comes from seed S + I, S being the time unless given, and
+# the failures kept are written with their seeds to --fuzz-json FILE.
+#######################################################################
+
+FUZZ_DIR = os.path.join(STATE_DIR, 'fuzz')
+FUZZ_ROUND = 500
+
+## ob0gen.py knobs, from 1 to these
+FUZZ_KNOBS = {'decls': 4, 'depth': 2, 'procs': 3, 'statements': 6, 'type_depth': 2}
+
+## Tries at a mutant with an error, before a program is dropped
+FUZZ_TRIES = 3
+
+## The tests of each kind of ob0check.py error
+FUZZ_CATEGORIES = {'parse': 'parse_errors', 'name': 'name_errors', 'type': 'type_errors'}
+
+## The test and job kind of the programs of each negative category
+FUZZ_JOBS = {'parse_errors': ('T1', 'parse'), 'name_errors': ('T2', 'name_type'), 'type_errors': ('T3', 'name_type')}
+
+
+def fuzzProgram(task):
+  ## Write the program of seed to work_dir, in a worker.  Returns what
+  ## is known of it, or None for a mutant without errors.
+  seed, level, work_dir = task
+  random_ = random.Random(seed)
+  knobs = dict([(knob, random_.randint(1, size)) for (knob, size) in FUZZ_KNOBS.items()])
+  source, stdin, expected = ob0gen.generate(level, seed=seed, name='Fuzz', **knobs)
+  found = ob0check.check(source, level)
+  if found:
+    print 'Warning: ob0check.py finds a', oracleText(found), 'in the program of seed', seed
+
+  name = 'fuzz_%d' % seed
+  test_dir = os.path.join(work_dir, 'positive', level)
+  if random_.random() < 0.5:
+    for i in range(FUZZ_TRIES):
+      mutant = ob0gen.mutate(source, random_.randint(0, 1 << 30))
+      found = ob0check.check(mutant, level)
+      if found:
+        break
+    else:
+      return None
+    source, stdin, expected = mutant, None, None
+    test_dir = os.path.join(work_dir, 'negative', FUZZ_CATEGORIES[found[0]], level)
+    if found[0] != 'parse':
+      name = '%d_%s' % (found[1], name)
+
+  if not os.path.isdir(test_dir):
+    os.makedirs(test_dir)
+  base = os.path.join(test_dir, name)
+  for text, path in [(source, base + '.ob'), (stdin, base + '.stdin'), (expected, base + '.expected')]:
+    if text:
+      f = open(path, 'w')
+      try:
+        f.write(text)
+      finally:
+        f.close()
+
+  return {'seed': seed, 'level': level, 'path': base + '.ob', 'found': found,
+          'category': found and FUZZ_CATEGORIES[found[0]] or 'positive'}
+
+
+def fuzzText(text):
+  ## text less the paths, names and numbers that tell programs apart
+  text = re.sub(r'\S*/\S*', '/', text)
+  text = re.sub(r'\b\w*(?:\d|_)\w*\b', '_', text)
+  return ' '.join(text.split())[:200]
+
+
+def crashText(stderr_output):
+  ## The first line of stderr and, for a stack trace, of where it was
+  lines = [line.strip() for line in stderr_output.splitlines() if line.strip()]
+  frames = [line for line in lines[1:] if line.startswith('at ')]
+  return ' '.join(lines[:1] + frames[:1])
+
+
+def fuzzSignature(program, results):
+  ## The signature of how COMMAND failed program
+  failures = sorted([fail_group for fail_group in results['fail'] if results['fail'][fail_group]])
+  detail = ''
+  if 'STDERR' in failures or 'ERROR' in failures:
+    detail = (results.get('said') or [''])[0]
+  elif program['found'] and 'TIMEOUT' not in failures:
+    detail = program['found'][0] + ' error: ' + program['found'][2]
+
+  signature = program['category'] + ' ' + ','.join(failures)
+  if detail:
+    signature += ': ' + fuzzText(detail)
+  return signature
+
+
+def fuzzJob(program):
+  ## The job selectTests would make of program, from the level and
+  ## category it was written for rather than from the directories of
+  ## its path, or None if TESTS leaves it out
+  if program['category'] == 'positive':
+    return ('positive', program['path'])
+  if program['level'] == 'L3' and 'L5' in LEVEL:
+    return None
+  test, test_kind = FUZZ_JOBS[program['category']]
+  if test not in TESTS:
+    return None
+  return (test_kind, program['path'])
+
+
+def diffSignature(program, test):
+  ## The signature of how the compilers of --diff disagreed on program
+  cells = test['cells']
+  return program['category'] + ' ' + ' '.join(['%s=%s' % (name, cells[name]['verdict']) for name in sorted(cells)])
+
+
+def fuzzSignatures(fuzz_dir):
+  ## The signatures of the failures kept in fuzz_dir, by their hash
+  known = set()
+  for directory, subdirs, files in os.walk(fuzz_dir):
+    for name in files:
+      m = re.search(r'fuzz_([0-9a-f]{8})\.ob$', name)
+      if m:
+        known.add(m.group(1))
+  return known
+
+
+def keepFailure(program, digest, fuzz_dir):
+  ## Copy program into fuzz_dir, as a test of its category.  Returns
+  ## its path there.
+  parts = [program['category'], program['level']]
+  if program['category'] != 'positive':
+    parts.insert(0, 'negative')
+  name = 'fuzz_' + digest
+  if program['found'] and program['found'][0] != 'parse':
+    name = '%d_%s' % (program['found'][1], name)
+  base = os.path.join(fuzz_dir, os.path.join(*parts), name)
+
+  if not os.path.isdir(os.path.dirname(base)):
+    os.makedirs(os.path.dirname(base))
+  source_base = os.path.splitext(program['path'])[0]
+  for ext in ['.ob', '.stdin', '.expected']:
+    if os.path.exists(source_base + ext):
+      shutil.copyfile(source_base + ext, base + ext)
+  return base + '.ob'
+
+
+def runFuzz(count, seed, levels, fuzz_dir, compilers):
+  global RUN_COMMAND
+  known = fuzzSignatures(fuzz_dir)
+  counts = {'programs': 0, 'dropped': 0, 'failed': 0, 'kept': 0}
+  for category in ['positive'] + sorted(FUZZ_CATEGORIES.values()):
+    counts[category] = 0
+  failures = []
+  start = time.time()
+
+  pool = multiprocessing.Pool(JOBS > 1 and JOBS or multiprocessing.cpu_count())
+  try:
+    for first in range(0, count, FUZZ_ROUND):
+      work_dir = tempfile.mkdtemp(prefix='supertest-%d-fuzz-' % os.getpid(), dir=SANDBOX_DIR)
+      try:
+        tasks = [(seed + i, levels[i % len(levels)], work_dir) for i in range(first, min(count, first + FUZZ_ROUND))]
+        programs = {}
+        for program in pool.map(fuzzProgram, tasks):
+          if program:
+            programs[program['path']] = program
+        jobs = [job for job in [fuzzJob(programs[path]) for path in sorted(programs)] if job]
+        counts['dropped'] += len(tasks) - len(jobs)
+
+        ## Each program and its signature, if it failed
+        tested = []
+        if compilers:
+          if CDS:
+            shareClasses(compilers, jobs)
+          matrix = runDiff(compilers, jobs, work_dir)
+          for job, test in zip(jobs, matrix['tests']):
+            tested.append((programs[job[1]], test['disagree'] and diffSignature(programs[job[1]], test)))
+        else:
+          if CDS:
+            RUN_COMMAND = archiveCommand(RUN_COMMAND, jobs)
+          for job, test_result in runJobs(jobs, pool):
+            tested.append((programs[job[1]], countFailures(test_result) and fuzzSignature(programs[job[1]], test_result)))
+
+        for program, signature in tested:
+          counts['programs'] += 1
+          counts[program['category']] += 1
+          if not signature:
+            continue
+          counts['failed'] += 1
+          digest = hashlib.sha1(signature).hexdigest()[:8]
+          if digest in known:
+            continue
+          known.add(digest)
+          counts['kept'] += 1
+          path = keepFailure(program, digest, fuzz_dir)
+          failures.append({'signature': signature, 'seed': program['seed'], 'level': program['level'], 'path': path})
+          print 'Fuzz failure, seed %d:\t%s\n\t%s' % (program['seed'], path, signature)
+      finally:
+        shutil.rmtree(work_dir, True)
+
+      print 'Fuzzed %d programs, %d failed, %d kept' % (counts['programs'], counts['failed'], counts['kept'])
+  finally:
+    pool.close()
+    pool.join()
+
+  return {'command': COMMAND,
+          'compilers': [compiler['command'] for compiler in compilers],
+          'seed': seed,
+          'levels': levels,
+          'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+          'elapsed': time.time() - start,
+          'counts': counts,
+          'failures': failures}
+
+
+def printFuzz(fuzz, fuzz_dir):
+  counts = fuzz['counts']
+  text = '\n'
+  text += 'Fuzzing of ' + ','.join(fuzz['levels']) + ', from seed ' + str(fuzz['seed']) + ':\n'
+  for category in ['positive'] + sorted(FUZZ_CATEGORIES.values()):
+    text += '%s:\t%d\n' % (category, counts[category])
+  text += 'Dropped:\t%d mutants without errors or tests not selected\n' % counts['dropped']
+  text += 'Programs:\t%d in %.1fs, %d per minute\n' % (counts['programs'], fuzz['elapsed'],
+                                                       60 * counts['programs'] / max(fuzz['elapsed'], 1e-9))
+  text += 'Failed:\t%d, with %d new signatures kept in %s\n' % (counts['failed'], counts['kept'], fuzz_dir)
+
+  print text.expandtabs(16)
+
+
+#######################################################################
+# Runtime benchmark (--runtime-bench SIZE,SIZE,... [--runtime-opt
+#                    FLAGS,FLAGS,...] [--runtime-json FILE])
+#
+# Times the programs a compiler generates, rather than the compiler.
+# Each selected positive test that has a workload in WORKLOADS is
+# scaled to every SIZE, with its source and .stdin rewritten and its
+# .expected worked out anew, e.g. quicksort sorts SIZE numbers.  The
+# compiler is run on the scaled program, then its C is built with each
+# of the gcc flags of --runtime-opt, -O0 and -O2 by default, through the
+# gcc cache.  Each executable is run --bench N times, 3 by default, and
+# the median run time, the peak memory and whether its output matched
+# are reported.  With --diff, every compiler is benchmarked, so that
+# their code generation can be compared.  The programs are kept in
+# RUNTIME_DIR.
+#
+# A child forked from supertest.py starts out as a copy of it, and the
+# kernel counts that copy in its peak memory even after the exec, so
+# each executable is started by LAUNCHER_SOURCE instead, a small C
+# program that forks and execs it, and writes the peak memory of the
+# executable alone to a file.
+#######################################################################
+
+RUNTIME_DIR = os.path.join(STATE_DIR, 'runtime')
+
+RUNTIME_RUNS = 3
+
+LAUNCHER_SOURCE = r'''
+#include <stdio.h>
+#include <signal.h>
+#include <unistd.h>
+#include <sys/resource.h>
+#include <sys/wait.h>
+
+/* launcher MAXRSS_FILE EXECUTABLE: run EXECUTABLE, then write its peak
+   resident set size in kilobytes to MAXRSS_FILE and exit as it did */
+int main(int argc, char **argv) {
+  struct rusage usage;
+  int status;
+  FILE *f;
+  pid_t pid = fork();
+  if (pid == 0) {
+    execv(argv[2], argv + 2);
+    _exit(127);
+  }
+  if (pid < 0 || wait4(pid, &status, 0, &usage) < 0)
+    return 127;
+  f = fopen(argv[1], "w");
+  if (f) {
+    fprintf(f, "%ld\n", usage.ru_maxrss);
+    fclose(f);
+  }
+  if (WIFSIGNALED(status)) {
+    signal(WTERMSIG(status), SIG_DFL);
+    kill(getpid(), WTERMSIG(status));
+  }
+  return WEXITSTATUS(status);
+}
+'''
+
+## Largest value of the INTEGER of generated C, taken to be 32 bits
+INTEGER_MAX = 2 ** 31 - 1
+
+
+def quicksortWorkload(source, size):
+  ## Sort a shuffled 1 ... size
+  numbers = range(1, size + 1)
+  random.Random(size).shuffle(numbers)
+  source = re.sub(r'INPUTLENGTH\s*=\s*\d+', 'INPUTLENGTH = ' + str(size), source)
+  stdin = ''.join(['%d\n' % number for number in numbers])
+  expected = ''.join([' %d' % number for number in range(1, size + 1)]) + '\n' + ' %d\n' % size
+  return source, stdin, expected
+
+
+def collatzWorkload(source, size):
+  ## The sequence of the start up to size that takes the most steps,
+  ## leaving out those that go beyond INTEGER_MAX
+  steps = {1: (0, 1)}
+
+  def walk(start):
+    ## (steps, highest value) from start to 1
+    path = []
+    current = start
+    while current not in steps:
+      path.append(current)
+      if current % 2 == 0:
+        current = current // 2
+      else:
+        current = current * 3 + 1
+    count, highest = steps[current]
+    for value in reversed(path):
+      count, highest = count + 1, max(highest, value)
+      steps[value] = (count, highest)
+    return steps[start]
+
+  best = 1
+  for start in range(1, size + 1):
+    count, highest = walk(start)
+    if highest <= INTEGER_MAX and count > walk(best)[0]:
+      best = start
+
+  sequence = []
+  current = best
+  while current != 1:
+    sequence.append(current)
+    if current % 2 == 0:
+      current = current // 2
+    else:
+      current = current * 3 + 1
+  return source, '%d\n' % best, ''.join([' %d' % value for value in sequence]) + '\n'
+
+
+## Workloads by the name of the test, without .ob.  factorial is left
+## out: INTEGER overflows past its limit of 10, so it cannot be scaled.
+WORKLOADS = {'quicksort': quicksortWorkload,
+             'collatz': collatzWorkload}
+
+
+def buildLauncher():
+  ## Build LAUNCHER_SOURCE into RUNTIME_DIR, once.  Returns the path of
+  ## the launcher.
+  launcher = os.path.join(RUNTIME_DIR, 'launcher.a')
+  if os.path.exists(launcher):
+    return launcher
+
+  if not os.path.isdir(RUNTIME_DIR):
+    os.makedirs(RUNTIME_DIR)
+  c_path = os.path.join(RUNTIME_DIR, 'launcher.c')
+  f = open(c_path, 'w')
+  try:
+    f.write(LAUNCHER_SOURCE)
+  finally:
+    f.close()
+
+  ## Built under a name of its own, so that a parallel run never starts
+  ## a launcher gcc is still writing
+  temp = launcher + '.' + str(os.getpid())
+  gcc = subprocess.Popen(['gcc', '-O2', c_path, '-o', temp], stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+  messages = gcc.communicate()[0]
+  if gcc.returncode != 0:
+    sys.exit('supertest: cannot build the runtime launcher:\n' + messages)
+  os.rename(temp, launcher)
+  return launcher
+
+
+def runProgram(executable, stdin_path, runs, limit):
+  ## Run executable runs times through the launcher, each within the
+  ## TIMEOUTS of run and limit bytes of output, as runCCode does.
+  ## Returns (its output of the first run, its timings), stopping at the
+  ## first run that times out.
+  launcher = buildLauncher()
+  maxrss_path = os.path.splitext(executable)[0] + '.maxrss'
+  output = None
+  timings = []
+  for run in range(runs):
+    stdin_file = open(stdin_path)
+    try:
+      start = time.time()
+      program = subprocess.Popen([launcher, maxrss_path, executable], cwd=os.path.dirname(executable),
+                                 stdin=stdin_file, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                 preexec_fn=childGroup)
+      stdout_output, stderr_output, timing = captureOutput(program, start, TIMEOUTS['run'], None, limit)
+    finally:
+      stdin_file.close()
+
+    ## Not written by a launcher that was killed, whose own peak
+    ## memory is that of supertest.py
+    timing['maxrss'] = None
+    if os.path.exists(maxrss_path):
+      f = open(maxrss_path)
+      try:
+        timing['maxrss'] = int(f.read())
+      finally:
+        f.close()
+      os.remove(maxrss_path)
+    timings.append(timing)
+    if output is None:
+      output = stdout_output
+    if timing.get('timeout'):
+      break
+  return output, timings
+
+
+def runRuntimeBenchmark(compilers, jobs, sizes, gcc_flags, runs):
+  global GCC_FLAGS
+  programs = []
+
+  for test_kind, test in jobs:
+    name = os.path.splitext(os.path.basename(test))[0]
+    if test_kind != 'positive' or name not in WORKLOADS:
+      continue
+
+    f = open(test)
+    try:
+      source = f.read()
+    finally:
+      f.close()
+
+    for size in sizes:
+      scaled_source, stdin, expected = WORKLOADS[name](source, size)
+
+      for compiler in compilers:
+        useCompiler(compiler)
+        program = os.path.join(RUNTIME_DIR, compiler['name'], name + '_' + str(size), name + '.ob')
+        if not os.path.isdir(os.path.dirname(program)):
+          os.makedirs(os.path.dirname(program))
+        base = os.path.splitext(program)[0]
+        for path, text in [(program, scaled_source), (base + '.stdin', stdin), (base + '.expected', expected)]:
+          f = open(path, 'w')
+          try:
+            f.write(text)
+          finally:
+            f.close()
+        c_path = codegenPaths(program)['c']
+        if os.path.exists(c_path):
+          os.remove(c_path)
+
+        results = newResults()
+        stdout_output, stderr_output = runCompiler(program, results)
+
+        for flags in gcc_flags:
+          point = {'test': test,
+                   'program': name,
+                   'size': size,
+                   'compiler': compiler['name'],
+                   'flags': flags,
+                   'wall': None,
+                   'maxrss': None,
+                   'status': 'OK'}
+          programs.append(point)
+
+          if stdout_output or stderr_output or not os.path.exists(c_path):
+            point['status'] = 'COMPILE ERR'
+            continue
+
+          ## Each executable is kept under its flags
+          GCC_FLAGS = flags
+          exit_code, messages, timing = buildExecutable(c_path)
+          if exit_code != 0:
+            point['status'] = 'GCC ERR'
+            continue
+          executable = base + re.sub(r'\W', '_', flags) + '.a'
+          os.rename(base + '.a', executable)
+
+          output, timings = runProgram(executable, base + '.stdin', runs, len(expected) + CAPTURE_LIMIT)
+          if timings[-1].get('timeout'):
+            point['status'] = 'TIMEOUT'
+            continue
+          point['wall'] = percentile([run['wall'] for run in timings], 0.5)
+          point['maxrss'] = max([run['maxrss'] for run in timings if run['maxrss'] is not None] or [None])
+          if output != expected:
+            point['status'] = 'WRONG OUTPUT'
+
+  return {'compilers': [compiler['command'] for compiler in compilers],
+          'run_commands': [compiler.get('run', compiler['command']) for compiler in compilers],
+          'runs': runs,
+          'flags': gcc_flags,
+          'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+          'programs': programs}
+
+
+def printRuntimeBenchmark(bench):
+  text = '\n'
+  text += 'Runtime of generated programs, ' + str(bench['runs']) + ' runs of each:\n'
+  for command, run_command in zip(bench['compilers'], bench['run_commands']):
+    if run_command != command:
+      text += 'Compiled as: ' + run_command + '\n'
+  text += 'Program:\tSize:\tCompiler:\tFlags:\tMedian:\tPeak memory:\n'
+  for point in bench['programs']:
+    if point['status'] == 'OK' or point['status'] == 'WRONG OUTPUT':
+      timing = '%.3fs\t%s' % (point['wall'], point['maxrss'] is None and '-' or '%dKB' % point['maxrss'])
+      if point['status'] != 'OK':
+        timing += '\t' + point['status']
+    else:
+      timing = '-\t-\t' + point['status']
+    text += '%s\t%d\t%s\t%s\t%s\n' % (point['program'], point['size'], point['compiler'], point['flags'] or '-', timing)
+
+  print text.expandtabs(12)
+
+
+#######################################################################
+# Reports (--json FILE, --junit FILE, --slowest N)
+#
+# Every child a test runs (compiler, lifted recompile, gcc and the
+# program) is timed by reapChild.  Replayed results keep the timings of
+# the run that made them, and are marked as cached.
+#######################################################################
+
+def testReport(job, results, path_to_test):
+  ## What the reports show about one test
+  test_kind, test = job
+
+  return {'path': test,
+          'kind': test_kind,
+          'suite': '.'.join(os.path.relpath(os.path.dirname(test), path_to_test).split(os.sep)),
+          'passed': countFailures(results) == 0,
+          'failures': sorted([fail_group for fail_group in results['fail'] if results['fail'][fail_group]]),
+          'cached': results['cached'][0] > 0,
+          'wall': sum([timing['wall'] for timing in results['timing']]),
+          'timing': results['timing'],
+          'log': results['log']}
+
+
+def writeJsonReport(path, reports, results, shard=None):
+  ## shard is [I, N] for the report of --shard I/N
+  totals = dict([(test_type, results[test_type]) for test_type in results if test_type not in ['log', 'timing', 'reported', 'said']])
+
+  f = open(path, 'w')
+  try:
+    json.dump({'command': COMMAND, 'level': LEVEL, 'tests': TESTS, 'totals': totals, 'results': reports,
+               'shard': shard},
+              f, indent=1, sort_keys=True)
+  finally:
+    f.close()
+
+
+def writeJUnitReport(path, reports):
+  escape = xml.sax.saxutils.escape
+  quote = xml.sax.saxutils.quoteattr
+
+  failures = len([report for report in reports if not report['passed']])
+  total_time = sum([report['wall'] for report in reports])
+
+  f = open(path, 'w')
+  try:
+    f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+    f.write('<testsuite name="supertest" tests="%d" failures="%d" errors="0" time="%.3f">\n' % (len(reports), failures, total_time))
+    f.write('  <properties><property name="command" value=%s/></properties>\n' % quote(COMMAND))
+
+    for report in reports:
+      f.write('  <testcase classname=%s name=%s time="%.3f">\n'
+              % (quote(report['suite']), quote(os.path.basename(report['path'])), report['wall']))
+      if not report['passed']:
+        f.write('    <failure message=%s/>\n' % quote(', '.join(report['failures'])))
+      f.write('    <system-out>%s</system-out>\n' % escape('\n'.join(report['log'])))
+      f.write('  </testcase>\n')
+
+    f.write('</testsuite>\n')
+  finally:
+    f.close()
+
+
+def printSlowest(reports, count):
+  text = '\n'
+  text += 'Slowest tests:\n'
+  text += 'Wall:\tCompile:\tLifted:\tGCC:\tRun:\tPeak RSS:\tTest:\n'
+
+  slowest = sorted(reports, key=lambda report: report['wall'], reverse=True)[:count]
+  for report in slowest:
+    stages = {'compile': 0.0, 'lifted': 0.0, 'gcc': 0.0, 'run': 0.0}
+    for timing in report['timing']:
+      stages[timing['stage']] += timing['wall']
+    peak = max([timing['maxrss'] or 0 for timing in report['timing']] + [0])
+
+    text += '%.2fs\t%.2fs\t%.2fs\t%.2fs\t%.2fs\t%d kB\t%s%s\n' % (
+      report['wall'], stages['compile'], stages['lifted'], stages['gcc'], stages['run'], peak,
+      report['path'], report['cached'] and ' (cached)' or '')
+
+  print text.rstrip('\n').expandtabs(12)
+
+
+#######################################################################
+# Watch (--watch)
+#
+# After the first run supertest.py stays running, watching the test
+# directories and the files named by COMMAND (see commandFiles).
+#  * When a test, its .stdin or its .expected changes, that test is
+#    run again.  New tests are run, deleted ones are forgotten.
+#  * When the compiler changes, every test is run again, those that
+#    failed most recently first.
+# After each round the summary of the whole tree is shown again.
+# inotify is used through ctypes where there is one; otherwise the
+# files are polled every WATCH_INTERVAL seconds.  Tests are looked up
+# again with the same --impl, --level, --category and -k, but not
+# --only-failed, so that tests that are fixed stay watched.
+#######################################################################
+
+WATCH_INTERVAL = 1.0
+
+## Changes closer together than this are taken as one, as when an
+## editor saves through a temporary file or a build writes a jar
+WATCH_SETTLE = 0.3
+
+## inotify_add_watch mask: written, moved in or out, created, deleted
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+def isTestInput(path):
+  ## Whether path is a test or one of its companions, rather than a
+  ## file a test run writes next to them
+  name = os.path.basename(path)
+  if name.endswith('.stdin') or name.endswith('.expected'):
+    return True
+  return name.endswith('.ob') and '_pp' not in name and '_lifted' not in name
+
+
+class InotifyWatcher:
+  ## Directories watched with inotify.  changes(timeout) returns the
+  ## paths changed in them, or an empty set after timeout seconds.
+
+  def __init__(self, libc):
+    self.libc = libc
+    self.fd = libc.inotify_init()
+    if self.fd < 0:
+      raise OSError(ctypes.get_errno(), 'inotify_init failed')
+    self.directories = {}
+
+  def watch(self, directories, files):
+    for d in directories:
+      d = os.path.abspath(d)
+      if d not in self.directories.values():
+        wd = self.libc.inotify_add_watch(self.fd, d, IN_WATCH_MASK)
+        if wd >= 0:
+          self.directories[wd] = d
+
+  def changes(self, timeout):
+    changed = set()
+    while select.select([self.fd], [], [], timeout)[0]:
+      data = os.read(self.fd, 65536)
+      offset = 0
+      while offset < len(data):
+        wd, mask, cookie, length = struct.unpack('iIII', data[offset:offset + 16])
+        name = data[offset + 16:offset + 16 + length].rstrip('\0')
+        offset += 16 + length
+        if wd in self.directories:
+          changed.add(os.path.join(self.directories[wd], name))
+      timeout = WATCH_SETTLE
+    return changed
+
+  def close(self):
+    os.close(self.fd)
+
+
+class PollingWatcher:
+  ## The same as InotifyWatcher, by comparing the modification times of
+  ## the watched files every WATCH_INTERVAL seconds
+
+  def __init__(self):
+    self.directories = []
+    self.files = []
+    self.snapshot = {}
+
+  def watch(self, directories, files):
+    self.directories = [os.path.abspath(d) for d in directories]
+    self.files = [os.path.abspath(path) for path in files]
+    self.snapshot = self.scan()
+
+  def scan(self):
+    snapshot = {}
+    paths = list(self.files)
+    for d in self.directories:
+      try:
+        paths.extend([os.path.join(d, name) for name in os.listdir(d)])
+      except OSError:
+        pass
+    for path in paths:
+      try:
+        stat = os.stat(path)
+        snapshot[path] = (stat.st_mtime, stat.st_size)
+      except OSError:
+        pass
+    return snapshot
+
+  def changes(self, timeout):
+    waited = 0
+    while waited < timeout:
+      time.sleep(min(WATCH_INTERVAL, timeout - waited))
+      waited += WATCH_INTERVAL
+      snapshot = self.scan()
+      changed = set([path for path in set(snapshot) | set(self.snapshot)
+                     if snapshot.get(path) != self.snapshot.get(path)])
+      self.snapshot = snapshot
+      if changed:
+        return changed
+    return set()
+
+  def close(self):
+    pass
+
+
+def newWatcher():
+  ## An InotifyWatcher where inotify is there, else a PollingWatcher
+  library = ctypes.util.find_library('c')
+  if library:
+    try:
+      libc = ctypes.CDLL(library, use_errno=True)
+      if hasattr(libc, 'inotify_init'):
+        return InotifyWatcher(libc)
+    except OSError:
+      pass
+  return PollingWatcher()
+
+
+def watchTests(findJobs, path_to_test, latest, pool):
+  ## Run tests again as they or the compiler change, until interrupted.
+  ## latest holds the results of every test from the first run.
+  ## Returns the pool, which is replaced when the compiler changes.
+  global _command_digest
+  global RUN_COMMAND
+  watcher = newWatcher()
+  compiler_files = [os.path.abspath(path) for path in commandFiles()]
+
+  try:
+    while True:
+      layout_dirs, leaf_dirs = manifestDirectories(path_to_test)
+      watcher.watch(layout_dirs + leaf_dirs + [os.path.dirname(path) for path in compiler_files], compiler_files)
+
+      ## What matters: the compiler, tests in the test directories, and
+      ## new or removed test directories
+      leaves = set([os.path.abspath(d) for d in leaf_dirs])
+      layout = set([os.path.abspath(d) for d in layout_dirs])
+
+      printWatchSummary(latest)
+      print 'Watching for changes (' + watcher.__class__.__name__ + '), Ctrl-C to stop'
+      changed = set()
+      while not changed:
+        changed = set([path for path in watcher.changes(3600)
+                       if path in compiler_files or os.path.dirname(path) in layout
+                       or (os.path.dirname(path) in leaves and isTestInput(path))])
+
+      jobs = findJobs()
+      for job in latest.keys():
+        if job not in jobs:
+          del latest[job]
+
+      if set(compiler_files) & changed:
+        ## Workers and servers still have the old compiler
+        print '\nCompiler changed, running every test'
+        if CACHE:
+          _command_digest = commandDigest()
+        if CDS:
+          ## A new jar needs an archive of its own classes
+          RUN_COMMAND = archiveCommand(COMMAND, jobs)
+          trimCache(CDS_DIR, CDS_SIZE)
+        stopServers()
+        if pool:
+          pool.terminate()
+          pool = multiprocessing.Pool(JOBS, startWorker)
+        failed = [job for job in jobs if job in latest and countFailures(latest[job]) > 0]
+        rerun = failed + [job for job in jobs if job not in failed]
+      else:
+        changed_bases = set([os.path.splitext(path)[0] for path in changed])
+        rerun = [job for job in jobs
+                 if job not in latest or os.path.splitext(os.path.abspath(job[1]))[0] in changed_bases]
+        print '\n' + time.strftime('%H:%M:%S'), 'changed:', ' '.join(sorted([os.path.basename(path) for path in changed]))
+
+      start = time.time()
+      round_results = newResults()
+      for job, test_result in runJobs(rerun, pool):
+        reportResults(round_results, test_result)
+        latest[job] = test_result
+      print 'Ran', len(rerun), 'tests in %.1fs' % (time.time() - start)
+
+      writeStateFile(LAST_FAILED, '\n'.join([job[1] for job in jobs if job in latest and countFailures(latest[job]) > 0]))
+  except KeyboardInterrupt:
+    print
+  finally:
+    watcher.close()
+
+  return pool
+
+
+def printWatchSummary(latest):
+  ## One line of pass and fail counts over every test, and the tests
+  ## that fail
+  total = newResults()
+  failing = []
+  for job in sorted(latest.keys(), key=lambda job: job[1]):
+    mergeResults(total, latest[job])
+    if countFailures(latest[job]) > 0:
+      failing.append(job[1])
+
+  passed = sum([total[test_type][0] for test_type in total if test_type not in ['fail', 'log', 'timing', 'cached', 'reported', 'said']])
+  print '\n' + time.strftime('%H:%M:%S'), len(latest), 'tests:', passed, 'passed,', countFailures(total), 'failed'
+  for test in failing:
+    print '\tFAIL\t' + test
+
+
+def printResults(results):
+  text = ""
+  if len(results['fail']) > 0:
+    text += '\n'
+    text += 'Failures:' + '\n' 
+    for fail_group in results['fail']:
+      if len(results['fail'][fail_group]) > 0:
+        text += '\t' + fail_group + '\n' 
+        for f in results['fail'][fail_group]:
+          text += '\t\t' + f + '\n' 
+  text += '\n' 
+  text += 'Positive tests:\tLifted compare:' + '\tCompare Expected:' + '\n' 
+  text += 'Pass: ' + str(results['positive'][0]) + '\t\tPass: ' + str(results['lifted_cmp'][0]) + '\t\tPass: ' + str(results['expected_cmp'][0]) + '\n' 
+  text += 'Fail: ' + str(results['positive'][1]) + '\t\tFail: ' + str(results['lifted_cmp'][1]) + '\t\tFail: ' + str(results['expected_cmp'][1]) + '\n' 
+  text += '\n'
+  text += 'Name or type tests:\tCompile C:' + '\n' 
+  text += 'Pass: ' + str(results['name_type'][0]) + '\t\tPass: ' + str(results['compile_c'][0]) + '\n' 
+  text += 'Fail: ' + str(results['name_type'][1]) + '\t\tFail: ' + str(results['compile_c'][1]) + '\n' 
+  text += '\n'
+  text += 'Parse tests:\tRun C:' + '\n' 
+  text += 'Pass: ' + str(results['parse'][0]) + '\t\tPass: ' + str(results['run_c'][0])  + '\n' 
+  text += 'Fail: ' + str(results['parse'][1]) + '\t\tPass: ' + str(results['run_c'][1])  + '\n' 
+  text += '\n'
+  text += 'Summary:' + '\n' 
+  text += 'Pass: ' + str(results['positive'][0] + 
+                         results['name_type'][0] +
+                         results['parse'][0] +
+                         results['lifted_cmp'][0] +
+                         results['compile_c'][0] +
+                         results['run_c'][0] +
+                         results['expected_cmp'][0]) + '\n' 
+  text += 'Fail: ' + str(results['positive'][1] + 
+                         results['name_type'][1] +
+                         results['parse'][1] +
+                         results['lifted_cmp'][1] +
+                         results['compile_c'][1] +
+                         results['run_c'][1] +
+                         results['expected_cmp'][1]) + '\n' 
+
+  print text.expandtabs(12)
+
+def main():
+  global COMMAND
+  global RUN_COMMAND
+  global TESTS
+  global LEVEL
+  global CODEGEN
+  global REFERENCE_COMPILER
+  global NO_LIFTED
+  global JOBS
+  global SERVER
+  global CACHE
+  global CACHE_KEY_FILES
+  global CACHE_SIZE
+  global BATCH
+  global PIPELINE
+  global BENCH
+  global KEEP_STDOUT
+  global GCC_FLAGS
+  global GCC_CACHE
+  global GCC_JOBS
+  global SANDBOX
+  global SANDBOX_DIR
+  global KEEP_FAILED
+  global CDS
+  global JVM_FLAGS
+  global SPLIT_OUTPUT
+  global ARTIFACT
+  global PERF_THRESHOLD
+  global _command_digest
+
+  ## Combine the reports of shards rather than run tests?
+  if '--merge' in sys.argv:
+    sys.argv.remove('--merge')
+    json_report = takeOption('--json')
+    mergeShards(sys.argv[1:], json_report)
+    return
+
+  if len(sys.argv) > 1:
+    ## Is the level specified?
+    artifact_pattern = r'-?(A(?:[1345]|2[ab]))'
+    for i in sys.argv[1:]:
+      m = re.match(artifact_pattern, i)
+      if m and not LEVEL:
+        artifact = m.group(1)
+        ARTIFACT = artifact
+        sys.argv.remove(m.group(0))
+        if artifact == 'A1':
+          LEVEL = ['L1', 'L2']
+          TESTS = ['T1', 'T2']
+        elif artifact == 'A2a':
+          LEVEL = ['L1', 'L2', 'L3']
+          TESTS = ['T1', 'T2']
+        elif artifact == 'A2b':
+          LEVEL = ['L1', 'L2']
+          TESTS = ['T1', 'T2', 'T3']
+        elif artifact == 'A3':
+          LEVEL = ['L1', 'L2', 'L3']
+          TESTS = ['T1', 'T2', 'T3']
+        elif artifact == 'A4':
+          LEVEL = ['L1', 'L2', 'L3', 'L4']
+          TESTS = ['T1', 'T2', 'T3', 'T5a']
+        elif artifact == 'A5':
+          LEVEL = ['L1', 'L2', 'L3', 'L4', 'L5']
+          TESTS = ['T1', 'T2', 'T3', 'T5a']
+        else:
+          print "Error: Unrecognized artifact:", artifact
+          sys.exit(0)
+
+    if not LEVEL or not TESTS:
+      print 'LEVEL: ALL'
+      ARTIFACT = 'ALL'
+      LEVEL = ['L1', 'L2', 'L3', 'L4']
+      TESTS = ['T1', 'T2', 'T3', 'T5a']
+
+    ## Is codegen specified?
+    if '-codegen' in sys.argv:
+      CODEGEN = True
+      sys.argv.remove('-codegen')
+
+    if '-ref' in sys.argv:
+      REFERENCE_COMPILER = True
+      sys.argv.remove('-ref')
+
+    if '-nolifted' in sys.argv:
+      NO_LIFTED = True
+      print sys.argv
+      print "Set Lifted"
+      sys.argv.remove('-nolifted')
+      print sys.argv
+
+    ## Does COMMAND write its output files on stdout, to be split?
+    if '--split-output' in sys.argv:
+      SPLIT_OUTPUT = True
+      sys.argv.remove('--split-output')
+
+    ## Does COMMAND start a compiler server rather than compile one file?
+    if '--server' in sys.argv:
+      SERVER = True
+      sys.argv.remove('--server')
+      atexit.register(stopServers)
+
+    ## Run tests in parallel? -jN runs N at once, -j one per CPU
+    for i in sys.argv[1:]:
+      m = re.match(r'-j(\d*)$', i)
+      if m:
+        JOBS = int(m.group(1) or multiprocessing.cpu_count())
+        sys.argv.remove(i)
+        break
+
+    ## Replay the results of unchanged tests?
+    if '--no-cache' in sys.argv:
+      CACHE = False
+      sys.argv.remove('--no-cache')
+
+    ## Size limit of the result cache in megabytes
+    cache_size = takeOption('--cache-size')
+    if cache_size:
+      CACHE_SIZE = int(cache_size) * 1024 * 1024
+
+    ## Files the compiler depends on that COMMAND does not name
+    key_file = takeOption('--cache-key-file')
+    while key_file:
+      if not os.path.isfile(key_file):
+        print "Error: --cache-key-file", key_file, "is not a file"
+        sys.exit(0)
+      CACHE_KEY_FILES.append(os.path.abspath(key_file))
+      key_file = takeOption('--cache-key-file')
+
+    ## Write each program's output to its .stdout file?  Only tests that
+    ## are run have output, so this turns off the cache
+    if '--keep-stdout' in sys.argv:
+      KEEP_STDOUT = True
+      CACHE = False
+      sys.argv.remove('--keep-stdout')
+
+    ## How gcc is run on generated C, and whether its executables are
+    ## reused
+    gcc_flags = takeOption('--gcc-flags')
+    if gcc_flags:
+      GCC_FLAGS = gcc_flags
+    if '--no-gcc-cache' in sys.argv:
+      GCC_CACHE = False
+      sys.argv.remove('--no-gcc-cache')
+    GCC_JOBS = max(1, int(takeOption('--gcc-jobs') or 1))
+
+    ## How long may the children of each stage run for?  Either one
+    ## number of seconds for every stage, or STAGE=SECONDS for some, 0
+    ## for no limit
+    timeouts = takeOption('--timeout')
+    if timeouts:
+      for timeout in timeouts.split(','):
+        if '=' in timeout:
+          stage, seconds = timeout.split('=', 1)
+        else:
+          stage, seconds = None, timeout
+        if stage is not None and stage not in TIMEOUTS:
+          print "Error: Unrecognized --timeout stage:", stage
+          sys.exit(0)
+        for key in TIMEOUTS:
+          if stage in [None, key]:
+            TIMEOUTS[key] = float(seconds) or None
+
+    ## Start java from a class data sharing archive, and with which
+    ## flags?
+    if '--no-cds' in sys.argv:
+      CDS = False
+      sys.argv.remove('--no-cds')
+    jvm_flags = takeOption('--jvm-flags')
+    if jvm_flags is not None:
+      JVM_FLAGS = jvm_flags
+
+    ## Run tests in sandboxes, and where?  Keep those of failed tests?
+    if '--no-sandbox' in sys.argv:
+      SANDBOX = False
+      sys.argv.remove('--no-sandbox')
+    SANDBOX_DIR = takeOption('--sandbox-dir') or (os.path.isdir('/dev/shm') and '/dev/shm') or tempfile.gettempdir()
+    if '--keep-failed' in sys.argv:
+      KEEP_FAILED = True
+      sys.argv.remove('--keep-failed')
+
+    ## Compile up to N tests with one run of the compiler?
+    batch = takeOption('--batch')
+    if batch:
+      BATCH = max(1, int(batch))
+
+    ## Run the stages of tests as a pipeline?  Either one count of
+    ## workers for every stage, or one for each of the stages
+    pipeline = takeOption('--pipeline')
+    if pipeline:
+      PIPELINE = [max(1, int(count)) for count in pipeline.split(',')]
+      if len(PIPELINE) == 1:
+        PIPELINE = PIPELINE * len(STAGES)
+      elif len(PIPELINE) != len(STAGES):
+        print "Error: --pipeline needs 1 or", len(STAGES), "worker counts"
+        sys.exit(0)
+      if JOBS > 1 or BATCH > 1:
+        print "Error: --pipeline sets the workers of each stage itself, and runs tests one by one; leave out -j and --batch"
+        sys.exit(0)
+
+    ## Benchmark the compiler instead of testing it?
+    BENCH = int(takeOption('--bench') or 0)
+    bench_json = takeOption('--bench-json')
+
+    ## Measure how the compiler scales with the size of programs?
+    scale = takeOption('--scale')
+    scale_json = takeOption('--scale-json')
+
+    ## Test the compiler with generated programs?  Their results are not
+    ## worth keeping
+    fuzz = int(takeOption('--fuzz') or 0)
+    fuzz_seed = int(takeOption('--fuzz-seed') or time.time())
+    fuzz_dir = takeOption('--fuzz-dir') or FUZZ_DIR
+    fuzz_json = takeOption('--fuzz-json')
+    if fuzz:
+      CACHE = False
+
+    ## Time the programs the compiler generates?
+    runtime_sizes = takeOption('--runtime-bench')
+    runtime_opt = (takeOption('--runtime-opt') or '-O0,-O2').split(',')
+    runtime_json = takeOption('--runtime-json')
+
+    ## Compare several compilers on the same tests?
+    diff_specs = []
+    spec = takeOption('--diff')
+    while spec:
+      diff_specs.append(spec)
+      spec = takeOption('--diff')
+    diff_json = takeOption('--diff-json')
+
+    ## Check the tests themselves, without a compiler?
+    oracle = '--oracle' in sys.argv
+    if oracle:
+      sys.argv.remove('--oracle')
+
+    ## Save or check a performance baseline?  Every run is timed, so
+    ## this turns off the cache
+    perf_mode = takeOption('--perf-baseline')
+    if perf_mode not in [None, 'save', 'check']:
+      print "Error: --perf-baseline needs save or check"
+      sys.exit(0)
+    if perf_mode:
+      CACHE = False
+    perf_runs = max(1, int(takeOption('--perf-runs') or PERF_RUNS))
+    perf_threshold = takeOption('--perf-threshold')
+    if perf_threshold:
+      PERF_THRESHOLD = float(perf_threshold) / 100
+    perf_file = takeOption('--perf-file') or PERF_FILE
+
+    ## Reports of the run
+    json_report = takeOption('--json')
+    junit_report = takeOption('--junit')
+    slowest = int(takeOption('--slowest') or 0)
+
+    ## Which tests from the manifest?
+    impls = (takeOption('--impl') or '').split(',')
+    levels = (takeOption('--level') or '').split(',')
+    categories = (takeOption('--category') or '').split(',')
+    pattern = takeOption('-k')
+    only_failed = '--only-failed' in sys.argv
+    if only_failed:
+      sys.argv.remove('--only-failed')
+
+    ## Run only part I of N of the tests?
+    shard = takeOption('--shard')
+    if shard:
+      shard = [int(number) for number in shard.split('/')]
+      if len(shard) != 2 or not 1 <= shard[0] <= shard[1]:
+        print "Error: --shard needs I/N, with I from 1 to N"
+        sys.exit(0)
+    shard_costs = takeOption('--shard-costs')
+
+    ## Order tests by their history, and stop at the first new failure?
+    history_on = '--no-history' not in sys.argv
+    if not history_on:
+      sys.argv.remove('--no-history')
+    fail_fast = '--fail-fast' in sys.argv
+    if fail_fast:
+      sys.argv.remove('--fail-fast')
+
+    ## Stay running, testing again whatever changes?
+    watch = '--watch' in sys.argv
+    if watch:
+      sys.argv.remove('--watch')
+
+    ## What's left is the running command
+    COMMAND = " ".join(sys.argv[1:])
+    RUN_COMMAND = COMMAND
+  else:
+    print "Please supply commands to run compiler"
+    sys.exit(0)
+
+  PATH_TO_TEST = '../tests/'
+  results = newResults()
+
+  if SANDBOX:
+    clearSandboxes()
+    if KEEP_FAILED and os.path.isdir(FAILED_DIR):
+      shutil.rmtree(FAILED_DIR)
+
+  if scale:
+    knob, sizes = scale.split('=', 1)
+    if knob not in ['decls', 'depth', 'procs', 'statements', 'type_depth']:
+      print "Error: Unrecognized --scale knob:", knob
+      sys.exit(0)
+    scale_level = [l for l in levels if l] or LEVEL
+    scaling = runScaling(scale_level[-1], knob, [int(size) for size in sizes.split(',')], BENCH or 1)
+    if not scale_json:
+      scale_json = os.path.join(STATE_DIR, 'scale-' + scaling['date'].replace(':', '') + '.json')
+    writeStateFile(scale_json, json.dumps(scaling, indent=1, sort_keys=True))
+    printScaling(scaling)
+    print 'Scaling written to', scale_json
+    return
+
+  if fuzz:
+    ## COMMAND alone, or with the compilers of --diff
+    if diff_specs and COMMAND:
+      diff_specs.insert(0, COMMAND + (REFERENCE_COMPILER and ' -ref' or ''))
+    if diff_specs:
+      SERVER = False
+    fuzz_result = runFuzz(fuzz, fuzz_seed, [l for l in LEVEL if l in levels] or LEVEL, fuzz_dir, diffCompilers(diff_specs))
+    if not fuzz_json:
+      fuzz_json = os.path.join(STATE_DIR, 'fuzz-' + fuzz_result['date'].replace(':', '') + '.json')
+    writeStateFile(fuzz_json, json.dumps(fuzz_result, indent=1, sort_keys=True))
+    printFuzz(fuzz_result, fuzz_dir)
+    print 'Fuzzing written to', fuzz_json
+    return
+
+
+  #####################################################################
+  # Find all Oberon0 files within PATH_TO_TEST
+  #
+  # Files are located in tests/positive/L*/*.ob and tests/negative/L*/*_errors/*.ob
+  #
+  # Within the path, the following items are found:
+  #  * Location of the test
+  #  * Whether the test is positive or negative
+  #  * The level of the test (L1, L2, etc)
+  #
+  # These are kept in the manifest, see loadManifest
+  #####################################################################
+  records = filterManifest(loadManifest(PATH_TO_TEST), [i for i in impls if i], [l for l in levels if l],
+                           [c for c in categories if c], pattern, only_failed)
+  all_tests = [record['path'] for record in records]
+
+  #####################################################################
+  # Run each test
+  #
+  # Every batch of tests is run on its own by runBatch, so batches may
+  # be handed to a pool of worker processes.  imap hands results back in test order,
+  # so the output and results are the same however many JOBS there are.
+  #####################################################################
+  print LEVEL
+  print TESTS
+  jobs = selectTests(all_tests)
+
+  if shard:
+    costs = {}
+    if shard_costs:
+      costs = loadShardCosts(shard_costs)
+    jobs = shardJobs(jobs, shard[0], shard[1], costs)
+    print 'Shard', '%d/%d:' % tuple(shard), len(jobs), 'tests'
+    if not json_report:
+      json_report = os.path.join(STATE_DIR, 'shard-%d-of-%d.json' % tuple(shard))
+
+  if oracle:
+    start = time.time()
+    disagreements = runOracle(jobs)
+    printOracle(disagreements, len(jobs), time.time() - start)
+    if disagreements:
+      sys.exit(1)
+    return
+
+  ## Start the JVM of a java COMMAND from an archive of its classes
+  if CDS:
+    RUN_COMMAND = archiveCommand(COMMAND, jobs)
+    trimCache(CDS_DIR, CDS_SIZE)
+
+  if runtime_sizes:
+    ## COMMAND, and the compilers of --diff
+    if COMMAND:
+      diff_specs.insert(0, COMMAND + (REFERENCE_COMPILER and ' -ref' or ''))
+    bench = runRuntimeBenchmark(shareClasses(diffCompilers(diff_specs), jobs), jobs, [int(size) for size in runtime_sizes.split(',')], runtime_opt,
+                                BENCH or RUNTIME_RUNS)
+    if not runtime_json:
+      runtime_json = os.path.join(STATE_DIR, 'runtime-' + bench['date'].replace(':', '') + '.json')
+    writeStateFile(runtime_json, json.dumps(bench, indent=1, sort_keys=True))
+    if GCC_CACHE:
+      trimCache(GCC_CACHE_DIR, GCC_CACHE_SIZE)
+    printRuntimeBenchmark(bench)
+    print 'Runtime benchmark written to', runtime_json
+    return
+
+  if BENCH:
+    bench = runBenchmark(jobs, records, BENCH)
+    if not bench_json:
+      bench_json = os.path.join(STATE_DIR, 'bench-' + bench['date'].replace(':', '') + '.json')
+    writeStateFile(bench_json, json.dumps(bench, indent=1, sort_keys=True))
+    printBenchmark(bench)
+    print 'Benchmark written to', bench_json
+    return
+
+  if diff_specs:
+    if COMMAND:
+      diff_specs.insert(0, COMMAND + (REFERENCE_COMPILER and ' -ref' or ''))
+    ## Servers are kept by process, and the processes of --diff run
+    ## every compiler
+    SERVER = False
+    matrix = runDiff(shareClasses(diffCompilers(diff_specs), jobs), jobs, PATH_TO_TEST)
+    if not diff_json:
+      diff_json = os.path.join(STATE_DIR, 'diff-' + matrix['date'].replace(':', '') + '.json')
+    writeStateFile(diff_json, json.dumps(matrix, indent=1, sort_keys=True))
+    if GCC_CACHE:
+      trimCache(GCC_CACHE_DIR, GCC_CACHE_SIZE)
+    if CACHE:
+      trimCache(CACHE_DIR, CACHE_SIZE)
+    printDiff(matrix)
+    print 'Differential matrix written to', diff_json
+    return
+
+  if CACHE:
+    _command_digest = commandDigest()
+
+  ## A server is already warm, there is nothing to gain from batches
+  if SERVER:
+    BATCH = 1
+
+  pool = None
+  if JOBS > 1 and not PIPELINE:
+    pool = multiprocessing.Pool(JOBS, startWorker)
+
+  history = {}
+  if history_on:
+    connection = openHistory()
+    history = loadHistory(connection)
+    jobs = scheduleJobs(jobs, history)
+
+  ## Tests with any failure, for --only-failed
+  last_failed = []
+  reports = []
+  latest = {}
+  perf_samples = {}
+  run = runJobs(jobs, pool)
+  for job, test_result in run:
+    if perf_mode:
+      perf_samples[job[1]] = [perfSample(test_result)]
+    reportResults(results, test_result)
+    reports.append(testReport(job, test_result, PATH_TO_TEST))
+    latest[job] = test_result
+    if countFailures(test_result) > 0:
+      last_failed.append(job[1])
+    if history_on:
+      recordHistory(connection, history, job, test_result)
+
+    if fail_fast and isNewFailure(history, job, test_result):
+      print 'Stopping at the first new failure:', job[1]
+      run.close()
+      if pool:
+        pool.terminate()
+        pool = None
+      break
+
+  ## The other runs of --perf-baseline are only timed
+  if perf_mode:
+    for i in range(perf_runs - 1):
+      for job, test_result in runJobs(jobs, pool):
+        perf_samples.setdefault(job[1], []).append(perfSample(test_result))
+
+  writeStateFile(LAST_FAILED, '\n'.join(last_failed))
+  if history_on:
+    connection.commit()
+    connection.close()
+
+  if GCC_CACHE:
+    trimCache(GCC_CACHE_DIR, GCC_CACHE_SIZE)
+  if CACHE:
+    trimCache(CACHE_DIR, CACHE_SIZE)
+    if results['cached'][0] > 0:
+      print 'Replayed', results['cached'][0], 'cached test results; use --no-cache to run them again'
+  if SANDBOX:
+    ## Those of workers stopped by --fail-fast
+    clearSandboxes()
+    if KEEP_FAILED and countFailures(results):
+      print 'Sandboxes of failed tests kept in', FAILED_DIR
+
+  if json_report:
+    writeJsonReport(json_report, reports, results, shard)
+    if shard:
+      print 'Shard results written to', json_report
+  if junit_report:
+    writeJUnitReport(junit_report, reports)
+  if slowest:
+    printSlowest(reports, slowest)
+
+  printResults(results)
+
+  if perf_mode:
+    baselines = loadPerfBaselines(perf_file)
+    summary = perfSummary(perf_samples)
+    if perf_mode == 'save':
+      baselines.setdefault(COMMAND, {})[ARTIFACT] = summary
+      writeStateFile(perf_file, json.dumps(baselines, indent=1, sort_keys=True))
+      printPerf(perf_mode, summary, None, [])
+      print 'Performance baseline of', ARTIFACT, 'written to', perf_file
+    else:
+      regressions = []
+      baseline = baselines.get(COMMAND, {}).get(ARTIFACT)
+      if baseline:
+        regressions = checkPerf(baseline, summary)
+      printPerf(perf_mode, summary, baseline, regressions)
+      if regressions:
+        sys.exit(1)
+
+  if watch:
+    def findJobs():
+      records = filterManifest(loadManifest(PATH_TO_TEST), [i for i in impls if i], [l for l in levels if l],
+                               [c for c in categories if c], pattern, False)
+      return selectTests([record['path'] for record in records])
+    pool = watchTests(findJobs, PATH_TO_TEST, latest, pool)
+
+  if pool:
+    pool.close()
+    pool.join()
 
 
 if __name__ == "__main__":